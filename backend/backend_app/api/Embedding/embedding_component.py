@@ -3,6 +3,7 @@ from llama_index.core.embeddings import BaseEmbedding
 from injector import singleton
 from backend_app.api.settings.settings import settings
 from backend_app.api.tools.common import get_local_embedding_model_path
+from backend_app.api.Embedding.query_embedding_cache import CachedQueryEmbedding
 @singleton
 class EmbeddingComponent:
     embedding_model: BaseEmbedding
@@ -30,4 +31,9 @@ class EmbeddingComponent:
                     cache_folder=str(models_cache_path),
                     trust_remote_code=True,
                 )
-                '''
\ No newline at end of file
+                '''
+
+        # 查询嵌入缓存层：同一问题在一次请求内只做一次前向计算，并跨请求保留有界LRU
+        query_cache_size = settings().embedding.query_cache_size
+        if query_cache_size > 0:
+            self.embedding_model = CachedQueryEmbedding(self.embedding_model, query_cache_size)
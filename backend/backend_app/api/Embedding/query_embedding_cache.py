@@ -0,0 +1,178 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+_TRAILING_PUNCTUATION = "?？!！。.,，;；~～ "
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：全半角统一、小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+class _QueryEmbeddingLRU:
+    """有界LRU；同一查询的并发请求只计算一次，其余请求等待同一结果"""
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries: OrderedDict[str, Embedding] = OrderedDict()
+        self._inflight: dict[str, Future[Embedding]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, key: str) -> Embedding | None:
+        """只查不算：已缓存或正在计算时返回结果，否则返回None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._inflight.get(key)
+            if future is None:
+                return None
+            self.hits += 1
+        return future.result()
+
+    def put(self, key: str, embedding: Embedding) -> None:
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(
+        self, key: str, compute: Callable[[], Embedding]
+    ) -> Embedding:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            embedding = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            self._entries[key] = embedding
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        future.set_result(embedding)
+        return embedding
+
+
+def _encode_queries(model: BaseEmbedding, queries: list[str]) -> list[Embedding]:
+    # BaseEmbedding只有逐条的查询嵌入接口；HuggingFaceEmbedding的_embed支持批量并套用query提示词
+    embed = getattr(model, "_embed", None)
+    if embed is not None:
+        return embed(queries, prompt_name="query")
+    return [model.get_query_embedding(query) for query in queries]
+
+
+def batch_query_embeddings(model: BaseEmbedding, queries: list[str]) -> list[Embedding]:
+    """多条查询一次前向计算，结果与逐条 get_query_embedding 一致"""
+    if isinstance(model, CachedQueryEmbedding):
+        return model.get_query_embedding_batch(queries)
+    return _encode_queries(model, queries)
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """
+    查询嵌入缓存层（包装实际的嵌入模型）：
+    1. 单条查询嵌入以归一化后的查询文本为缓存键，实际嵌入的是首次出现的原始查询文本，
+       仅大小写/标点/空白不同的问题复用同一向量，不改变检索所用的嵌入内容
+    2. 同一请求内并行分支（向量检索、语义缓存查找）同时嵌入同一问题时只做一次前向计算，跨请求保留有界LRU
+    3. 文本嵌入直接交给实际模型，不读写缓存（查询与文本的嵌入指令可能不同，摄入时也不应挤掉热门查询）
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _lru: _QueryEmbeddingLRU = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, max_size: int) -> None:
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            num_workers=inner.num_workers,
+        )
+        self._inner = inner
+        self._lru = _QueryEmbeddingLRU(max_size)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def cache_hits(self) -> int:
+        return self._lru.hits
+
+    @property
+    def cache_misses(self) -> int:
+        return self._lru.misses
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._lru.get_or_compute(
+            normalize_query(query),
+            lambda: self._inner._get_query_embedding(query),
+        )
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def get_query_embedding_batch(self, queries: list[str]) -> list[Embedding]:
+        """批量查询嵌入：已缓存的直接复用，其余按键去重后嵌入各键首次出现的原始查询，一次前向计算并写入缓存"""
+        keys = [normalize_query(query) for query in queries]
+        first_seen: dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            first_seen.setdefault(key, query)
+        resolved: dict[str, Embedding] = {}
+        for key in first_seen:
+            cached = self._lru.peek(key)
+            if cached is not None:
+                resolved[key] = cached
+        missing = [key for key in first_seen if key not in resolved]
+        if missing:
+            self._lru.misses += len(missing)
+            embeddings = _encode_queries(self._inner, [first_seen[key] for key in missing])
+            for key, embedding in zip(missing, embeddings):
+                self._lru.put(key, embedding)
+                resolved[key] = embedding
+        return [resolved[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._inner._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._inner._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return self._inner._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return await self._inner._aget_text_embeddings(texts)
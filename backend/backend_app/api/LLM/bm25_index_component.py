@@ -0,0 +1,595 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from injector import singleton
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore
+
+from backend_app.api.settings.settings import settings
+from backend_app.constants import get_local_data_path
+
+logger = logging.getLogger(__name__)
+
+BM25_DIRNAME = "bm25"
+DOCS_LOG_FNAME = "docs.log"
+SEGMENT_PREFIX = "seg_"
+
+# 中日韩统一表意文字（含扩展A、兼容区）按字切分成二元组；字母数字串整体作为一个词
+_CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK_RANGES}]+|[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_CJK_RE = re.compile(rf"[{_CJK_RANGES}]")
+_SEPARATOR_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    中文友好的分词（无第三方依赖）：
+    - 连续汉字切成重叠二元组（单字成词时保留单字），不依赖词典也能命中专有名词
+    - 字母数字串整体保留（如型号 ab-1234），同时拆出各段便于部分匹配
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: list[str] = []
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+        tokens.append(run)
+        if _SEPARATOR_RE.search(run):
+            tokens.extend(part for part in _SEPARATOR_RE.split(run) if part)
+    return tokens
+
+
+def _term_hash(term: str) -> np.uint64:
+    """词典只存64位哈希（有序数组+二分查找），百万级块的词表也只占几十MB"""
+    return np.uint64(int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little"))
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[NodeWithScore]], k: int = 60, top_k: int | None = None
+) -> list[NodeWithScore]:
+    """倒数排名融合：score = Σ 1/(k + rank)，同分时按列表顺序（先稠密后词法）"""
+    fused: dict[str, float] = {}
+    nodes: dict[str, NodeWithScore] = {}
+    for results in result_lists:
+        for rank, node in enumerate(results, start=1):
+            node_id = node.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            nodes.setdefault(node_id, node)
+    ranked = sorted(fused, key=lambda node_id: -fused[node_id])[:top_k]
+    return [NodeWithScore(node=nodes[node_id].node, score=fused[node_id]) for node_id in ranked]
+
+
+@dataclass
+class _Segment:
+    """
+    不可变的倒排段（CSR布局，内存映射只读）：
+    terms 有序的词哈希；offsets[i]:offsets[i+1] 为第i个词的倒排表在 docs/tfs 中的区间；
+    [doc_start, doc_end) 为段覆盖的文档号区间，加载时据此与文档表对齐
+    """
+    path: Path
+    seq: int
+    replaces: list[int]
+    doc_start: int
+    doc_end: int
+    terms: np.ndarray
+    offsets: np.ndarray
+    docs: np.ndarray
+    tfs: np.ndarray
+
+    @property
+    def num_postings(self) -> int:
+        return len(self.docs)
+
+    def postings(self, term_hash: np.uint64) -> tuple[np.ndarray, np.ndarray] | None:
+        i = int(np.searchsorted(self.terms, term_hash))
+        if i >= len(self.terms) or self.terms[i] != term_hash:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def expand(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """还原为逐条倒排记录 (词哈希, 文档号, 词频)，合并段时使用"""
+        return np.repeat(self.terms, np.diff(self.offsets)), np.asarray(self.docs), np.asarray(self.tfs)
+
+    def clip(self, path: Path, seq: int, doc_end: int) -> "_Segment":
+        """去掉文档号超出 doc_end 的倒排记录，写成替换本段的新段"""
+        term_hashes, docs, tfs = self.expand()
+        keep = docs < doc_end
+        return _Segment.write(
+            path, seq, [self.seq], term_hashes[keep], docs[keep], tfs[keep], (self.doc_start, doc_end)
+        )
+
+    @classmethod
+    def write(
+        cls,
+        path: Path,
+        seq: int,
+        replaces: list[int],
+        term_hashes: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        doc_range: tuple[int, int],
+    ) -> "_Segment":
+        order = np.lexsort((docs, term_hashes))
+        term_hashes, docs, tfs = term_hashes[order], docs[order], tfs[order]
+        terms, starts = np.unique(term_hashes, return_index=True)
+        offsets = np.append(starts, len(docs)).astype(np.int64)
+
+        # 先写临时目录再整体改名，进程中途退出不会留下半个段
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        np.save(tmp_path / "terms.npy", terms.astype(np.uint64))
+        np.save(tmp_path / "offsets.npy", offsets)
+        np.save(tmp_path / "docs.npy", docs.astype(np.int32))
+        np.save(tmp_path / "tfs.npy", tfs.astype(np.uint16))
+        (tmp_path / "meta.json").write_text(
+            json.dumps({"seq": seq, "replaces": replaces, "doc_range": list(doc_range)})
+        )
+        tmp_path.replace(path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "_Segment":
+        meta = json.loads((path / "meta.json").read_text())
+        docs = np.load(path / "docs.npy", mmap_mode="r")
+        # 未记录文档号区间的旧段按实际倒排记录推算
+        doc_start, doc_end = meta.get("doc_range") or (
+            (int(docs.min()), int(docs.max()) + 1) if len(docs) else (0, 0)
+        )
+        return cls(
+            path=path,
+            seq=meta["seq"],
+            replaces=meta["replaces"],
+            doc_start=doc_start,
+            doc_end=doc_end,
+            terms=np.load(path / "terms.npy", mmap_mode="r"),
+            offsets=np.load(path / "offsets.npy", mmap_mode="r"),
+            docs=docs,
+            tfs=np.load(path / "tfs.npy", mmap_mode="r"),
+        )
+
+
+@singleton
+class BM25IndexComponent:
+    """
+    本地BM25词法索引（与Qdrant稠密检索互补，按倒数排名融合）：
+    1. 摄入时按批增量写入：每批节点生成一个不可变倒排段，段数超过上限时合并小段
+    2. 倒排段以内存映射方式读取，查询只触及命中词的倒排区间；文档表（节点id/长度）常驻内存
+    3. 删除文档只打删除标记（追加到 docs.log），合并段时物理清除；
+       全量合并时存活文档重新连续编号、文档表改写为只含存活文档，已删除文档不再占用内存和磁盘
+    4. 高频词（如常见二元组）不展开完整倒排表，只给低频词召回的候选文档加分，控制大语料下的查询耗时
+    """
+
+    def __init__(self) -> None:
+        self._settings = settings().rag.lexical
+        self._dir = Path(get_local_data_path()) / BM25_DIRNAME
+        self._lock = threading.RLock()
+        # 写入（建段+追加文档表）串行执行，查询只在交换数据时短暂持有 _lock
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._reset_state()
+        if self.enabled:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self._settings.enabled
+
+    def _reset_state(self) -> None:
+        self._segments: list[_Segment] = []
+        self._next_seq = 0
+        self._node_ids: list[str] = []
+        self._doc_by_node: dict[str, int] = {}
+        self._ref_docs: dict[str, list[int]] = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._alive_count = 0
+        self._alive_length = 0.0
+
+    # ====================== 写入 ======================
+    def add_nodes(self, nodes: list[BaseNode]) -> None:
+        """摄入时调用：与写入向量库的是同一批节点，嵌入文本（不含窗口元数据）即索引文本"""
+        if not self.enabled or not nodes:
+            return
+        with self._write_lock:
+            with self._lock:
+                fresh = [node for node in nodes if node.node_id not in self._doc_by_node]
+                first_doc = len(self._node_ids)
+                seq = self._next_seq
+                self._next_seq += 1
+            if not fresh:
+                return
+
+            term_hashes: list[np.uint64] = []
+            docs: list[int] = []
+            tfs: list[int] = []
+            lengths: list[int] = []
+            for offset, node in enumerate(fresh):
+                tokens = tokenize(node.get_content(metadata_mode=MetadataMode.EMBED))
+                lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    term_hashes.append(_term_hash(term))
+                    docs.append(first_doc + offset)
+                    tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+            self._dir.mkdir(parents=True, exist_ok=True)
+            # 先落段再追加文档表：中途退出时，加载时按段记录的文档号区间丢弃或截断超出文档表的段
+            segment = _Segment.write(
+                self._segment_path(seq),
+                seq,
+                [],
+                np.array(term_hashes, dtype=np.uint64),
+                np.array(docs, dtype=np.int32),
+                np.array(tfs, dtype=np.uint16),
+                (first_doc, first_doc + len(fresh)),
+            )
+            self._append_log(
+                [{"add": [node.node_id, node.ref_doc_id, length]} for node, length in zip(fresh, lengths)]
+            )
+            with self._lock:
+                for node, length in zip(fresh, lengths):
+                    self._add_doc(node.node_id, node.ref_doc_id, length)
+                self._segments.append(segment)
+        self._maybe_merge()
+
+    def remove_ref_doc(self, ref_doc_id: str) -> None:
+        if not self.enabled:
+            return
+        with self._write_lock:
+            with self._lock:
+                if ref_doc_id not in self._ref_docs:
+                    return
+                self._delete_ref_doc(ref_doc_id)
+            self._append_log([{"delete": ref_doc_id}])
+
+    def clear(self) -> None:
+        if not self.enabled:
+            return
+        # 加锁顺序与全量合并一致：_merge_lock -> _write_lock -> _lock
+        with self._merge_lock, self._write_lock, self._lock:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._reset_state()
+        logger.info("✅ BM25词法索引已清空")
+
+    def _add_doc(self, node_id: str, ref_doc_id: str | None, length: int) -> None:
+        doc = len(self._node_ids)
+        if doc >= len(self._lengths):
+            self._lengths = np.resize(self._lengths, len(self._lengths) * 2)
+            alive = np.zeros(len(self._lengths), dtype=bool)
+            alive[:doc] = self._alive[:doc]
+            self._alive = alive
+        self._node_ids.append(node_id)
+        self._doc_by_node[node_id] = doc
+        self._lengths[doc] = length
+        self._alive[doc] = True
+        self._alive_count += 1
+        self._alive_length += length
+        if ref_doc_id is not None:
+            self._ref_docs.setdefault(ref_doc_id, []).append(doc)
+
+    def _delete_ref_doc(self, ref_doc_id: str) -> None:
+        for doc in self._ref_docs.pop(ref_doc_id, []):
+            if self._alive[doc]:
+                self._alive[doc] = False
+                self._alive_count -= 1
+                self._alive_length -= float(self._lengths[doc])
+                self._doc_by_node.pop(self._node_ids[doc], None)
+
+    def _append_log(self, records: list[dict]) -> None:
+        with open(self._dir / DOCS_LOG_FNAME, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+
+    def _segment_path(self, seq: int) -> Path:
+        return self._dir / f"{SEGMENT_PREFIX}{seq:08d}"
+
+    def _pending_log_path(self, seq: int) -> Path:
+        """全量合并改写的文档表，序号与合并后的段相同；段写完后改名为 docs.log"""
+        return self._dir / f"{DOCS_LOG_FNAME}.{seq:08d}"
+
+    # ====================== 段合并 ======================
+    def _maybe_merge(self) -> None:
+        """分层合并：除最大段外的小段先合并；小段总量追上最大段时全部合并"""
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                segments = list(self._segments)
+                if len(segments) <= self._settings.max_segments:
+                    return
+                largest = max(segments, key=lambda segment: segment.num_postings)
+                others = [segment for segment in segments if segment is not largest]
+                if sum(segment.num_postings for segment in others) >= largest.num_postings:
+                    others = segments
+                # 全量合并且有已删除文档时，重排文档号并改写文档表
+                compact = others is segments and self._alive_count < len(self._node_ids)
+                if not compact:
+                    alive = self._alive[: len(self._node_ids)].copy()
+                    seq = self._next_seq
+                    self._next_seq += 1
+            if compact:
+                self._compact()
+                return
+
+            parts = [segment.expand() for segment in others]
+            term_hashes = np.concatenate([part[0] for part in parts])
+            docs = np.concatenate([part[1] for part in parts])
+            tfs = np.concatenate([part[2] for part in parts])
+            keep = alive[docs] if len(docs) else np.zeros(0, dtype=bool)
+            merged = _Segment.write(
+                self._segment_path(seq),
+                seq,
+                [segment.seq for segment in others],
+                term_hashes[keep],
+                docs[keep],
+                tfs[keep],
+                (min(segment.doc_start for segment in others), max(segment.doc_end for segment in others)),
+            )
+            with self._lock:
+                merged_ids = {id(segment) for segment in others}
+                self._segments = [s for s in self._segments if id(s) not in merged_ids] + [merged]
+            for segment in others:
+                shutil.rmtree(segment.path, ignore_errors=True)
+            logger.info(
+                f"BM25合并 {len(others)} 个段：{len(docs)} -> {merged.num_postings} 条倒排记录，"
+                f"当前 {len(self._segments)} 个段"
+            )
+        finally:
+            self._merge_lock.release()
+
+    def _compact(self) -> None:
+        """
+        全量合并并重排文档号：存活文档按原顺序编号为 0..n-1，文档表改写为这些文档的add记录。
+        期间持有 _write_lock（文档号与文档表不能并发追加），查询照常使用旧段，完成后一并切换。
+        崩溃安全：先写新文档表 docs.log.<seq>，再写合并段 seq（替换全部旧段），最后改名为 docs.log；
+        加载时合并段已存在则完成改名，否则丢弃新文档表，旧段与旧文档表仍然一致
+        """
+        with self._write_lock:
+            with self._lock:
+                segments = list(self._segments)
+                num_docs = len(self._node_ids)
+                alive = self._alive[:num_docs].copy()
+                lengths = self._lengths[:num_docs].copy()
+                node_ids = list(self._node_ids)
+                ref_by_doc = {doc: ref for ref, docs in self._ref_docs.items() for doc in docs}
+                seq = self._next_seq
+                self._next_seq += 1
+
+            live_docs = np.flatnonzero(alive)
+            renumber = (np.cumsum(alive) - 1).astype(np.int32)
+            live_refs = [ref_by_doc.get(int(doc)) for doc in live_docs]
+            live_ids = [node_ids[doc] for doc in live_docs]
+            live_lengths = lengths[live_docs]
+
+            pending_log = self._pending_log_path(seq)
+            with open(pending_log, "w", encoding="utf-8") as f:
+                f.write("".join(
+                    json.dumps({"add": [node_id, ref, int(length)]}, ensure_ascii=False) + "\n"
+                    for node_id, ref, length in zip(live_ids, live_refs, live_lengths)
+                ))
+                f.flush()
+                os.fsync(f.fileno())
+
+            parts = [segment.expand() for segment in segments]
+            term_hashes = np.concatenate([part[0] for part in parts])
+            docs = np.concatenate([part[1] for part in parts])
+            tfs = np.concatenate([part[2] for part in parts])
+            keep = alive[docs] if len(docs) else np.zeros(0, dtype=bool)
+            merged = _Segment.write(
+                self._segment_path(seq),
+                seq,
+                [segment.seq for segment in segments],
+                term_hashes[keep],
+                renumber[docs[keep]],
+                tfs[keep],
+                (0, len(live_docs)),
+            )
+            os.replace(pending_log, self._dir / DOCS_LOG_FNAME)
+
+            capacity = max(1024, len(live_docs))
+            new_lengths = np.zeros(capacity, dtype=np.float32)
+            new_lengths[: len(live_docs)] = live_lengths
+            new_alive = np.zeros(capacity, dtype=bool)
+            new_alive[: len(live_docs)] = True
+            ref_docs: dict[str, list[int]] = {}
+            for doc, ref in enumerate(live_refs):
+                if ref is not None:
+                    ref_docs.setdefault(ref, []).append(doc)
+            with self._lock:
+                self._segments = [merged]
+                self._node_ids = live_ids
+                self._doc_by_node = {node_id: doc for doc, node_id in enumerate(live_ids)}
+                self._ref_docs = ref_docs
+                self._lengths = new_lengths
+                self._alive = new_alive
+                self._alive_count = len(live_docs)
+                self._alive_length = float(live_lengths.sum())
+        for segment in segments:
+            shutil.rmtree(segment.path, ignore_errors=True)
+        logger.info(
+            f"BM25全量合并 {len(segments)} 个段并重排文档号：{num_docs} -> {len(live_docs)} 个文档，"
+            f"{len(docs)} -> {merged.num_postings} 条倒排记录"
+        )
+
+    # ====================== 加载 ======================
+    def _load(self) -> None:
+        if not self._dir.exists():
+            return
+        # 全量合并中途退出：合并段已写完则启用改写后的文档表，否则丢弃
+        for pending_log in self._dir.glob(f"{DOCS_LOG_FNAME}.*"):
+            if self._segment_path(int(pending_log.suffix[1:])).is_dir():
+                os.replace(pending_log, self._dir / DOCS_LOG_FNAME)
+            else:
+                pending_log.unlink()
+        self._replay_log(self._dir / DOCS_LOG_FNAME)
+
+        for tmp_path in self._dir.glob(f"{SEGMENT_PREFIX}*.tmp"):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        segments = [_Segment.load(path) for path in sorted(self._dir.glob(f"{SEGMENT_PREFIX}*")) if path.is_dir()]
+        # 合并完成但旧段未删除时，以合并后的段为准
+        replaced = {seq for segment in segments for seq in segment.replaces}
+        for segment in segments:
+            if segment.seq in replaced:
+                shutil.rmtree(segment.path, ignore_errors=True)
+        segments = [segment for segment in segments if segment.seq not in replaced]
+        self._next_seq = max((segment.seq for segment in segments), default=-1) + 1
+        self._segments = [self._align_segment(segment) for segment in segments]
+        self._segments = [segment for segment in self._segments if segment is not None]
+        logger.info(
+            f"BM25词法索引加载完成：{self._alive_count} 个块，{len(self._segments)} 个段"
+        )
+
+    def _replay_log(self, log_path: Path) -> None:
+        """重放文档表；追加中途退出留下的不完整末行被截掉，后续追加从完整记录之后开始"""
+        if not log_path.exists():
+            return
+        with open(log_path, "rb+") as f:
+            valid_end = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    logger.warning(f"⚠️ BM25文档表末尾记录不完整，已截断：{log_path}")
+                    f.truncate(valid_end)
+                    return
+                if line.strip():
+                    record = json.loads(line)
+                    if "add" in record:
+                        self._add_doc(*record["add"])
+                    else:
+                        self._delete_ref_doc(record["delete"])
+                valid_end += len(line)
+
+    def _align_segment(self, segment: _Segment) -> _Segment | None:
+        """
+        写段后、追加文档表前退出时，段里的文档号没有对应的文档表记录，
+        之后的摄入会复用这些文档号：整段超出文档表的直接丢弃，部分超出的截断
+        """
+        num_docs = len(self._node_ids)
+        if segment.doc_end <= num_docs:
+            return segment
+        if segment.doc_start >= num_docs:
+            logger.warning(f"⚠️ BM25段 {segment.path.name} 的文档未写入文档表，已丢弃")
+            shutil.rmtree(segment.path, ignore_errors=True)
+            return None
+        seq = self._next_seq
+        self._next_seq += 1
+        clipped = segment.clip(self._segment_path(seq), seq, num_docs)
+        shutil.rmtree(segment.path, ignore_errors=True)
+        logger.warning(
+            f"⚠️ BM25段 {segment.path.name} 部分文档未写入文档表，已截断为 {clipped.path.name}"
+        )
+        return clipped
+
+    # ====================== 查询 ======================
+    def search(
+        self, query: str, top_k: int, ref_doc_ids: list[str] | None = None
+    ) -> list[tuple[str, float]]:
+        """
+        返回 [(node_id, bm25分数)]，按分数降序；ref_doc_ids 限定文档范围。
+        按文档频率从低到高取词生成候选文档（倒排记录总数不超过 max_candidate_postings），
+        其余高频词只对候选文档二分查找加分，不展开其完整倒排表
+        """
+        if not self.enabled or top_k <= 0:
+            return []
+        term_hashes = list(dict.fromkeys(_term_hash(term) for term in tokenize(query)))
+        if not term_hashes:
+            return []
+
+        with self._lock:
+            num_docs = len(self._node_ids)
+            if self._alive_count == 0:
+                return []
+            alive = self._alive[:num_docs]
+            if ref_doc_ids is not None:
+                allowed_docs = [doc for ref in ref_doc_ids for doc in self._ref_docs.get(ref, ())]
+                if not allowed_docs:
+                    return []
+                alive = np.zeros(num_docs, dtype=bool)
+                alive[allowed_docs] = self._alive[allowed_docs]
+            lengths = self._lengths[:num_docs]
+            avg_length = max(self._alive_length / self._alive_count, 1.0)
+            corpus_size = self._alive_count
+            segments = list(self._segments)
+            node_ids = self._node_ids
+
+        terms: list[tuple[int, list[tuple[np.ndarray, np.ndarray]]]] = []
+        for term_hash in term_hashes:
+            parts = [p for p in (segment.postings(term_hash) for segment in segments) if p is not None]
+            if parts:
+                terms.append((sum(len(docs) for docs, _ in parts), parts))
+        if not terms:
+            return []
+        terms.sort(key=lambda term: term[0])
+
+        budget = self._settings.max_candidate_postings
+        generating: list[tuple[int, list[tuple[np.ndarray, np.ndarray]]]] = []
+        used = 0
+        for term in terms:
+            if generating and used + term[0] > budget:
+                break
+            generating.append(term)
+            used += term[0]
+        scoring = terms[len(generating):]
+
+        def term_scores(df: int, docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+            # 文档频率用倒排表长度近似（含已删除文档），避免为高频词展开整张倒排表
+            idf = math.log(1 + max(corpus_size - df + 0.5, 0.5) / (df + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = self._settings.k1 * (1 - self._settings.b + self._settings.b * lengths[docs] / avg_length)
+            return idf * tfs * (self._settings.k1 + 1) / (tfs + norm)
+
+        # 1. 低频词生成候选并打分
+        doc_parts: list[np.ndarray] = []
+        score_parts: list[np.ndarray] = []
+        for df, parts in generating:
+            for docs, tfs in parts:
+                docs = np.asarray(docs)
+                # 跳过已删除/不在范围内的文档
+                valid = docs < num_docs
+                valid[valid] = alive[docs[valid]]
+                doc_parts.append(docs[valid])
+                score_parts.append(term_scores(df, docs[valid], np.asarray(tfs)[valid]))
+        candidates = np.concatenate(doc_parts)
+        if len(candidates) == 0:
+            return []
+        if len(doc_parts) == 1:
+            # 单个倒排区间内文档号不重复，无需归并
+            scores = score_parts[0].astype(np.float64)
+        else:
+            candidates, inverse = np.unique(candidates, return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        # 2. 候选过多时先按已有分数截断，限制高频词的查找量
+        if scoring and len(candidates) > budget:
+            keep = np.argpartition(-scores, budget - 1)[:budget]
+            # 保持候选按文档号有序，后续二分查找的访问是顺序的
+            keep.sort()
+            candidates, scores = candidates[keep], scores[keep]
+
+        # 3. 高频词只对候选文档加分（段内倒排表按文档号有序，二分查找）
+        for df, parts in scoring:
+            for docs, tfs in parts:
+                positions = np.searchsorted(docs, candidates)
+                positions[positions >= len(docs)] = len(docs) - 1
+                hit = np.asarray(docs[positions]) == candidates
+                if hit.any():
+                    scores[hit] += term_scores(df, candidates[hit], np.asarray(tfs[positions[hit]]))
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(node_ids[candidates[i]], float(scores[i])) for i in top]
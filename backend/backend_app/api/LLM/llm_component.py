@@ -1,14 +1,23 @@
-from injector import singleton
+from injector import inject, singleton
 from llama_index.core.llms import LLM
-from backend_app.api.settings.settings import settings, OllamaSettings
-from collections.abc import Callable
-from typing import Any
+from backend_app.api.LLM.llm_scheduler import LLMPriority, LLMScheduler, ScheduledLLM
+from backend_app.api.LLM.model_provisioner import ModelProvisioner, resolve_keep_alive
+from backend_app.api.LLM.ollama_pool import OllamaPool, PooledOllama
+from backend_app.api.settings.settings import settings
 
 @singleton
 class LLMComponent:
     llm: LLM
+    # 未经调度的原始LLM，只用于派生独立副本
+    base_llm: LLM
 
-    def __init__(self) -> None:
+    @inject
+    def __init__(
+        self, scheduler: LLMScheduler, provisioner: ModelProvisioner, pool: OllamaPool
+    ) -> None:
+        self.scheduler = scheduler
+        self.provisioner = provisioner
+        self.pool = pool
         llm_mode = settings().llm.mode
         print(f"LLM model in mode={llm_mode}")
         match llm_mode:
@@ -40,42 +49,37 @@ class LLMComponent:
                     # 条件2：模型名中已有冒号（已指定版本）
                     model_name = llm_model
 
-                llm = Ollama(
-                    model=model_name,
-                    base_url=ollama_settings.api_base,
-                    temperature=ollama_settings.temperature,
-                    context_window=ollama_settings.context_window,
-                    additional_kwargs=settings_kwargs,
-                    request_timeout=ollama_settings.request_timeout,
-                )
-                
-
-                if ollama_settings.autopull_models:
-                    from backend_app.api.utils.pull_ollama_model import check_connection, pull_model
-                    
-                    if not check_connection(llm.client):
-                        raise ValueError(
-                            f"Failed to connect to Ollama, "
-                            f"check if Ollama server is running on {ollama_settings.api_base}"
-                        )
-                    print(llm.client, "11111111111111111111111")
-                    pull_model(llm.client, model_name)
+                keep_alive = resolve_keep_alive(ollama_settings.keep_alive)
+                # 每个Ollama实例一个同参数的LLM，由OllamaPool按负载/健康状态/会话选择实例；
+                # keep_alive作为实例字段随每次请求发送，派生副本（background_llm）同样继承
+                host_llms = {
+                    host.name: Ollama(
+                        model=model_name,
+                        base_url=host.url,
+                        temperature=ollama_settings.temperature,
+                        context_window=ollama_settings.context_window,
+                        additional_kwargs=settings_kwargs,
+                        request_timeout=ollama_settings.request_timeout,
+                        keep_alive=keep_alive,
+                    )
+                    for host in self.pool.hosts
+                }
+                llm = PooledOllama(self.pool, host_llms)
 
-                if (
-                    ollama_settings.keep_alive
-                    != OllamaSettings.model_fields["keep_alive"].default
-                ):
-                    # Modify Ollama methods to use the "keep_alive" field.
-                    def add_keep_alive(func: Callable[..., Any]) -> Callable[..., Any]:
-                        def wrapper(*args: Any, **kwargs: Any) -> Any:
-                            kwargs["keep_alive"] = ollama_settings.keep_alive
-                            return func(*args, **kwargs)
+                # 连接检查、拉取模型与预热在后台线程进行，不阻塞依赖构造
+                self.provisioner.start(
+                    {name: host_llm.client for name, host_llm in host_llms.items()}, model_name, keep_alive
+                )
+                self.pool.start_health_checks()
 
-                        return wrapper
+                self.base_llm = llm
+                self.llm = self._scheduled(llm, "interactive")
 
-                    Ollama.chat = add_keep_alive(Ollama.chat)  # type: ignore
-                    Ollama.stream_chat = add_keep_alive(Ollama.stream_chat)  # type: ignore
-                    Ollama.complete = add_keep_alive(Ollama.complete)  # type: ignore
-                    Ollama.stream_complete = add_keep_alive(Ollama.stream_complete)  # type: ignore
+    def _scheduled(self, llm: LLM, priority: LLMPriority) -> LLM:
+        if not self.scheduler.enabled:
+            return llm
+        return ScheduledLLM(llm, self.scheduler, priority)
 
-                self.llm = llm
\ No newline at end of file
+    def background_llm(self) -> LLM:
+        """后台任务（摄入时三元组提取）专用的独立副本：按background优先级调度，副本不带已创建的客户端，异步客户端不与对话共用"""
+        return self._scheduled(self.base_llm.model_copy(), "background")
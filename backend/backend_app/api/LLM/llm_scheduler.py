@@ -0,0 +1,385 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from injector import singleton
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import LLM
+from pydantic import BaseModel
+
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+LLMPriority = Literal["interactive", "background"]
+# 放行顺序：排在前面的类别先拿到空闲槽位
+PRIORITY_ORDER: tuple[LLMPriority, ...] = ("interactive", "background")
+
+# 平均占用时长/等待时间的指数滑动平均系数
+EWMA_ALPHA = 0.2
+
+
+class LLMOverloadedError(RuntimeError):
+    """预计排队时间超过该类别的延迟预算，拒绝新请求"""
+
+    def __init__(self, priority: LLMPriority, estimated_wait_seconds: float) -> None:
+        self.priority = priority
+        self.estimated_wait_seconds = estimated_wait_seconds
+        self.retry_after = max(1, math.ceil(estimated_wait_seconds))
+        super().__init__(
+            f"LLM繁忙：{priority} 请求预计排队 {estimated_wait_seconds:.1f}s，"
+            f"请 {self.retry_after}s 后重试"
+        )
+
+
+@dataclass
+class _Waiter:
+    priority: LLMPriority
+    enqueued_at: float
+    notify: Callable[[], None]
+    granted: bool = False
+
+
+@dataclass
+class _ClassCounters:
+    granted: int = 0
+    rejected: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    recent_wait_seconds: float = 0.0
+    avg_hold_seconds: float = 0.0
+
+    def record_wait(self, wait_seconds: float) -> None:
+        self.granted += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.recent_wait_seconds += EWMA_ALPHA * (wait_seconds - self.recent_wait_seconds)
+
+    def record_hold(self, hold_seconds: float) -> None:
+        if self.avg_hold_seconds == 0.0:
+            self.avg_hold_seconds = hold_seconds
+        else:
+            self.avg_hold_seconds += EWMA_ALPHA * (hold_seconds - self.avg_hold_seconds)
+
+
+class LLMClassStats(BaseModel):
+    inflight: int
+    max_inflight: int
+    queued: int
+    granted: int
+    rejected: int
+    avg_wait_ms: float
+    recent_wait_ms: float
+    max_wait_ms: float
+    avg_hold_seconds: float
+    estimated_wait_seconds: float
+    latency_budget_seconds: float | None
+
+
+class LLMSchedulerStats(BaseModel):
+    enabled: bool
+    max_inflight: int
+    inflight: int
+    queued: int
+    classes: dict[str, LLMClassStats]
+
+
+@singleton
+class LLMScheduler:
+    """
+    Ollama请求调度器（所有经 LLMComponent 发出的生成请求共用）：
+    1. 全局在途上限 max_inflight（与 OLLAMA_NUM_PARALLEL 对齐），每个类别另有自己的在途上限
+    2. 槽位空出时按优先级放行：interactive（对话、混合融合、KG查询合成）先于 background（摄入时三元组提取），
+       同类别内先进先出
+    3. 准入控制：interactive 请求预计排队时间超过延迟预算时直接拒绝（接口返回429+Retry-After），
+       background 不设预算，只排队
+    4. 同步调用（线程阻塞等待）与异步调用（任意事件循环上await）共用同一队列
+    """
+
+    def __init__(self) -> None:
+        self._settings = settings().llm.scheduler
+        self._max_inflight = max(1, self._settings.max_inflight)
+        self._limits: dict[LLMPriority, int] = {
+            "interactive": max(1, min(self._settings.interactive_max_inflight, self._max_inflight)),
+            "background": max(1, min(self._settings.background_max_inflight, self._max_inflight)),
+        }
+        self._budgets: dict[LLMPriority, float | None] = {
+            "interactive": self._settings.interactive_latency_budget_seconds,
+            "background": None,
+        }
+        self._lock = threading.Lock()
+        self._inflight: dict[LLMPriority, int] = {priority: 0 for priority in PRIORITY_ORDER}
+        self._queues: dict[LLMPriority, deque[_Waiter]] = {
+            priority: deque() for priority in PRIORITY_ORDER
+        }
+        self._counters: dict[LLMPriority, _ClassCounters] = {
+            priority: _ClassCounters() for priority in PRIORITY_ORDER
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self._settings.enabled
+
+    def check_admission(self, priority: LLMPriority = "interactive") -> None:
+        """请求开始生成前调用；预计排队时间超过预算时抛出 LLMOverloadedError"""
+        budget = self._budgets[priority]
+        if not self.enabled or budget is None:
+            return
+        with self._lock:
+            estimated = self._estimate_wait_locked(priority, time.monotonic())
+            if estimated <= budget:
+                return
+            self._counters[priority].rejected += 1
+        logger.warning(f"⚠️ LLM调度器拒绝 {priority} 请求：预计排队 {estimated:.1f}s > 预算 {budget:.1f}s")
+        raise LLMOverloadedError(priority, estimated)
+
+    @contextmanager
+    def slot(self, priority: LLMPriority) -> Iterator[None]:
+        """同步占用一个槽位（阻塞当前线程直到放行）"""
+        if not self.enabled:
+            yield
+            return
+        granted = threading.Event()
+        waiter = self._enqueue(priority, granted.set)
+        if waiter is not None:
+            granted.wait()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(self, priority: LLMPriority) -> AsyncIterator[None]:
+        """异步占用一个槽位；等待期间被取消时退出队列（已放行则归还槽位）"""
+        if not self.enabled:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        granted: asyncio.Future[None] = loop.create_future()
+
+        def resolve() -> None:
+            if not granted.done():
+                granted.set_result(None)
+
+        waiter = self._enqueue(priority, lambda: loop.call_soon_threadsafe(resolve))
+        if waiter is not None:
+            try:
+                await granted
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+    def stats(self) -> LLMSchedulerStats:
+        now = time.monotonic()
+        with self._lock:
+            classes = {}
+            for priority in PRIORITY_ORDER:
+                counters = self._counters[priority]
+                classes[priority] = LLMClassStats(
+                    inflight=self._inflight[priority],
+                    max_inflight=self._limits[priority],
+                    queued=len(self._queues[priority]),
+                    granted=counters.granted,
+                    rejected=counters.rejected,
+                    avg_wait_ms=round(
+                        counters.total_wait_seconds / counters.granted * 1000 if counters.granted else 0.0, 1
+                    ),
+                    recent_wait_ms=round(counters.recent_wait_seconds * 1000, 1),
+                    max_wait_ms=round(counters.max_wait_seconds * 1000, 1),
+                    avg_hold_seconds=round(counters.avg_hold_seconds, 3),
+                    estimated_wait_seconds=round(self._estimate_wait_locked(priority, now), 3),
+                    latency_budget_seconds=self._budgets[priority],
+                )
+            return LLMSchedulerStats(
+                enabled=self.enabled,
+                max_inflight=self._max_inflight,
+                inflight=sum(self._inflight.values()),
+                queued=sum(len(queue) for queue in self._queues.values()),
+                classes=classes,
+            )
+
+    # ====================== 内部方法 ======================
+    def _can_run_locked(self, priority: LLMPriority) -> bool:
+        return (
+            self._inflight[priority] < self._limits[priority]
+            and sum(self._inflight.values()) < self._max_inflight
+        )
+
+    def _queued_ahead_locked(self, priority: LLMPriority) -> int:
+        """同优先级及更高优先级中排在前面的请求数"""
+        rank = PRIORITY_ORDER.index(priority)
+        return sum(len(self._queues[p]) for p in PRIORITY_ORDER[: rank + 1])
+
+    def _estimate_wait_locked(self, priority: LLMPriority, now: float) -> float:
+        ahead = self._queued_ahead_locked(priority)
+        if ahead == 0 and self._can_run_locked(priority):
+            return 0.0
+        # 按平均占用时长估算排在前面的请求轮完所需时间；队首已等待的时间是实际排队延迟的下界
+        hold = self._counters[priority].avg_hold_seconds
+        estimated = (ahead // self._limits[priority] + 1) * hold
+        queue = self._queues[priority]
+        if queue:
+            estimated = max(estimated, now - queue[0].enqueued_at)
+        return estimated
+
+    def _enqueue(self, priority: LLMPriority, notify: Callable[[], None]) -> _Waiter | None:
+        """能立即运行时占用槽位并返回None，否则排队并返回等待者"""
+        now = time.monotonic()
+        with self._lock:
+            if self._queued_ahead_locked(priority) == 0 and self._can_run_locked(priority):
+                self._inflight[priority] += 1
+                self._counters[priority].record_wait(0.0)
+                return None
+            waiter = _Waiter(priority=priority, enqueued_at=now, notify=notify)
+            self._queues[priority].append(waiter)
+            return waiter
+
+    def _dispatch_locked(self) -> list[_Waiter]:
+        now = time.monotonic()
+        ready: list[_Waiter] = []
+        for priority in PRIORITY_ORDER:
+            queue = self._queues[priority]
+            # 某类别只受自身上限阻塞时，不影响低优先级类别使用剩余的全局槽位
+            while queue and self._can_run_locked(priority):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._inflight[priority] += 1
+                self._counters[priority].record_wait(now - waiter.enqueued_at)
+                ready.append(waiter)
+        return ready
+
+    def _release(self, priority: LLMPriority, hold_seconds: float | None = None) -> None:
+        with self._lock:
+            self._inflight[priority] -= 1
+            if hold_seconds is not None:
+                self._counters[priority].record_hold(hold_seconds)
+            ready = self._dispatch_locked()
+        for waiter in ready:
+            try:
+                waiter.notify()
+            except RuntimeError:
+                # 等待者所在的事件循环已关闭，槽位直接归还
+                self._release(waiter.priority)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._queues[waiter.priority].remove(waiter)
+                return
+        self._release(waiter.priority)
+
+
+class ScheduledLLM(LLM):
+    """
+    在实际LLM前加一层调度：每次生成（含流式生成的整个过程）占用一个调度槽位，
+    其余属性与回调都沿用被包装的LLM
+    """
+
+    priority: LLMPriority
+    _inner: LLM = PrivateAttr()
+    _scheduler: LLMScheduler = PrivateAttr()
+
+    def __init__(self, inner: LLM, scheduler: LLMScheduler, priority: LLMPriority) -> None:
+        super().__init__(
+            priority=priority,
+            callback_manager=inner.callback_manager,
+            system_prompt=inner.system_prompt,
+            messages_to_prompt=inner.messages_to_prompt,
+            completion_to_prompt=inner.completion_to_prompt,
+            output_parser=inner.output_parser,
+            pydantic_program_mode=inner.pydantic_program_mode,
+            query_wrapper_prompt=inner.query_wrapper_prompt,
+        )
+        self._inner = inner
+        self._scheduler = scheduler
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledLLM"
+
+    @property
+    def inner(self) -> LLM:
+        return self._inner
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._inner.metadata
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        with self._scheduler.slot(self.priority):
+            return self._inner.chat(messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        with self._scheduler.slot(self.priority):
+            return self._inner.complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        def gen() -> ChatResponseGen:
+            with self._scheduler.slot(self.priority):
+                yield from self._inner.stream_chat(messages, **kwargs)
+
+        return gen()
+
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            with self._scheduler.slot(self.priority):
+                yield from self._inner.stream_complete(prompt, formatted=formatted, **kwargs)
+
+        return gen()
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        async with self._scheduler.aslot(self.priority):
+            return await self._inner.achat(messages, **kwargs)
+
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        async with self._scheduler.aslot(self.priority):
+            return await self._inner.acomplete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        async def gen() -> ChatResponseAsyncGen:
+            async with self._scheduler.aslot(self.priority):
+                async for response in await self._inner.astream_chat(messages, **kwargs):
+                    yield response
+
+        return gen()
+
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            async with self._scheduler.aslot(self.priority):
+                async for response in await self._inner.astream_complete(
+                    prompt, formatted=formatted, **kwargs
+                ):
+                    yield response
+
+        return gen()
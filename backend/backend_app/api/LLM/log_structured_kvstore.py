@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import fsspec
+from llama_index.core.storage.kvstore.simple_kvstore import DATA_TYPE, SimpleKVStore
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+WAL_SUFFIX = ".wal"
+# 压缩期间被轮换出来的旧日志，快照落盘成功后删除
+WAL_COMPACTING_SUFFIX = ".wal.compacting"
+
+
+def _decode_index_data(val: Any) -> dict | None:
+    """index_store 中的索引结构以 {"__type__", "__data__": <json字符串>} 存储，解出 __data__ 便于做差量"""
+    if not isinstance(val, dict) or not isinstance(val.get("__data__"), str):
+        return None
+    try:
+        data = json.loads(val["__data__"])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _diff_dicts(old: dict, new: dict, depth: int = 1) -> dict:
+    """计算两个字典的差量：{"set": {...}, "unset": [...], "sub": {key: 子差量}}"""
+    diff: dict[str, Any] = {"set": {}, "unset": [], "sub": {}}
+    for key, value in new.items():
+        if key not in old:
+            diff["set"][key] = value
+            continue
+        old_value = old[key]
+        if old_value == value:
+            continue
+        if depth > 0 and isinstance(old_value, dict) and isinstance(value, dict):
+            diff["sub"][key] = _diff_dicts(old_value, value, depth - 1)
+        else:
+            diff["set"][key] = value
+    diff["unset"] = [key for key in old if key not in new]
+    return diff
+
+
+def _apply_diff(target: dict, diff: dict) -> dict:
+    for key in diff.get("unset", []):
+        target.pop(key, None)
+    target.update(diff.get("set", {}))
+    for key, sub_diff in diff.get("sub", {}).items():
+        current = target.get(key)
+        target[key] = _apply_diff(dict(current) if isinstance(current, dict) else {}, sub_diff)
+    return target
+
+
+class LogStructuredKVStore(SimpleKVStore):
+    """
+    追加写日志（WAL）的 SimpleKVStore：
+    1. put/delete 先改内存，再把这一次变更序列化为一行日志放入待提交队列
+    2. persist() 只把待提交日志追加到 <persist_path>.wal 并 fsync（组提交：并发写者共享一次刷盘）
+    3. 日志超过阈值后在后台线程把全量快照写回 <persist_path>，并截断日志
+    单次写入的磁盘I/O与变更大小成正比，与语料规模无关；
+    但CPU开销仍随语料增长：llama-index写索引结构时先把整个 nodes_dict 序列化成 __data__ 字符串，
+    这里再解析一遍并与上一次的结果逐项比较得出差量，两者都是 O(索引规模)
+    """
+
+    def __init__(
+        self,
+        data: Optional[DATA_TYPE] = None,
+        persist_path: str | None = None,
+        compaction_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        super().__init__(data)
+        self._persist_path = persist_path
+        self._compaction_bytes = compaction_bytes
+
+        self._lock = threading.RLock()
+        self._commit_cond = threading.Condition(threading.Lock())
+        self._pending: list[str] = []
+        self._enqueued_seq = 0
+        self._committed_seq = 0
+        self._committing = False
+        self._compacting = False
+        # 索引结构的上一次解码结果，避免每次做差量都重新解析旧值
+        self._decoded_index_cache: dict[tuple[str, str], dict] = {}
+
+    @property
+    def wal_path(self) -> str | None:
+        return self._persist_path + WAL_SUFFIX if self._persist_path else None
+
+    # ====================== 写入：内存变更 + 记录日志 ======================
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        with self._lock:
+            old = self._get_collection_mapping(collection).get(key)
+            super().put(key, val, collection=collection)
+            self._enqueue(self._encode_put(collection, key, old, val))
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            deleted = super().delete(key, collection=collection)
+            self._decoded_index_cache.pop((collection, key), None)
+            if deleted:
+                self._enqueue(json.dumps({"op": "del", "c": collection, "k": key}, ensure_ascii=False))
+            return deleted
+
+    def _encode_put(self, collection: str, key: str, old: Any, val: dict) -> str:
+        new_data = _decode_index_data(val)
+        if new_data is not None and old is not None and old.get("__type__") == val.get("__type__"):
+            old_data = self._decoded_index_cache.get((collection, key)) or _decode_index_data(old)
+            if old_data is not None:
+                self._decoded_index_cache[(collection, key)] = new_data
+                # 索引结构（nodes_dict 随语料增长）只记录差量；解析与比较仍需遍历整个结构
+                return json.dumps(
+                    {"op": "patch", "c": collection, "k": key, "d": _diff_dicts(old_data, new_data)},
+                    ensure_ascii=False,
+                )
+        if new_data is not None:
+            self._decoded_index_cache[(collection, key)] = new_data
+        return json.dumps({"op": "put", "c": collection, "k": key, "v": val}, ensure_ascii=False)
+
+    def _enqueue(self, record: str) -> None:
+        with self._commit_cond:
+            self._pending.append(record)
+            self._enqueued_seq += 1
+
+    # ====================== 组提交 ======================
+    def commit(self) -> None:
+        """把当前已入队的日志刷盘；并发调用者中由一个 leader 统一写入并 fsync，其余等待"""
+        if self.wal_path is None:
+            return
+        with self._commit_cond:
+            target_seq = self._enqueued_seq
+            while self._committed_seq < target_seq:
+                if self._committing:
+                    self._commit_cond.wait()
+                    continue
+                self._committing = True
+                batch, self._pending = self._pending, []
+                batch_seq = self._enqueued_seq
+                self._commit_cond.release()
+                try:
+                    self._append_to_log(batch)
+                except Exception:
+                    # 写入失败：把这批日志放回队首，交给下一次提交
+                    self._commit_cond.acquire()
+                    self._pending = batch + self._pending
+                    self._committing = False
+                    self._commit_cond.notify_all()
+                    raise
+                self._commit_cond.acquire()
+                self._committed_seq = batch_seq
+                self._committing = False
+                self._commit_cond.notify_all()
+
+    def _append_to_log(self, records: list[str]) -> None:
+        if not records:
+            return
+        wal_path = Path(self.wal_path)
+        wal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(wal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(records) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def persist(
+        self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> None:
+        """持久化：目标是本存储的快照路径时只提交日志，否则退化为全量写出"""
+        if self._persist_path is None or os.path.abspath(str(persist_path)) != os.path.abspath(self._persist_path):
+            super().persist(str(persist_path), fs=fs)
+            return
+        self.commit()
+        self._maybe_compact()
+
+    # ====================== 后台压缩 ======================
+    def _maybe_compact(self) -> None:
+        wal_path = self.wal_path
+        try:
+            wal_size = os.path.getsize(wal_path)
+        except OSError:
+            return
+        if wal_size < self._compaction_bytes:
+            return
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(
+            target=self.compact, name=f"wal-compaction:{Path(self._persist_path).name}", daemon=True
+        ).start()
+
+    def compact(self) -> None:
+        """把全量快照写回 persist_path 并清理已合并的日志"""
+        try:
+            with self._lock:
+                # 持有写锁：先提交全部日志，再轮换日志文件并拍下内存快照
+                self.commit()
+                compacting_path = self._persist_path + WAL_COMPACTING_SUFFIX
+                if os.path.exists(self.wal_path):
+                    os.replace(self.wal_path, compacting_path)
+                snapshot = {
+                    collection: dict(mapping)
+                    for collection, mapping in self._collections_mappings.items()
+                }
+
+            tmp_path = self._persist_path + ".tmp"
+            Path(tmp_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._persist_path)
+            if os.path.exists(compacting_path):
+                os.remove(compacting_path)
+            logger.info(f"✅ WAL压缩完成：{self._persist_path}")
+        except Exception as e:
+            logger.error(f"❌ WAL压缩失败（日志仍保留，可重放）：{self._persist_path}: {e!s}", exc_info=True)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    # ====================== 加载：快照 + 重放日志 ======================
+    def _replay(self, log_path: str) -> int:
+        replayed = 0
+        # 被打过补丁的索引结构先保持解码状态，重放结束后统一编码，避免每条补丁都全量序列化
+        decoded: dict[tuple[str, str], dict] = {}
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下半行，忽略即可
+                    logger.warning(f"⚠️ 跳过损坏的WAL记录：{log_path}")
+                    continue
+                collection, key = record["c"], record["k"]
+                mapping = self._get_collection_mapping(collection)
+                match record["op"]:
+                    case "put":
+                        mapping[key] = record["v"]
+                        decoded.pop((collection, key), None)
+                    case "del":
+                        mapping.pop(key, None)
+                        decoded.pop((collection, key), None)
+                    case "patch":
+                        data = decoded.get((collection, key))
+                        if data is None:
+                            current = mapping.get(key)
+                            data = _decode_index_data(current) if current else None
+                            if data is None:
+                                continue
+                        decoded[(collection, key)] = _apply_diff(data, record["d"])
+                replayed += 1
+
+        for (collection, key), data in decoded.items():
+            mapping = self._get_collection_mapping(collection)
+            mapping[key] = {**mapping[key], "__data__": json.dumps(data)}
+            self._decoded_index_cache[(collection, key)] = data
+        return replayed
+
+    @classmethod
+    def from_persist_path(
+        cls,
+        persist_path: str,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+        compaction_bytes: int = 64 * 1024 * 1024,
+    ) -> "LogStructuredKVStore":
+        """加载快照（不存在则为空），依次重放压缩中断遗留的旧日志和当前日志"""
+        persist_path = str(persist_path)
+        data = None
+        if os.path.exists(persist_path):
+            with open(persist_path, "rb") as f:
+                data = json.load(f)
+        store = cls(data, persist_path=persist_path, compaction_bytes=compaction_bytes)
+        for log_path in (persist_path + WAL_COMPACTING_SUFFIX, persist_path + WAL_SUFFIX):
+            if os.path.exists(log_path):
+                replayed = store._replay(log_path)
+                logger.info(f"✅ 重放WAL {log_path}：{replayed} 条记录")
+        return store
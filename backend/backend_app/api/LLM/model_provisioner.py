@@ -0,0 +1,280 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Literal
+
+from injector import inject, singleton
+from pydantic import BaseModel
+
+from backend_app.api.LLM.ollama_pool import OllamaPool
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ProvisionState = Literal["pending", "connecting", "pulling", "warming", "ready", "failed"]
+
+# keep_alive不传时Ollama服务端的默认驻留时长（OLLAMA_KEEP_ALIVE未设置时为5m）
+_SERVER_DEFAULT_KEEP_ALIVE_SECONDS = 300.0
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def resolve_keep_alive(keep_alive: str) -> str | int | None:
+    """
+    ollama.keep_alive 配置值 -> Ollama API 的 keep_alive 参数：
+    none 表示不传、使用Ollama服务端默认值（OLLAMA_KEEP_ALIVE）；load 表示加载后一直常驻（-1）
+    """
+    if keep_alive == "none":
+        return None
+    if keep_alive == "load":
+        return -1
+    return keep_alive
+
+
+def keep_alive_seconds(keep_alive: str | int | None) -> float | None:
+    """
+    Ollama API 的 keep_alive 参数 -> 模型加载后的驻留秒数，None 表示一直常驻：
+    负数常驻；纯数字按秒；'5m'、'1h30m' 等按时长解析；不传时按服务端默认的5m估计
+    """
+    if keep_alive is None:
+        return _SERVER_DEFAULT_KEEP_ALIVE_SECONDS
+    text = str(keep_alive).strip()
+    try:
+        seconds = float(text)
+    except ValueError:
+        negative = text.startswith("-")
+        parts = _DURATION_PART.findall(text.lstrip("+-"))
+        if not parts or "".join(value + unit for value, unit in parts) != text.lstrip("+-"):
+            raise ValueError(f"无法解析的 keep_alive 时长：{keep_alive!r}")
+        seconds = sum(float(value) * _DURATION_UNIT_SECONDS[unit] for value, unit in parts)
+        if negative:
+            seconds = -seconds
+    return None if seconds < 0 else seconds
+
+
+def parse_resident_hours(value: str | None) -> tuple[int, int] | None:
+    """'08:00-20:00' -> (480, 1200)，以一天内的分钟数表示；结束早于开始时视为跨零点"""
+    if not value:
+        return None
+    try:
+        start, end = (part.strip() for part in value.split("-", 1))
+        start_h, start_m = (int(x) for x in start.split(":"))
+        end_h, end_m = (int(x) for x in end.split(":"))
+    except ValueError as e:
+        raise ValueError(f"ollama.residency.resident_hours 格式应为 HH:MM-HH:MM，实际为 {value!r}") from e
+    return start_h * 60 + start_m, end_h * 60 + end_m
+
+
+class LLMNotReadyError(RuntimeError):
+    """模型尚未就绪（连接Ollama或拉取模型中/失败），拒绝需要生成的请求"""
+
+    def __init__(self, model: str, state: ProvisionState, retry_after: int, error: str | None = None) -> None:
+        self.model = model
+        self.state = state
+        self.retry_after = max(1, retry_after)
+        detail = f"：{error}" if error else ""
+        super().__init__(f"模型 {model} 尚未就绪（{state}{detail}），请 {self.retry_after}s 后重试")
+
+
+class HostProvisionStatus(BaseModel):
+    host: str
+    state: ProvisionState
+    warm: bool
+    last_loaded_at: float | None
+    error: str | None
+
+
+class ModelProvisionStatus(BaseModel):
+    model: str | None
+    state: ProvisionState
+    ready: bool
+    warm: bool
+    keep_alive: str | int | None
+    resident_now: bool
+    hosts: list[HostProvisionStatus]
+
+
+class _HostProvision:
+    def __init__(self, name: str, client: Any) -> None:
+        self.name = name
+        self.client = client
+        self.state: ProvisionState = "pending"
+        self.last_loaded_at: float | None = None
+        self.error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("warming", "ready")
+
+
+# 汇总多个实例的状态时，取进展最靠前的实例
+_STATE_PROGRESS: tuple[ProvisionState, ...] = ("failed", "pending", "connecting", "pulling", "warming", "ready")
+
+
+@singleton
+class ModelProvisioner:
+    """
+    Ollama模型的后台准备与常驻管理（不在依赖构造/请求路径上阻塞），每个Ollama实例一个后台线程：
+    1. 检查连接并按需拉取模型，完成后该实例标记为就绪并加入OllamaPool路由；
+       没有任何实例就绪时生成类请求直接返回503，语义缓存命中不受影响
+    2. 就绪后发送一次空提示词的generate把模型预加载进Ollama内存，首个用户请求不再承担加载耗时
+    3. 配置了常驻时段时，在时段内按间隔续期keep_alive，时段外不再续期，模型按keep_alive自然卸载
+    连接或拉取失败时按间隔重试，不再让服务启动失败，单个实例故障也不影响其他实例
+    """
+
+    @inject
+    def __init__(self, pool: OllamaPool) -> None:
+        self._pool = pool
+        self._settings = settings().ollama.residency
+        self._resident_hours = parse_resident_hours(self._settings.resident_hours)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._hosts: list[_HostProvision] = []
+        self._model: str | None = None
+        self._keep_alive: str | int | None = None
+        self._keep_alive_seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return any(host.ready for host in self._hosts)
+
+    @property
+    def state(self) -> ProvisionState:
+        if not self._hosts:
+            return "pending"
+        return max((host.state for host in self._hosts), key=_STATE_PROGRESS.index)
+
+    def start(self, clients: dict[str, Any], model: str, keep_alive: str | int | None) -> None:
+        """LLMComponent构造时调用（幂等）：clients 为 实例名 -> ollama.Client，启动后台准备线程后立即返回"""
+        with self._lock:
+            if self._hosts:
+                return
+            self._model = model
+            self._keep_alive = keep_alive
+            self._keep_alive_seconds = keep_alive_seconds(keep_alive)
+            self._stop.clear()
+            self._hosts = [_HostProvision(name, client) for name, client in clients.items()]
+            for host in self._hosts:
+                threading.Thread(
+                    target=self._run, args=(host,), name=f"ollama-provisioner-{host.name}", daemon=True
+                ).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def check_ready(self) -> None:
+        if not self.ready:
+            error = next((host.error for host in self._hosts if host.error), None)
+            raise LLMNotReadyError(
+                self._model or "unknown", self.state, self._settings.provision_retry_seconds, error
+            )
+
+    def in_resident_hours(self, now: datetime | None = None) -> bool:
+        if self._resident_hours is None:
+            return False
+        now = now or datetime.now()
+        if now.weekday() not in self._settings.resident_weekdays:
+            return False
+        start, end = self._resident_hours
+        minute = now.hour * 60 + now.minute
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+    def is_warm(self, host: _HostProvision, now: float | None = None) -> bool:
+        """
+        本服务最近一次加载/续期后是否仍在keep_alive驻留时长内；
+        超过驻留时长后Ollama会卸载模型（期间的对话请求也会顺延驻留，此处不统计，按已卸载报告）
+        """
+        if host.last_loaded_at is None:
+            return False
+        if self._keep_alive_seconds is None:
+            return True
+        return (now or time.time()) - host.last_loaded_at < self._keep_alive_seconds
+
+    def status(self) -> ModelProvisionStatus:
+        now = time.time()
+        warm_hosts = {host.name for host in self._hosts if self.is_warm(host, now)}
+        return ModelProvisionStatus(
+            model=self._model,
+            state=self.state,
+            ready=self.ready,
+            warm=bool(warm_hosts),
+            keep_alive=self._keep_alive,
+            resident_now=self.in_resident_hours(),
+            hosts=[
+                HostProvisionStatus(
+                    host=host.name,
+                    state=host.state,
+                    warm=host.name in warm_hosts,
+                    last_loaded_at=host.last_loaded_at,
+                    error=host.error,
+                )
+                for host in self._hosts
+            ],
+        )
+
+    def _run(self, host: _HostProvision) -> None:
+        while not self._stop.is_set():
+            if not host.ready:
+                if not self._provision(host):
+                    self._stop.wait(self._settings.provision_retry_seconds)
+                    continue
+                if self._settings.warmup_on_startup:
+                    self._load(host, "预热")
+                host.state = "ready"
+            if self._resident_hours is None:
+                return
+            if self.in_resident_hours() and self._due_for_renewal(host):
+                self._load(host, "续期")
+            self._stop.wait(self._settings.renew_interval_seconds)
+
+    def _provision(self, host: _HostProvision) -> bool:
+        if not settings().ollama.autopull_models:
+            host.state = "warming"
+            self._pool.mark_provisioned(host.name)
+            return True
+        try:
+            from backend_app.api.utils.pull_ollama_model import check_connection, pull_model
+
+            host.state = "connecting"
+            if not check_connection(host.client):
+                raise ConnectionError(f"无法连接Ollama，请确认服务运行在 {host.name}")
+            host.state = "pulling"
+            pull_model(host.client, self._model)
+        except Exception as e:
+            host.state = "failed"
+            host.error = str(e)
+            logger.error(
+                f"❌ 模型 {self._model} 在 {host.name} 上准备失败，"
+                f"{self._settings.provision_retry_seconds}s 后重试：{str(e)}"
+            )
+            return False
+        host.state = "warming"
+        host.error = None
+        self._pool.mark_provisioned(host.name)
+        logger.info(f"✅ 模型 {self._model} 在 {host.name} 上已就绪")
+        return True
+
+    def _due_for_renewal(self, host: _HostProvision) -> bool:
+        # 续期间隔内已加载过（如刚预热完）时跳过
+        return (
+            host.last_loaded_at is None
+            or time.time() - host.last_loaded_at >= self._settings.renew_interval_seconds
+        )
+
+    def _load(self, host: _HostProvision, reason: str) -> None:
+        """空提示词的generate只加载模型并按keep_alive重置其驻留时间，不做生成"""
+        started_at = time.monotonic()
+        try:
+            host.client.generate(model=self._model, prompt="", keep_alive=self._keep_alive)
+        except Exception as e:
+            logger.warning(f"⚠️ 模型 {self._model} 在 {host.name} 上{reason}失败：{str(e)}")
+            return
+        host.last_loaded_at = time.time()
+        logger.info(
+            f"模型 {self._model} 在 {host.name} 上{reason}完成（keep_alive={self._keep_alive}，"
+            f"耗时 {time.monotonic() - started_at:.2f}s）"
+        )
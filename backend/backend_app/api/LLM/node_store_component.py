@@ -1,13 +1,37 @@
+from pathlib import Path
+
 from injector import singleton
 from llama_index.core.storage.docstore import BaseDocumentStore, SimpleDocumentStore
+from llama_index.core.storage.docstore.types import (
+    DEFAULT_PERSIST_FNAME as DOCSTORE_PERSIST_FNAME,
+)
 from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.index_store.types import (
+    DEFAULT_PERSIST_FNAME as INDEX_STORE_PERSIST_FNAME,
+)
 from llama_index.core.storage.index_store.types import BaseIndexStore
 
+from backend_app.api.LLM.log_structured_kvstore import LogStructuredKVStore
 from backend_app.constants import get_local_data_path,get_local_kg_data_path
 from backend_app.api.settings.settings import settings
 import logging
 logger = logging.getLogger(__name__)
 
+
+def _load_log_structured_stores(
+    persist_dir: Path,
+) -> tuple[BaseIndexStore, BaseDocumentStore]:
+    """WAL模式：快照文件仍为 index_store.json / docstore.json，增量写入旁边的 .wal 日志"""
+    compaction_bytes = settings().nodestore.wal_compaction_mb * 1024 * 1024
+    index_kvstore = LogStructuredKVStore.from_persist_path(
+        str(persist_dir / INDEX_STORE_PERSIST_FNAME), compaction_bytes=compaction_bytes
+    )
+    doc_kvstore = LogStructuredKVStore.from_persist_path(
+        str(persist_dir / DOCSTORE_PERSIST_FNAME), compaction_bytes=compaction_bytes
+    )
+    return SimpleIndexStore(index_kvstore), SimpleDocumentStore(doc_kvstore)
+
+
 @singleton
 class NodeStoreComponent:
     index_store: BaseIndexStore
@@ -17,6 +41,12 @@ class NodeStoreComponent:
         database = settings().nodestore.database
         match database:
             case "simple":
+                if settings().nodestore.persist_mode == "wal":
+                    self.index_store, self.doc_store = _load_log_structured_stores(
+                        get_local_data_path()
+                    )
+                    return
+
                 try:
                     self.index_store = SimpleIndexStore.from_persist_dir(
                         persist_dir=str(get_local_data_path())
@@ -38,6 +68,7 @@ class NodeStoreComponent:
                     f"Database {settings().nodestore.database} not supported"
                 )
 
+@singleton
 class NodeKgStoreComponent:
     index_store: BaseIndexStore
     doc_store: BaseDocumentStore
@@ -47,6 +78,12 @@ class NodeKgStoreComponent:
         match database:
             case "simple":
                 logger.info(f"Using local KG data path: {get_local_kg_data_path()}")
+                if settings().nodestore.persist_mode == "wal":
+                    self.index_store, self.doc_store = _load_log_structured_stores(
+                        get_local_kg_data_path()
+                    )
+                    return
+
                 try:
                     self.index_store = SimpleIndexStore.from_persist_dir(
                         persist_dir=str(get_local_kg_data_path())
@@ -66,4 +103,4 @@ class NodeKgStoreComponent:
                 # The settings validator should have caught this
                 raise ValueError(
                     f"Database {settings().nodestore.database} not supported"
-                )
\ No newline at end of file
+                )
@@ -0,0 +1,422 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import httpx
+from injector import singleton
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import LLM
+from pydantic import BaseModel
+
+from backend_app.api.settings.settings import OllamaEndpointSettings, settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 当前请求所属会话的路由键（由ChatService设置），用于把同一会话固定到同一Ollama实例
+ollama_route_key: ContextVar[str | None] = ContextVar("ollama_route_key", default=None)
+
+# 请求未发出（连接失败）时可以换一个实例重试，不会重复生成
+RETRYABLE_ERRORS: tuple[type[BaseException], ...] = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def is_connect_failure(error: BaseException) -> bool:
+    # ollama客户端把httpx.ConnectError转换成内置ConnectionError（不含其子类ConnectionResetError等，那时请求可能已发出）
+    return type(error) is ConnectionError or isinstance(error, RETRYABLE_ERRORS)
+
+
+def conversation_route_key(system_prompt: str | None, first_user_message: str | None) -> str:
+    """同一会话的每一轮都以相同的系统提示词+首条用户消息开头，以此作为会话标识"""
+    payload = f"{system_prompt or ''}\x00{first_user_message or ''}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """连接/超时等传输错误以及服务端5xx、模型不存在(404)计为实例故障；其余（如请求参数错误）不计"""
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and (status_code >= 500 or status_code == 404)
+
+
+@dataclass
+class OllamaHost:
+    name: str
+    url: str
+    weight: float
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    # 主动健康检查结果
+    healthy: bool = True
+    # 模型已在该实例上就绪（由ModelProvisioner标记）
+    provisioned: bool = False
+    ejections: int = 0
+    ejected_until: float = 0.0
+    last_error: str | None = None
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.provisioned and now >= self.ejected_until
+
+    def load(self) -> float:
+        return self.outstanding / self.weight
+
+
+class OllamaHostStats(BaseModel):
+    name: str
+    weight: float
+    available: bool
+    healthy: bool
+    provisioned: bool
+    outstanding: int
+    requests: int
+    failures: int
+    ejected_for_seconds: float
+    last_error: str | None
+
+
+class OllamaPoolStats(BaseModel):
+    hosts: list[OllamaHostStats]
+    sticky_routes: int
+    sticky_overflows: int
+    panic_routes: int
+
+
+@singleton
+class OllamaPool:
+    """
+    多个Ollama实例的负载均衡：
+    1. 按 在途请求数/容量权重 选最空闲的实例，同负载时选累计请求数/权重更小的实例，使低并发时也按权重分摊
+    2. 带会话路由键的请求按加权rendezvous哈希固定到同一实例以复用其KV缓存；
+       该实例比最空闲实例每单位权重多出 sticky_max_imbalance 个在途请求时改走最空闲实例
+    3. 后台线程定期请求 /api/version 做主动健康检查；请求连续失败达到阈值时摘除一段时间（再次摘除时翻倍）
+    4. 全部实例都不可用时仍在未被排除的实例中按最空闲路由，不因误判整体拒绝
+    """
+
+    def __init__(self) -> None:
+        ollama_settings = settings().ollama
+        self._settings = ollama_settings.pool
+        endpoints = ollama_settings.endpoints or [OllamaEndpointSettings(url=ollama_settings.api_base)]
+        self.hosts: list[OllamaHost] = []
+        for endpoint in endpoints:
+            if endpoint.weight <= 0:
+                raise ValueError(f"Ollama实例 {endpoint.url} 的容量权重必须大于0")
+            url = endpoint.url.rstrip("/")
+            self.hosts.append(OllamaHost(name=url, url=url, weight=endpoint.weight))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: threading.Thread | None = None
+        self._sticky_routes = 0
+        self._sticky_overflows = 0
+        self._panic_routes = 0
+
+    def host(self, name: str) -> OllamaHost:
+        return next(host for host in self.hosts if host.name == name)
+
+    def start_health_checks(self) -> None:
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._stop.clear()
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="ollama-pool-health", daemon=True
+            )
+            self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def mark_provisioned(self, name: str, provisioned: bool = True) -> None:
+        with self._lock:
+            self.host(name).provisioned = provisioned
+
+    @contextmanager
+    def lease(self, route_key: str | None = None, exclude: Sequence[str] = ()) -> Iterator[OllamaHost]:
+        """占用一个实例完成一次请求（流式请求为整个生成过程），结束时按是否出错更新该实例的失败计数"""
+        host = self._acquire(route_key, exclude)
+        error: BaseException | None = None
+        try:
+            yield host
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(host, error)
+
+    def should_retry(self, error: BaseException, tried: Sequence[str]) -> bool:
+        return is_connect_failure(error) and len(tried) < len(self.hosts)
+
+    def check_health(self, host: OllamaHost) -> bool:
+        try:
+            response = httpx.get(
+                f"{host.url}/api/version", timeout=self._settings.health_check_timeout_seconds
+            )
+            response.raise_for_status()
+        except Exception as e:
+            with self._lock:
+                if host.healthy:
+                    logger.warning(f"⚠️ Ollama实例 {host.name} 健康检查失败，暂停路由：{str(e)}")
+                host.healthy = False
+                host.last_error = str(e)
+            return False
+        with self._lock:
+            if not host.healthy:
+                logger.info(f"✅ Ollama实例 {host.name} 健康检查恢复")
+            host.healthy = True
+            # 摘除结束后稳定运行一段时间才重置翻倍计数，反复故障的实例摘除时间逐次变长
+            if time.monotonic() >= host.ejected_until + self._settings.max_eject_seconds:
+                host.ejections = 0
+        return True
+
+    def stats(self) -> OllamaPoolStats:
+        now = time.monotonic()
+        with self._lock:
+            return OllamaPoolStats(
+                hosts=[
+                    OllamaHostStats(
+                        name=host.name,
+                        weight=host.weight,
+                        available=host.available(now),
+                        healthy=host.healthy,
+                        provisioned=host.provisioned,
+                        outstanding=host.outstanding,
+                        requests=host.requests,
+                        failures=host.failures,
+                        ejected_for_seconds=max(0.0, host.ejected_until - now),
+                        last_error=host.last_error,
+                    )
+                    for host in self.hosts
+                ],
+                sticky_routes=self._sticky_routes,
+                sticky_overflows=self._sticky_overflows,
+                panic_routes=self._panic_routes,
+            )
+
+    def _acquire(self, route_key: str | None, exclude: Sequence[str]) -> OllamaHost:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [h for h in self.hosts if h.name not in exclude and h.available(now)]
+            if not candidates:
+                candidates = [h for h in self.hosts if h.name not in exclude]
+                self._panic_routes += 1
+            host = self._pick_locked(candidates, route_key)
+            host.outstanding += 1
+            host.requests += 1
+            return host
+
+    def _pick_locked(self, candidates: list[OllamaHost], route_key: str | None) -> OllamaHost:
+        least = min(candidates, key=lambda h: (h.load(), h.requests / h.weight))
+        if route_key is None or not self._settings.sticky or len(candidates) == 1:
+            return least
+        preferred = max(candidates, key=lambda h: self._rendezvous_score(route_key, h))
+        if preferred.load() - least.load() > self._settings.sticky_max_imbalance:
+            self._sticky_overflows += 1
+            return least
+        self._sticky_routes += 1
+        return preferred
+
+    @staticmethod
+    def _rendezvous_score(route_key: str, host: OllamaHost) -> float:
+        # 加权rendezvous哈希：实例增减时只有落在该实例上的会话需要迁移
+        digest = hashlib.sha1(f"{route_key}\x00{host.name}".encode("utf-8")).digest()
+        unit = (int.from_bytes(digest[:8], "big") + 1) / (2**64 + 1)
+        return -host.weight / math.log(unit)
+
+    def _release(self, host: OllamaHost, error: BaseException | None) -> None:
+        with self._lock:
+            host.outstanding -= 1
+            if error is None or not is_host_failure(error):
+                host.consecutive_failures = 0
+                return
+            host.failures += 1
+            host.consecutive_failures += 1
+            host.last_error = str(error) or type(error).__name__
+            if host.consecutive_failures < self._settings.eject_after_failures:
+                return
+            eject_seconds = min(
+                self._settings.eject_seconds * 2**host.ejections, self._settings.max_eject_seconds
+            )
+            host.ejections += 1
+            host.consecutive_failures = 0
+            host.ejected_until = time.monotonic() + eject_seconds
+        logger.warning(
+            f"⚠️ Ollama实例 {host.name} 连续失败 {self._settings.eject_after_failures} 次，"
+            f"摘除 {eject_seconds:.0f}s：{host.last_error}"
+        )
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self._settings.health_check_interval_seconds):
+            for host in self.hosts:
+                self.check_health(host)
+
+
+def _detached_copy(llm: LLM) -> LLM:
+    """
+    model_copy是浅复制，会带上原实例已创建的客户端（Ollama的异步客户端绑定首次使用它的事件循环）；
+    副本清空客户端，首次使用时各自创建
+    """
+    copied = llm.model_copy()
+    private = copied.__pydantic_private__ or {}
+    for attr in ("_client", "_async_client"):
+        if attr in private:
+            setattr(copied, attr, None)
+    return copied
+
+
+class PooledOllama(LLM):
+    """
+    把多个Ollama实例（每个实例一个同参数的Ollama LLM）包装成一个LLM：
+    每次调用由OllamaPool选择实例，连接失败（请求未发出、流式尚未产出内容）时换下一个实例重试
+    """
+
+    _pool: OllamaPool = PrivateAttr()
+    _llms: dict[str, LLM] = PrivateAttr()
+
+    def __init__(self, pool: OllamaPool, llms: dict[str, LLM]) -> None:
+        first = next(iter(llms.values()))
+        super().__init__(
+            callback_manager=first.callback_manager,
+            system_prompt=first.system_prompt,
+            messages_to_prompt=first.messages_to_prompt,
+            completion_to_prompt=first.completion_to_prompt,
+            output_parser=first.output_parser,
+            pydantic_program_mode=first.pydantic_program_mode,
+            query_wrapper_prompt=first.query_wrapper_prompt,
+        )
+        self._pool = pool
+        self._llms = llms
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PooledOllama"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return next(iter(self._llms.values())).metadata
+
+    @property
+    def llms(self) -> dict[str, LLM]:
+        return self._llms
+
+    def model_copy(self, **kwargs: Any) -> "PooledOllama":
+        # 各实例的LLM也各自复制一份（独立的异步客户端），路由状态仍共用同一个池
+        copied = super().model_copy(**kwargs)
+        copied._llms = {name: _detached_copy(llm) for name, llm in self._llms.items()}
+        return copied
+
+    def _routed(self, call: Callable[[LLM], T]) -> T:
+        route_key = ollama_route_key.get()
+        tried: list[str] = []
+        while True:
+            try:
+                with self._pool.lease(route_key, tried) as host:
+                    tried.append(host.name)
+                    return call(self._llms[host.name])
+            except Exception as e:
+                if not self._pool.should_retry(e, tried):
+                    raise
+                logger.warning(f"⚠️ Ollama实例 {tried[-1]} 连接失败，改用其他实例：{str(e)}")
+
+    async def _arouted(self, call: Callable[[LLM], Awaitable[T]]) -> T:
+        route_key = ollama_route_key.get()
+        tried: list[str] = []
+        while True:
+            try:
+                with self._pool.lease(route_key, tried) as host:
+                    tried.append(host.name)
+                    return await call(self._llms[host.name])
+            except Exception as e:
+                if not self._pool.should_retry(e, tried):
+                    raise
+                logger.warning(f"⚠️ Ollama实例 {tried[-1]} 连接失败，改用其他实例：{str(e)}")
+
+    def _routed_stream(self, call: Callable[[LLM], Iterator[T]]) -> Iterator[T]:
+        route_key = ollama_route_key.get()
+        tried: list[str] = []
+        while True:
+            started = False
+            try:
+                with self._pool.lease(route_key, tried) as host:
+                    tried.append(host.name)
+                    for item in call(self._llms[host.name]):
+                        started = True
+                        yield item
+                return
+            except Exception as e:
+                if started or not self._pool.should_retry(e, tried):
+                    raise
+                logger.warning(f"⚠️ Ollama实例 {tried[-1]} 连接失败，改用其他实例：{str(e)}")
+
+    async def _arouted_stream(
+        self, call: Callable[[LLM], Awaitable[AsyncIterator[T]]]
+    ) -> AsyncIterator[T]:
+        route_key = ollama_route_key.get()
+        tried: list[str] = []
+        while True:
+            started = False
+            try:
+                with self._pool.lease(route_key, tried) as host:
+                    tried.append(host.name)
+                    async for item in await call(self._llms[host.name]):
+                        started = True
+                        yield item
+                return
+            except Exception as e:
+                if started or not self._pool.should_retry(e, tried):
+                    raise
+                logger.warning(f"⚠️ Ollama实例 {tried[-1]} 连接失败，改用其他实例：{str(e)}")
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._routed(lambda llm: llm.chat(messages, **kwargs))
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._routed(lambda llm: llm.complete(prompt, formatted=formatted, **kwargs))
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self._routed_stream(lambda llm: llm.stream_chat(messages, **kwargs))
+
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        return self._routed_stream(
+            lambda llm: llm.stream_complete(prompt, formatted=formatted, **kwargs)
+        )
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._arouted(lambda llm: llm.achat(messages, **kwargs))
+
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        return await self._arouted(lambda llm: llm.acomplete(prompt, formatted=formatted, **kwargs))
+
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        return self._arouted_stream(lambda llm: llm.astream_chat(messages, **kwargs))
+
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        return self._arouted_stream(
+            lambda llm: llm.astream_complete(prompt, formatted=formatted, **kwargs)
+        )
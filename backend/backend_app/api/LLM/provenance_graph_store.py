@@ -0,0 +1,149 @@
+import logging
+import threading
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from llama_index.graph_stores.neo4j import Neo4jGraphStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TripletSource:
+    """一条三元组及其来源（文档ID + 块ID）"""
+    subj: str
+    rel: str
+    obj: str
+    doc_id: str
+    chunk_id: str
+
+
+def _rel_type(rel: str) -> str:
+    # 与 Neo4jGraphStore.upsert_triplet 的关系类型命名保持一致
+    return rel.replace(" ", "_").replace("`", "").upper()
+
+
+def _append_unique(var: str, prop: str, value: str) -> str:
+    return (
+        f"{var}.{prop} = CASE WHEN {value} IN coalesce({var}.{prop}, []) "
+        f"THEN {var}.{prop} ELSE coalesce({var}.{prop}, []) + {value} END"
+    )
+
+
+class ProvenanceNeo4jGraphStore(Neo4jGraphStore):
+    """
+    带来源信息的Neo4j图谱存储：
+    - 关系上记录 doc_ids / chunk_ids，实体上记录 doc_ids（引用它的文档）
+    - 三元组按关系类型分组，用 UNWIND 批量写入
+    - 删除文档时只按实体ID（唯一约束索引）定位其三元组，移除该文档的引用；
+      关系在最后一个来源消失时删除，实体在没有文档引用且没有关系时删除
+    """
+
+    _suppress_upserts: bool = False
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._local = threading.local()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def _timeout(self) -> float | None:
+        # 基类的query()按该值设置事务超时；当前线程设置过query_timeout时以其为准
+        return getattr(self._local, "timeout", self._default_timeout)
+
+    @_timeout.setter
+    def _timeout(self, value: float | None) -> None:
+        self._default_timeout = value
+
+    @contextmanager
+    def query_timeout(self, seconds: float | None) -> Iterator[None]:
+        """
+        当前线程内的查询使用该事务超时（由Neo4j服务端终止超时的查询），
+        只用于对话路径的KG检索；摄入写入和清空图谱不受影响
+        """
+        self._local.timeout = seconds
+        try:
+            yield
+        finally:
+            del self._local.timeout
+
+    @contextmanager
+    def suppress_triplet_upserts(self) -> Iterator[None]:
+        """三元组已由调用方批量写入（含来源），索引构建期间跳过逐条写入"""
+        self._suppress_upserts = True
+        try:
+            yield
+        finally:
+            self._suppress_upserts = False
+
+    def upsert_triplet(self, subj: str, rel: str, obj: str) -> None:
+        if self._suppress_upserts:
+            return
+        super().upsert_triplet(subj, rel, obj)
+
+    def upsert_triplets_with_sources(self, sources: list[TripletSource]) -> None:
+        rows_by_rel: dict[str, list[dict[str, str]]] = defaultdict(list)
+        for source in sources:
+            rows_by_rel[_rel_type(source.rel)].append(
+                {
+                    "subj": source.subj,
+                    "obj": source.obj,
+                    "doc_id": source.doc_id,
+                    "chunk_id": source.chunk_id,
+                }
+            )
+        for rel_type, rows in rows_by_rel.items():
+            self.query(
+                f"""
+                UNWIND $rows AS row
+                MERGE (s:`{self.node_label}` {{id: row.subj}})
+                MERGE (o:`{self.node_label}` {{id: row.obj}})
+                MERGE (s)-[r:`{rel_type}`]->(o)
+                SET {_append_unique("s", "doc_ids", "row.doc_id")},
+                    {_append_unique("o", "doc_ids", "row.doc_id")},
+                    {_append_unique("r", "doc_ids", "row.doc_id")},
+                    {_append_unique("r", "chunk_ids", "row.chunk_id")}
+                """,
+                {"rows": rows},
+            )
+        logger.info(f"批量写入 {len(sources)} 条三元组（{len(rows_by_rel)} 种关系）")
+
+    def delete_doc_triplets(self, doc_id: str, sources: list[TripletSource]) -> None:
+        chunk_ids_by_triplet: dict[tuple[str, str, str], set[str]] = defaultdict(set)
+        entities: set[str] = set()
+        for source in sources:
+            chunk_ids_by_triplet[(source.subj, _rel_type(source.rel), source.obj)].add(
+                source.chunk_id
+            )
+            entities.update((source.subj, source.obj))
+
+        rows = [
+            {"subj": subj, "rel_type": rel_type, "obj": obj, "chunk_ids": sorted(chunk_ids)}
+            for (subj, rel_type, obj), chunk_ids in chunk_ids_by_triplet.items()
+        ]
+        self.query(
+            f"""
+            UNWIND $rows AS row
+            MATCH (s:`{self.node_label}` {{id: row.subj}})-[r]->(o:`{self.node_label}` {{id: row.obj}})
+            WHERE type(r) = row.rel_type AND r.doc_ids IS NOT NULL
+            SET r.doc_ids = [d IN r.doc_ids WHERE d <> $doc_id],
+                r.chunk_ids = [c IN coalesce(r.chunk_ids, []) WHERE NOT c IN row.chunk_ids]
+            WITH DISTINCT r
+            WHERE size(r.doc_ids) = 0
+            DELETE r
+            """,
+            {"rows": rows, "doc_id": doc_id},
+        )
+        self.query(
+            f"""
+            UNWIND $entities AS entity_id
+            MATCH (n:`{self.node_label}` {{id: entity_id}})
+            SET n.doc_ids = [d IN coalesce(n.doc_ids, []) WHERE d <> $doc_id]
+            WITH n
+            WHERE size(n.doc_ids) = 0 AND NOT EXISTS {{ (n)--() }}
+            DELETE n
+            """,
+            {"entities": sorted(entities), "doc_id": doc_id},
+        )
+        logger.info(f"已移除文档 {doc_id} 的 {len(rows)} 条三元组来源（涉及 {len(entities)} 个实体）")
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any
+
+from injector import singleton
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import infer_torch_device
+
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 与 SentenceTransformerRerank 保持一致
+CROSS_ENCODER_MAX_LENGTH = 512
+
+
+@dataclass
+class _RerankRequest:
+    pairs: list[tuple[str, str]]
+    future: Future[list[float]] = field(default_factory=Future)
+
+
+class _RerankBatcher:
+    """
+    微批处理：后台线程从队列取出第一个请求后，在 max_wait 内继续收集其他并发请求的
+    (问题, 段落) 对，凑满 max_batch_size 或等待超时即合并成一次 predict
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[list[tuple[str, str]]], list[float]],
+        max_batch_size: int,
+        max_wait_seconds: float,
+    ) -> None:
+        self._predict = predict
+        self._max_batch_size = max_batch_size
+        self._max_wait_seconds = max_wait_seconds
+        self._queue: queue.Queue[_RerankRequest] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._thread.start()
+
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        request = _RerankRequest(pairs)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self) -> list[_RerankRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].pairs)
+        deadline = time.monotonic() + self._max_wait_seconds
+        while size < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            pairs = [pair for request in batch for pair in request.pairs]
+            try:
+                scores = self._predict(pairs)
+            except Exception as e:
+                logger.error(f"❌ 重排序批量打分失败：{str(e)}", exc_info=True)
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            if len(batch) > 1:
+                logger.debug(f"重排序微批：合并 {len(batch)} 个请求，共 {len(pairs)} 对")
+            offset = 0
+            for request in batch:
+                request.future.set_result(scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
+
+
+class _ScoreLRU:
+    """(问题, 段落哈希) -> 分数 的有界LRU"""
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[tuple[str, str]]) -> list[float | None]:
+        with self._lock:
+            scores: list[float | None] = []
+            for key in keys:
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                scores.append(score)
+            return scores
+
+    def put_many(self, items: list[tuple[tuple[str, str], float]]) -> None:
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            for key, score in items:
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+def _passage_hash(passage: str) -> str:
+    return hashlib.sha1(passage.encode("utf-8")).hexdigest()
+
+
+@singleton
+class RerankComponent:
+    """
+    常驻的交叉编码器重排序组件：
+    1. 模型只在启动时加载一次（rag.rerank.enabled 关闭时不加载）
+    2. 并发请求的 (问题, 段落) 对由后台线程合并成微批统一打分
+    3. 分数按 (问题, 段落哈希) 缓存，重复检索到的段落不再过模型
+    4. 候选数不超过 top_n 时跳过重排序，保持检索顺序
+    """
+
+    def __init__(self) -> None:
+        self._settings = settings().rag.rerank
+        self._model: Any = None
+        self._batcher: _RerankBatcher | None = None
+        self._scores = _ScoreLRU(self._settings.score_cache_size)
+        if not self._settings.enabled:
+            return
+
+        try:
+            from sentence_transformers import CrossEncoder  # type: ignore
+        except ImportError as e:
+            raise ImportError(
+                "Rerank dependencies not found, install with `pip install torch sentence-transformers`"
+            ) from e
+
+        print(f"Initializing the rerank model {self._settings.model}")
+        self._model = CrossEncoder(
+            self._settings.model,
+            max_length=CROSS_ENCODER_MAX_LENGTH,
+            device=infer_torch_device(),
+        )
+        self._batcher = _RerankBatcher(
+            self._predict,
+            max_batch_size=self._settings.max_batch_size,
+            max_wait_seconds=self._settings.max_batch_wait_ms / 1000,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._batcher is not None
+
+    def _predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        scores = self._model.predict(
+            pairs, batch_size=self._settings.max_batch_size, show_progress_bar=False
+        )
+        return [float(score) for score in scores]
+
+    def score(self, query: str, passages: list[str]) -> list[float]:
+        """先查分数缓存，只把未命中的段落交给微批打分"""
+        assert self._batcher is not None, "重排序未启用（rag.rerank.enabled=false）"
+        keys = [(query, _passage_hash(passage)) for passage in passages]
+        scores = self._scores.get_many(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            computed = self._batcher.score([(query, passages[i]) for i in missing])
+            for i, score in zip(missing, computed):
+                scores[i] = score
+            self._scores.put_many([(keys[i], scores[i]) for i in missing])
+        return scores  # type: ignore[return-value]
+
+    def rerank(
+        self, query: str, nodes: list[NodeWithScore], top_n: int | None = None
+    ) -> list[NodeWithScore]:
+        top_n = top_n or self._settings.top_n
+        if len(nodes) <= top_n:
+            return nodes
+        passages = [node.node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        for node, score in zip(nodes, self.score(query, passages)):
+            node.score = score
+        return sorted(nodes, key=lambda node: -(node.score or 0))[:top_n]
+
+    def postprocessor(self, top_n: int | None = None) -> "RerankPostprocessor":
+        return RerankPostprocessor(self, top_n=top_n or self._settings.top_n)
+
+
+class RerankPostprocessor(BaseNodePostprocessor):
+    """把共享的 RerankComponent 接入检索后处理链，本身不持有模型"""
+
+    top_n: int
+    _component: RerankComponent = PrivateAttr()
+
+    def __init__(self, component: RerankComponent, top_n: int) -> None:
+        super().__init__(top_n=top_n)
+        self._component = component
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RerankPostprocessor"
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        return self._component.rerank(query_bundle.query_str, nodes, self.top_n)
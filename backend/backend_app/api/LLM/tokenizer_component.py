@@ -0,0 +1,48 @@
+import logging
+from collections.abc import Callable
+from functools import partial
+
+from injector import singleton
+from llama_index.core.utils import get_tokenizer
+
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 未配置模型分词器时的近似分词器
+FALLBACK_TOKENIZER_NAME = "tiktoken:cl100k_base"
+
+
+@singleton
+class TokenizerComponent:
+    """
+    提示词token计数用的分词器（与Ollama实际加载的模型对齐）：
+    1. 配置 ollama.tokenizer（HF模型名或本地目录，如 meta-llama/Llama-3.2-3B-Instruct）时用 transformers 加载模型自带分词器
+    2. 未配置或加载失败时退回 tiktoken cl100k：Llama 3 词表在其基础上扩充了多语言token，
+       同一段中文的cl100k计数偏多，按它做预算只会更保守
+    """
+
+    tokenizer: Callable[[str], list]
+    name: str
+
+    def __init__(self) -> None:
+        self.tokenizer = get_tokenizer()
+        self.name = FALLBACK_TOKENIZER_NAME
+
+        tokenizer_name = settings().ollama.tokenizer
+        if not tokenizer_name:
+            logger.info(f"未配置模型分词器，提示词预算使用 {self.name} 近似计数")
+            return
+        try:
+            from transformers import AutoTokenizer  # type: ignore
+
+            hf_tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        except Exception as e:
+            logger.warning(f"⚠️ 加载模型分词器 {tokenizer_name} 失败，退回 {self.name} 近似计数：{str(e)}")
+            return
+        self.tokenizer = partial(hf_tokenizer.encode, add_special_tokens=False)
+        self.name = tokenizer_name
+        logger.info(f"✅ 提示词预算使用模型分词器：{tokenizer_name}")
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer(text)) if text else 0
@@ -2,6 +2,8 @@
 import typing
 from injector import singleton
 from llama_index.core.indices.vector_store import VectorIndexRetriever, VectorStoreIndex
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
 from llama_index.core.vector_stores.types import (
     BasePydanticVectorStore,
     FilterCondition,
@@ -83,6 +85,62 @@ class VectorStoreComponent:
             ),
         )
 
+    def batch_search(
+        self,
+        query_embeddings: list[list[float]],
+        context_filter: ContextFilter | None = None,
+        similarity_top_k: int = 2,
+    ) -> list[list[NodeWithScore]]:
+        """多条已嵌入的查询合并成一次Qdrant批量检索（query_batch_points），按查询顺序返回结果"""
+        from qdrant_client import models  # type: ignore
+
+        if not query_embeddings:
+            return []
+        client = self.vector_store.client
+        collection_name = self.vector_store.collection_name
+        if not client.collection_exists(collection_name):
+            # 尚未摄入任何文档
+            return [[] for _ in query_embeddings]
+
+        query_filter = None
+        if context_filter is not None and context_filter.docs_ids is not None:
+            query_filter = models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key="doc_id", match=models.MatchAny(any=context_filter.docs_ids)
+                    )
+                ]
+            )
+        vector_name = self._dense_vector_name(collection_name)
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=embedding,
+                    using=vector_name,
+                    filter=query_filter,
+                    limit=similarity_top_k,
+                    with_payload=True,
+                )
+                for embedding in query_embeddings
+            ],
+        )
+        return [
+            [
+                NodeWithScore(node=metadata_dict_to_node(point.payload), score=point.score)
+                for point in response.points
+            ]
+            for response in responses
+        ]
+
+    def _dense_vector_name(self, collection_name: str) -> str | None:
+        """集合使用命名向量时返回稠密向量名，旧格式（未命名向量）返回None"""
+        vectors = self.vector_store.client.get_collection(collection_name).config.params.vectors
+        if not isinstance(vectors, dict):
+            return None
+        dense_name = getattr(self.vector_store, "dense_vector_name", None)
+        return dense_name if dense_name in vectors else next(iter(vectors))
+
     def close(self) -> None:
         if hasattr(self.vector_store.client, "close"):
             self.vector_store.client.close()
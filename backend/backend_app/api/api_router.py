@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from backend_app.api.llm_api.chat.chat_completions import chat_router
+from backend_app.api.llm_api.chunks.chunks_router import chunks_router
 from backend_app.api.llm_api.ingest.ingest_router import ingest_router
 from backend_app.api.llm_api.meta.meta_router import meta_router
 
@@ -8,6 +9,7 @@ api_router = APIRouter()
 
 api_router.include_router(chat_router, prefix="/chat",tags=["chat"])
 api_router.include_router(ingest_router, prefix="/ingest", tags=["ingest"])
+api_router.include_router(chunks_router, prefix="/chunks", tags=["chunks"])
 api_router.include_router(meta_router, prefix="/meta", tags=["meta"])
 #api_router.include_router(health.router, prefix="/health", tags=["health"])
 #api_router.include_router(meta.router, prefix="/meta", tags=["meta"])
@@ -0,0 +1,115 @@
+import logging
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+
+from backend_app.api.llm_api.ingest.model import IngestedDoc
+
+logger = logging.getLogger(__name__)
+
+
+def doc_file_name(doc: IngestedDoc) -> str:
+    metadata = doc.doc_metadata or {}
+    return str(metadata.get("file_name") or metadata.get("original_file_name") or "")
+
+
+def doc_file_type(doc: IngestedDoc) -> str:
+    """文件类型取扩展名（小写、不带点），如 pdf / docx / txt"""
+    return Path(doc_file_name(doc)).suffix.lstrip(".").lower()
+
+
+@dataclass
+class CatalogPage:
+    docs: list[IngestedDoc]
+    # 满足过滤条件的文档总数（未过滤时即全量文档数）
+    total: int
+
+
+class DocumentCatalog:
+    """
+    内存文档目录：首次访问时从docstore加载一次，之后随摄入/删除增量维护，
+    列表查询不再遍历docstore。按文件类型维护计数，未按文件名过滤时总数为O(1)。
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Iterable[IngestedDoc]]) -> None:
+        self._name = name
+        self._loader = loader
+        self._docs: dict[str, IngestedDoc] | None = None
+        self._type_counts: Counter[str] = Counter()
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self) -> dict[str, IngestedDoc]:
+        with self._lock:
+            if self._docs is None:
+                self._docs = {}
+                self._type_counts.clear()
+                for doc in self._loader():
+                    self._add(doc)
+                logger.info(f"{self._name} 文档目录加载完成：{len(self._docs)} 个文档")
+            return self._docs
+
+    def _add(self, doc: IngestedDoc) -> None:
+        assert self._docs is not None
+        previous = self._docs.pop(doc.doc_id, None)
+        if previous is not None:
+            self._type_counts[doc_file_type(previous)] -= 1
+        self._docs[doc.doc_id] = doc
+        self._type_counts[doc_file_type(doc)] += 1
+
+    def add(self, docs: Iterable[IngestedDoc]) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            for doc in docs:
+                self._add(doc)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            docs = self._ensure_loaded()
+            doc = docs.pop(doc_id, None)
+            if doc is not None:
+                self._type_counts[doc_file_type(doc)] -= 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._docs = {}
+            self._type_counts.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ensure_loaded())
+
+    def all(self) -> list[IngestedDoc]:
+        with self._lock:
+            return list(self._ensure_loaded().values())
+
+    def page(
+        self,
+        offset: int = 0,
+        limit: int | None = None,
+        file_name: str | None = None,
+        file_type: str | None = None,
+    ) -> CatalogPage:
+        """按摄入顺序分页；file_name 为不区分大小写的子串匹配，file_type 为扩展名"""
+        file_type = file_type.lstrip(".").lower() if file_type else None
+        name_filter = file_name.lower() if file_name else None
+        stop = None if limit is None else offset + limit
+        with self._lock:
+            docs = self._ensure_loaded()
+            if name_filter is None and file_type is None:
+                return CatalogPage(
+                    docs=list(islice(docs.values(), offset, stop)), total=len(docs)
+                )
+            if name_filter is None:
+                total = self._type_counts[file_type]
+                matches = (doc for doc in docs.values() if doc_file_type(doc) == file_type)
+                return CatalogPage(docs=list(islice(matches, offset, stop)), total=total)
+            matched = [
+                doc
+                for doc in docs.values()
+                if name_filter in doc_file_name(doc).lower()
+                and (file_type is None or doc_file_type(doc) == file_type)
+            ]
+            return CatalogPage(docs=matched[offset:stop], total=len(matched))
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from injector import singleton
+from pydantic import BaseModel, Field
+
+from backend_app.api.LLM.log_structured_kvstore import LogStructuredKVStore
+from backend_app.constants import get_local_data_path
+
+logger = logging.getLogger(__name__)
+
+HASH_INDEX_FNAME = "ingest_hash_index.json"
+# 向量RAG与KG-RAG各自维护一份哈希映射，互不干扰
+VECTOR_NAMESPACE = "vector"
+KG_NAMESPACE = "kg"
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestDedupStats(BaseModel):
+    """一次摄入中去重节省的工作量"""
+    file_hash: str = Field(examples=["9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"])
+    duplicate_file: bool = Field(default=False, description="文件内容此前已摄入，直接复用已有doc_id")
+    chunks_total: int = 0
+    chunks_reused: int = Field(default=0, description="文件内已存在相同内容、复用嵌入的块数量")
+    embeddings_saved: int = 0
+    llm_calls_saved: int = 0
+
+
+@singleton
+class IngestHashIndexComponent:
+    """
+    持久化的内容哈希索引（基于WAL的KV存储）：
+    - <namespace>/file:  文件哈希 -> doc_ids
+    - <namespace>/doc:   doc_id -> 文件哈希（删除文档时反查）
+    - <namespace>/chunk: 块文本哈希 -> 最近一次写入的node_id
+    """
+
+    def __init__(self) -> None:
+        persist_path = Path(get_local_data_path()) / HASH_INDEX_FNAME
+        self._persist_path = str(persist_path)
+        self._kvstore = LogStructuredKVStore.from_persist_path(self._persist_path)
+        self._lock = threading.Lock()
+
+    def get_file_doc_ids(self, namespace: str, file_hash: str) -> list[str] | None:
+        entry = self._kvstore.get(file_hash, collection=f"{namespace}/file")
+        return entry["doc_ids"] if entry else None
+
+    def add_file(
+        self, namespace: str, file_hash: str, file_name: str, doc_ids: list[str]
+    ) -> None:
+        with self._lock:
+            self._kvstore.put(
+                file_hash,
+                {"file_name": file_name, "doc_ids": doc_ids},
+                collection=f"{namespace}/file",
+            )
+            for doc_id in doc_ids:
+                self._kvstore.put(
+                    doc_id, {"file_hash": file_hash}, collection=f"{namespace}/doc"
+                )
+
+    def remove_doc(self, namespace: str, doc_id: str) -> None:
+        """文档被删除后，其所属文件不再完整，移除整条文件记录"""
+        with self._lock:
+            entry = self._kvstore.get(doc_id, collection=f"{namespace}/doc")
+            if entry is None:
+                return
+            file_hash = entry["file_hash"]
+            file_entry = self._kvstore.get(file_hash, collection=f"{namespace}/file")
+            for file_doc_id in (file_entry or {}).get("doc_ids", [doc_id]):
+                self._kvstore.delete(file_doc_id, collection=f"{namespace}/doc")
+            self._kvstore.delete(file_hash, collection=f"{namespace}/file")
+
+    def get_chunk_node_ids(
+        self, namespace: str, chunk_hashes: list[str]
+    ) -> dict[str, str]:
+        found: dict[str, str] = {}
+        for chunk_hash in chunk_hashes:
+            entry = self._kvstore.get(chunk_hash, collection=f"{namespace}/chunk")
+            if entry is not None:
+                found[chunk_hash] = entry["node_id"]
+        return found
+
+    def add_chunks(self, namespace: str, chunk_node_ids: dict[str, str]) -> None:
+        with self._lock:
+            for chunk_hash, node_id in chunk_node_ids.items():
+                self._kvstore.put(
+                    chunk_hash, {"node_id": node_id}, collection=f"{namespace}/chunk"
+                )
+
+    def persist(self) -> None:
+        self._kvstore.persist(self._persist_path)
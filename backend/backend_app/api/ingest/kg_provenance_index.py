@@ -0,0 +1,66 @@
+import logging
+import threading
+from pathlib import Path
+
+from injector import singleton
+
+from backend_app.api.LLM.log_structured_kvstore import LogStructuredKVStore
+from backend_app.api.LLM.provenance_graph_store import TripletSource
+from backend_app.constants import get_local_data_path
+
+logger = logging.getLogger(__name__)
+
+PROVENANCE_INDEX_FNAME = "kg_provenance_index.json"
+DOC_COLLECTION = "doc"
+
+
+@singleton
+class KGProvenanceIndexComponent:
+    """
+    KG文档来源索引（基于WAL的KV存储）：doc_id -> 该文档写入Neo4j的三元组及所在块。
+    删除文档时据此精确定位要移除的三元组，无需扫描整个图谱。
+    """
+
+    def __init__(self) -> None:
+        self._persist_path = str(Path(get_local_data_path()) / PROVENANCE_INDEX_FNAME)
+        self._kvstore = LogStructuredKVStore.from_persist_path(self._persist_path)
+        self._lock = threading.Lock()
+
+    def add_sources(self, sources: list[TripletSource]) -> None:
+        sources_by_doc: dict[str, list[TripletSource]] = {}
+        for source in sources:
+            sources_by_doc.setdefault(source.doc_id, []).append(source)
+        with self._lock:
+            for doc_id, doc_sources in sources_by_doc.items():
+                existing = self.get_sources(doc_id)
+                self._kvstore.put(
+                    doc_id,
+                    {
+                        "triplets": [
+                            [s.subj, s.rel, s.obj, s.chunk_id]
+                            for s in existing + doc_sources
+                        ]
+                    },
+                    collection=DOC_COLLECTION,
+                )
+
+    def get_sources(self, doc_id: str) -> list[TripletSource]:
+        entry = self._kvstore.get(doc_id, collection=DOC_COLLECTION)
+        if entry is None:
+            return []
+        return [
+            TripletSource(subj=subj, rel=rel, obj=obj, doc_id=doc_id, chunk_id=chunk_id)
+            for subj, rel, obj, chunk_id in entry["triplets"]
+        ]
+
+    def remove_doc(self, doc_id: str) -> None:
+        with self._lock:
+            self._kvstore.delete(doc_id, collection=DOC_COLLECTION)
+
+    def clear(self) -> None:
+        with self._lock:
+            for doc_id in list(self._kvstore.get_all(collection=DOC_COLLECTION)):
+                self._kvstore.delete(doc_id, collection=DOC_COLLECTION)
+
+    def persist(self) -> None:
+        self._kvstore.persist(self._persist_path)
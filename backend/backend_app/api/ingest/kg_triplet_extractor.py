@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from injector import inject, singleton
+from llama_index.core.indices.knowledge_graph import KnowledgeGraphIndex
+from llama_index.core.prompts import BasePromptTemplate
+
+from backend_app.api.ingest.ingest_hash_index import hash_text
+from backend_app.api.LLM.llm_component import LLMComponent
+from backend_app.api.LLM.log_structured_kvstore import LogStructuredKVStore
+from backend_app.api.settings.settings import settings
+from backend_app.constants import get_local_data_path
+
+logger = logging.getLogger(__name__)
+
+Triplet = tuple[str, str, str]
+
+TRIPLET_CACHE_FNAME = "kg_triplet_cache.json"
+TRIPLET_CACHE_COLLECTION = "triplets"
+
+
+@dataclass
+class TripletExtractionStats:
+    """一次三元组提取的吞吐统计"""
+    chunks: int = 0
+    triplets: int = 0
+    cache_hits: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def triplets_per_sec(self) -> float:
+        return self.triplets / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+@singleton
+class KGTripletExtractorComponent:
+    """
+    并发三元组提取：
+    1. 所有块的提取请求通过异步Ollama客户端并发发出，同时在途的请求数不超过 triplet_extract_max_inflight
+    2. 结果按块的原始顺序返回，由调用方按顺序写入Neo4j
+    3. 异步请求运行在组件自己的常驻事件循环上（异步客户端绑定创建它的事件循环）
+    4. 提取结果持久化缓存（键：块文本哈希+提示模板哈希+模型名+每块最大三元组数），
+       重建图谱时直接重放，不再调用LLM
+    """
+
+    @inject
+    def __init__(self, llm_component: LLMComponent) -> None:
+        # 独立副本：不带对话已创建的客户端（见PooledOllama.model_copy），其异步客户端只在本组件的事件循环中创建和使用
+        self._llm = llm_component.background_llm()
+        self._max_inflight = max(1, settings().neo4j.triplet_extract_max_inflight)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+
+        self._cache: LogStructuredKVStore | None = None
+        if settings().neo4j.triplet_cache:
+            self._cache_path = str(Path(get_local_data_path()) / TRIPLET_CACHE_FNAME)
+            self._cache = LogStructuredKVStore.from_persist_path(self._cache_path)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="kg-triplet-extractor", daemon=True
+                ).start()
+                self._loop = loop
+        return self._loop
+
+    def extract(
+        self,
+        texts: list[str],
+        template: BasePromptTemplate,
+        max_triplets_per_chunk: int,
+        max_object_length: int = 128,
+        stats: TripletExtractionStats | None = None,
+    ) -> list[list[Triplet]]:
+        """提取每段文本的三元组，返回顺序与texts一致；任一请求失败则取消其余请求并抛出异常"""
+        if not texts:
+            return []
+        start = time.perf_counter()
+        cache_keys = self._cache_keys(texts, template, max_triplets_per_chunk)
+        results: list[list[Triplet] | None] = [self._cache_get(key) for key in cache_keys]
+        missing = [i for i, triplets in enumerate(results) if triplets is None]
+
+        if missing:
+            future = asyncio.run_coroutine_threadsafe(
+                self._aextract_all([texts[i] for i in missing], template, max_object_length),
+                self._get_loop(),
+            )
+            for i, triplets in zip(missing, future.result()):
+                results[i] = triplets
+            self._cache_put({cache_keys[i]: results[i] for i in missing})
+
+        elapsed = time.perf_counter() - start
+        triplet_count = sum(len(triplets) for triplets in results)
+        cache_hits = len(texts) - len(missing)
+        if stats is not None:
+            stats.chunks += len(texts)
+            stats.triplets += triplet_count
+            stats.cache_hits += cache_hits
+            stats.elapsed_seconds += elapsed
+        logger.info(
+            f"三元组提取完成：{len(texts)} 个块（缓存命中 {cache_hits}），{triplet_count} 个三元组，"
+            f"耗时 {elapsed:.2f}s，{triplet_count / elapsed if elapsed > 0 else 0.0:.2f} triples/s"
+            f"（并发上限 {self._max_inflight}）"
+        )
+        return results
+
+    # ====================== 持久化缓存 ======================
+    def _cache_keys(
+        self, texts: list[str], template: BasePromptTemplate, max_triplets_per_chunk: int
+    ) -> list[str]:
+        # 模板、模型或每块三元组上限任一变化，旧缓存自然失效
+        prefix = hash_text(
+            f"{template.get_template()}\n{self._llm.metadata.model_name}\n{max_triplets_per_chunk}"
+        )
+        return [f"{prefix}:{hash_text(text)}" for text in texts]
+
+    def _cache_get(self, key: str) -> list[Triplet] | None:
+        if self._cache is None:
+            return None
+        entry = self._cache.get(key, collection=TRIPLET_CACHE_COLLECTION)
+        if entry is None:
+            return None
+        return [tuple(triplet) for triplet in entry["triplets"]]
+
+    def _cache_put(self, entries: dict[str, list[Triplet]]) -> None:
+        if self._cache is None or not entries:
+            return
+        for key, triplets in entries.items():
+            self._cache.put(
+                key,
+                {"triplets": [list(triplet) for triplet in triplets]},
+                collection=TRIPLET_CACHE_COLLECTION,
+            )
+        self._cache.persist(self._cache_path)
+
+    async def _aextract_all(
+        self, texts: list[str], template: BasePromptTemplate, max_object_length: int
+    ) -> list[list[Triplet]]:
+        semaphore = asyncio.Semaphore(self._max_inflight)
+
+        async def extract_one(text: str) -> list[Triplet]:
+            async with semaphore:
+                response = await self._llm.apredict(template, text=text)
+            return KnowledgeGraphIndex._parse_triplet_response(
+                response, max_length=max_object_length
+            )
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(extract_one(text)) for text in texts]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0] from None
+        return [task.result() for task in tasks]
@@ -0,0 +1,54 @@
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+# 每次从上传流读取的字节数，峰值内存与文件大小无关
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SpooledUpload:
+    """落盘后的上传文件：向量RAG与KG-RAG共用同一个文件路径和内容哈希"""
+    path: Path
+    file_hash: str
+    size: int
+
+    def cleanup(self) -> None:
+        try:
+            self.path.unlink(missing_ok=True)
+        except OSError:
+            logger.warning(f"⚠️ 清理上传临时文件失败：{self.path}")
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.cleanup()
+
+
+def spool_upload(
+    file_name: str, raw_file_data: BinaryIO, chunk_size: int = SPOOL_CHUNK_SIZE
+) -> SpooledUpload:
+    """分块把上传流写入临时文件，同时计算sha256；保留原扩展名供读取器识别文件类型"""
+    digest = hashlib.sha256()
+    size = 0
+    if raw_file_data.seekable():
+        raw_file_data.seek(0)
+    with tempfile.NamedTemporaryFile(
+        prefix="ingest-", suffix=Path(file_name).suffix, delete=False
+    ) as tmp:
+        try:
+            while chunk := raw_file_data.read(chunk_size):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            tmp.close()
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+    return SpooledUpload(path=Path(tmp.name), file_hash=digest.hexdigest(), size=size)
@@ -1,9 +1,28 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 from backend_app.api.llm_api.llm_model import ChatBody
 from starlette.responses import StreamingResponse
 from llama_index.core.llms import ChatMessage, MessageRole
 from backend_app.api.llm_api.chat.chat_server import ChatService
-from backend_app.api.llm_api.llm_model import to_openai_sse_stream
+from backend_app.api.llm_api.chat.semantic_answer_cache import (
+    SemanticAnswerCache,
+    SemanticCacheStats,
+)
+from backend_app.api.llm_api.chat.generation_singleflight import (
+    GenerationFlightStats,
+    GenerationSingleflight,
+)
+from backend_app.api.llm_api.llm_model import ato_openai_sse_stream
+from backend_app.api.LLM.llm_scheduler import (
+    LLMOverloadedError,
+    LLMScheduler,
+    LLMSchedulerStats,
+)
+from backend_app.api.LLM.ollama_pool import OllamaPool, OllamaPoolStats
+from backend_app.api.LLM.model_provisioner import (
+    LLMNotReadyError,
+    ModelProvisioner,
+    ModelProvisionStatus,
+)
 
 import logging
 
@@ -26,34 +45,41 @@ chat_router = APIRouter()
         }
     },
 )
-def chat_completion(
+async def chat_completion(
     request: Request, body: ChatBody
 ) ->  StreamingResponse:
+    # 原生异步：检索在线程中执行，生成走Ollama异步客户端，单个worker可同时保持大量流式连接
     service = request.state.injector.get(ChatService)
     all_messages = [
         ChatMessage(content=m.content, role=MessageRole(m.role)) for m in body.messages
     ][:-1]
     #logger.info(f"asdasdasd:: {all_messages} ---- {body.messages}")
-    completion_gen = service.stream_chat(
-        messages=all_messages,
-        use_context=body.use_context,
-        use_hybrid_rag=True,
-        context_filter=body.context_filter,
-        kg_query_kwargs={
-            "similarity_top_k": 2,
-            "embedding_mode": "hybrid"
-        }
-    )
+    try:
+        completion_gen = await service.astream_chat(
+            messages=all_messages,
+            use_context=body.use_context,
+            use_hybrid_rag=True,
+            context_filter=body.context_filter,
+            hybrid_mode=body.hybrid_mode,
+            kg_query_kwargs={
+                "similarity_top_k": 2,
+                "embedding_mode": "hybrid"
+            }
+        )
+    except LLMOverloadedError as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)}) from e
+    except LLMNotReadyError as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(e.retry_after)}) from e
     """
     # 1. 原有纯向量RAG查询（无需改动，兼容原有调用）
-    completion = chat_service.stream_chat(
+    completion = await chat_service.astream_chat(
         messages=user_messages,
         use_context=True,
         context_filter=context_filter
     )
 
     # 2. 纯知识图谱RAG查询（针对关系推理类问题）
-    kg_completion = chat_service.stream_chat(
+    kg_completion = await chat_service.astream_chat(
         messages=user_messages,
         use_kg_rag=True,
         kg_query_kwargs={
@@ -63,7 +89,7 @@ def chat_completion(
     )
 
     # 3. 混合RAG查询（推荐，兼顾细节与关系推理，效果最优）
-    hybrid_completion = chat_service.stream_chat(
+    hybrid_completion = await chat_service.astream_chat(
         messages=user_messages,
         use_context=True,
         use_hybrid_rag=True,
@@ -76,9 +102,44 @@ def chat_completion(
     """
     #logger.debug(f"asdasdasd:: {completion_gen.response} ---- {completion_gen.sources}")
     return StreamingResponse( 
-        to_openai_sse_stream(
+        ato_openai_sse_stream(
             completion_gen.response,
             completion_gen.sources if body.include_sources else None,
+            prompt_tokens=(
+                (lambda outcome=completion_gen.outcome: outcome.prompt_tokens)
+                if completion_gen.outcome is not None
+                else None
+            ),
         ),
         media_type="text/event-stream",
     )
+
+
+@chat_router.get("/cache/stats", tags=["Contextual Completions"])
+def semantic_cache_stats(request: Request) -> SemanticCacheStats:
+    """语义回答缓存的命中率与累计节省的延迟"""
+    return request.state.injector.get(SemanticAnswerCache).stats()
+
+
+@chat_router.get("/scheduler/stats", tags=["Contextual Completions"])
+def llm_scheduler_stats(request: Request) -> LLMSchedulerStats:
+    """LLM调度器各优先级的在途数、排队深度与等待时间"""
+    return request.state.injector.get(LLMScheduler).stats()
+
+
+@chat_router.get("/model/status", tags=["Contextual Completions"])
+def model_status(request: Request) -> ModelProvisionStatus:
+    """模型准备状态：是否就绪、是否已预热进Ollama内存、当前是否处于常驻时段"""
+    return request.state.injector.get(ModelProvisioner).status()
+
+
+@chat_router.get("/pool/stats", tags=["Contextual Completions"])
+def ollama_pool_stats(request: Request) -> OllamaPoolStats:
+    """各Ollama实例的权重、在途请求、健康/摘除状态，以及会话粘性路由命中与溢出次数"""
+    return request.state.injector.get(OllamaPool).stats()
+
+
+@chat_router.get("/singleflight/stats", tags=["Contextual Completions"])
+def generation_singleflight_stats(request: Request) -> GenerationFlightStats:
+    """并发合并：进行中的生成数、leader数与合并到已有生成的follower数"""
+    return request.state.injector.get(GenerationSingleflight).stats()
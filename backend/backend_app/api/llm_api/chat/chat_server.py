@@ -12,37 +12,65 @@ from backend_app.api.LLM.context_filter import ContextFilter
 from llama_index.core.indices import VectorStoreIndex
 from llama_index.core.storage import StorageContext
 
-from llama_index.core.types import TokenGen
+from llama_index.core.types import TokenAsyncGen
 from pydantic import BaseModel
 from dataclasses import dataclass
+from typing import Literal
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 
-from llama_index.core.chat_engine.types import (
-    BaseChatEngine,
-)
 from llama_index.core.indices.postprocessor import MetadataReplacementPostProcessor
-from llama_index.core.postprocessor import (
-    SentenceTransformerRerank,
-    SimilarityPostprocessor,
+from llama_index.core.postprocessor import SimilarityPostprocessor
+from backend_app.api.LLM.rerank_component import RerankComponent
+from backend_app.api.LLM.bm25_index_component import (
+    BM25IndexComponent,
+    reciprocal_rank_fusion,
 )
 
-from llama_index.core.chat_engine import ContextChatEngine, SimpleChatEngine
 from backend_app.api.llm_api.chunks.chunks_service import Chunk
+from backend_app.api.llm_api.chat.hybrid_context import (
+    BudgetedPrompt,
+    ContextBudget,
+    PromptTokenReport,
+    ScoredText,
+    assemble_prompt,
+    build_fusion_prompt,
+    context_chat_renderer,
+    single_pass_renderer,
+)
+from backend_app.api.LLM.tokenizer_component import TokenizerComponent
 
-from backend_app.api.llm_api.ingest.ingest_service_kg_rag import Neo4jKGRAGService 
+from backend_app.api.llm_api.ingest.ingest_service_kg_rag import (
+    KGRetrievedContext,
+    Neo4jKGRAGService,
+)
+from llama_index.core.base.llms.types import ChatResponseAsyncGen
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from backend_app.api.llm_api.chat.semantic_answer_cache import (
+    VECTOR_CORPUS_MODES,
+    SemanticAnswerCache,
+    SemanticCacheLookup,
+)
+from backend_app.api.llm_api.chat.generation_singleflight import GenerationSingleflight
+from backend_app.api.Embedding.query_embedding_cache import normalize_query
+from backend_app.api.LLM.llm_scheduler import LLMOverloadedError
+from backend_app.api.LLM.model_provisioner import LLMNotReadyError
+from backend_app.api.LLM.ollama_pool import conversation_route_key, ollama_route_key
 
 from llama_index.core.storage.index_store import SimpleIndexStore
-from datetime import datetime
-#redis
-from backend_app.api.tools.redis_service import RedisService
+import asyncio
+import contextvars
+import functools
 import hashlib
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 
 import logging
 
 logger = logging.getLogger(__name__)
-HYBRID_RAG_CACHE_EXPIRE_SECONDS = 3600  # 1小时过期
-CACHE_KEY_PREFIX = "hybrid_rag:cache:" 
+
 @dataclass
 class ChatEngineInput:
     system_message: ChatMessage | None = None
@@ -76,9 +104,27 @@ class ChatEngineInput:
             chat_history=chat_history,
         )
 
-class CompletionGen(BaseModel):
-    response: TokenGen
+
+class _StreamOutcome:
+    """
+    异步生成器无法带返回值，用它回传本次回答是否可写入语义缓存（降级/出错的回答不缓存），
+    以及本次请求各次生成调用累计的提示词token数
+    """
+
+    def __init__(self) -> None:
+        self.cacheable = True
+        self.prompt_tokens = 0
+
+
+class AsyncCompletionGen(BaseModel):
+    response: TokenAsyncGen
     sources: list[Chunk] | None = None
+    # 生成结束后才有完整的提示词token统计；语义缓存命中时为None
+    outcome: _StreamOutcome | None = None
+
+    # pydantic不校验异步生成器类型
+    model_config = {"arbitrary_types_allowed": True}
+
 
 @singleton
 class ChatService:
@@ -88,7 +134,11 @@ class ChatService:
     def __init__(
         self,
         llm_component: LLMComponent,
-        redis_service: RedisService,
+        answer_cache: SemanticAnswerCache,
+        generation_flights: GenerationSingleflight,
+        rerank_component: RerankComponent,
+        lexical_index: BM25IndexComponent,
+        tokenizer_component: TokenizerComponent,
         vector_store_component: VectorStoreComponent,
         embedding_component: EmbeddingComponent,
         node_store_component: NodeStoreComponent,
@@ -96,11 +146,21 @@ class ChatService:
     ) -> None:
         self.settings = settings()
         self.llm_component = llm_component
-        self.redis_service = redis_service
+        self.answer_cache = answer_cache
+        self.generation_flights = generation_flights
+        self.rerank_component = rerank_component
+        self.lexical_index = lexical_index
+        self.tokenizer_component = tokenizer_component
+        self.context_budget = ContextBudget.from_settings()
         self.embedding_component = embedding_component
         self.neo4j_kg_rag_service = neo4j_kg_rag_service  # 保存KG-RAG服务实例
         self.vector_store_component = vector_store_component
         self.node_store_component = node_store_component
+        # KG分支专用的有界线程池：超时后仍在执行的Neo4j查询只占用这里的线程，不挤占语义缓存/向量检索所用的默认线程池
+        self._kg_executor = ThreadPoolExecutor(
+            max_workers=max(1, self.settings.rag.hybrid.kg_max_workers),
+            thread_name_prefix="hybrid-kg",
+        )
         self.storage_context = StorageContext.from_defaults(
             vector_store=vector_store_component.vector_store,
             docstore=node_store_component.doc_store,
@@ -131,68 +191,124 @@ class ChatService:
             
             # 3. 清空索引存储（适配SimpleIndexStore：重新初始化 = 清空所有索引数据）
             self.node_store_component.index_store = SimpleIndexStore()  # 关键修复：重新初始化
+            self.lexical_index.clear()
+            self.answer_cache.invalidate(VECTOR_CORPUS_MODES, "清空向量RAG数据")
 
             self.neo4j_kg_rag_service.clear_neo4j_data()
         except Exception as e:
             logger.error(f"❌ 清空数据失败：{str(e)}", exc_info=True)
             raise
 
-    def _chat_engine(
-        self,
-        system_prompt: str | None = None,
-        use_context: bool = False,
-        context_filter: ContextFilter | None = None,
-    ) -> BaseChatEngine:
-        if use_context:
-            vector_index_retriever = self.vector_store_component.get_retriever(
-                index=self.index,
-                context_filter=context_filter,
-                similarity_top_k=self.settings.rag.similarity_top_k,
-            )
-            node_postprocessors: list[BaseNodePostprocessor] = [
-                MetadataReplacementPostProcessor(target_metadata_key="window"),
-            ]
-            if self.settings.rag.similarity_value:
-                node_postprocessors.append(
-                    SimilarityPostprocessor(
-                        similarity_cutoff=self.settings.rag.similarity_value,
-                    )
-                )
+    def _run_kg(self, func, *args, **kwargs) -> asyncio.Future:
+        """在KG专用线程池中执行同步调用；与asyncio.to_thread一样携带当前上下文（如Ollama路由键）"""
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return asyncio.get_running_loop().run_in_executor(self._kg_executor, call)
 
-            if self.settings.rag.rerank.enabled:
-                rerank_postprocessor = SentenceTransformerRerank(
-                    model=self.settings.rag.rerank.model, top_n=self.settings.rag.rerank.top_n
+    def _vector_retriever(self, context_filter: ContextFilter | None = None):
+        return self.vector_store_component.get_retriever(
+            index=self.index,
+            context_filter=context_filter,
+            similarity_top_k=self.settings.rag.similarity_top_k,
+        )
+
+    def _node_postprocessors(self) -> list[BaseNodePostprocessor]:
+        node_postprocessors: list[BaseNodePostprocessor] = [
+            MetadataReplacementPostProcessor(target_metadata_key="window"),
+        ]
+        # 启用词法融合时相似度阈值在融合前作用于稠密结果（RRF分数与余弦相似度不可比）
+        if self.settings.rag.similarity_value and not self.lexical_index.enabled:
+            node_postprocessors.append(
+                SimilarityPostprocessor(
+                    similarity_cutoff=self.settings.rag.similarity_value,
                 )
-                node_postprocessors.append(rerank_postprocessor)
-
-            chat_engine = ContextChatEngine.from_defaults(
-                system_prompt=system_prompt or "",
-                retriever=vector_index_retriever,
-                llm=self.llm_component.llm,  # Takes no effect at the moment
-                node_postprocessors=node_postprocessors,
-                streaming=True,  # 关键：启用流式响应
-                verbose=True,  # 可选：便于调试
-            )
-            
-            return chat_engine
-            
-        else:
-            return SimpleChatEngine.from_defaults(
-                system_prompt=system_prompt or "",
-                llm=self.llm_component.llm,
-                streaming=True,
             )
 
-    def stream_chat(
+        if self.rerank_component.enabled:
+            # 共享常驻的重排序组件，模型不随请求重复加载
+            node_postprocessors.append(self.rerank_component.postprocessor())
+        return node_postprocessors
+
+    async def astream_chat(
         self,
         messages: list[ChatMessage],
         use_context: bool = False,
         context_filter: ContextFilter | None = None,
         use_kg_rag: bool = False,
         use_hybrid_rag: bool = False,
-        # KG查询配置参数
         kg_query_kwargs: dict | None = None,
-    ) -> CompletionGen:
+        hybrid_mode: Literal["fusion", "single_pass"] | None = None,
+    ) -> AsyncCompletionGen:
+        """
+        流式对话（原生异步）：先查语义缓存，未命中时按分支检索并生成；
+        LLM生成走Ollama异步客户端（astream_chat/astream_complete），不占线程；
+        向量检索、KG查询、语义缓存等同步调用放到线程中执行，不阻塞事件循环
+        """
+        last_message, system_prompt, chat_history = self._parse_chat_input(messages)
+        self._route_conversation(system_prompt, chat_history, last_message)
+        kg_kwargs = kg_query_kwargs or {}
+
+        cache_lookup: SemanticCacheLookup | None = None
+        cache_scope = self._answer_cache_scope(
+            use_context, use_kg_rag, use_hybrid_rag, hybrid_mode,
+            system_prompt, chat_history, context_filter, kg_kwargs,
+        )
+        if cache_scope is not None:
+            cache_lookup = await asyncio.to_thread(self.answer_cache.lookup, cache_scope, last_message)
+            if cache_lookup.hit is not None:
+                return AsyncCompletionGen(
+                    response=self._asingle_response(cache_lookup.hit.answer),
+                    sources=self._cached_sources(cache_lookup),
+                )
+
+        fingerprint = self._generation_fingerprint(
+            last_message, use_context, use_kg_rag, use_hybrid_rag, hybrid_mode,
+            system_prompt, chat_history, context_filter, kg_kwargs,
+        )
+        if fingerprint is not None:
+            return await self._acoalesced_chat(
+                fingerprint,
+                cache_lookup,
+                last_message,
+                system_prompt,
+                chat_history,
+                use_context=use_context,
+                context_filter=context_filter,
+                use_kg_rag=use_kg_rag,
+                use_hybrid_rag=use_hybrid_rag,
+                kg_kwargs=kg_kwargs,
+                hybrid_mode=hybrid_mode,
+            )
+
+        self.llm_component.provisioner.check_ready()
+        self.llm_component.scheduler.check_admission("interactive")
+        started_at = time.monotonic()
+        outcome = _StreamOutcome()
+        completion_gen = await self._astream_chat_uncached(
+            last_message,
+            system_prompt,
+            chat_history,
+            outcome,
+            use_context=use_context,
+            context_filter=context_filter,
+            use_kg_rag=use_kg_rag,
+            use_hybrid_rag=use_hybrid_rag,
+            kg_kwargs=kg_kwargs,
+            hybrid_mode=hybrid_mode,
+        )
+        if cache_lookup is None:
+            completion_gen.outcome = outcome
+            return completion_gen
+        return AsyncCompletionGen(
+            response=self._acache_answer_stream(
+                cache_lookup, completion_gen.response, completion_gen.sources, started_at, outcome
+            ),
+            sources=completion_gen.sources,
+            outcome=outcome,
+        )
+
+    @staticmethod
+    def _parse_chat_input(messages: list[ChatMessage]) -> tuple[str, str, list[ChatMessage]]:
+        """拆出最后一条用户消息、系统提示和历史消息"""
         chat_engine_input = ChatEngineInput.from_messages(messages)
         last_message = (
             chat_engine_input.last_message.content
@@ -207,154 +323,512 @@ class ChatService:
         chat_history = (
             chat_engine_input.chat_history if chat_engine_input.chat_history else []
         )
-        chat_engine = self._chat_engine(
-            system_prompt=system_prompt,
-            use_context=use_context,
-            context_filter=context_filter,
-        )
-
         #self.clear_vector_and_node_data()
         if not last_message:
             last_message = "请提供有效的问题"
+        return last_message, system_prompt, chat_history
 
-        # 初始化默认参数
-        kg_kwargs = kg_query_kwargs or {}
+    @staticmethod
+    def _route_conversation(
+        system_prompt: str, chat_history: list[ChatMessage], last_message: str
+    ) -> None:
+        """设置当前请求的Ollama路由键：同一会话的后续轮次优先发往同一实例，复用其KV缓存"""
+        first_user_message = next(
+            (m.content for m in chat_history if m.role == MessageRole.USER), last_message
+        )
+        ollama_route_key.set(conversation_route_key(system_prompt, first_user_message))
 
-        # 分支1：使用混合RAG（向量RAG + KG-RAG）
-        if use_hybrid_rag:
-            # 执行混合查询，获取融合后的回答和来源
-            fusion_response_text, sources = self._query_hybrid_rag(
-                query_text=last_message,
-                chat_engine=chat_engine,
-                chat_history=chat_history,
-                **kg_kwargs
-            )
-            # 将完整文本转为流式TokenGen（兼容原有返回格式）
-            fusion_token_gen = (token for token in fusion_response_text)
-            return CompletionGen(response=fusion_token_gen, sources=sources)
+    def _answer_cache_scope(
+        self,
+        use_context: bool,
+        use_kg_rag: bool,
+        use_hybrid_rag: bool,
+        hybrid_mode: str | None,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        context_filter: ContextFilter | None,
+        kg_kwargs: dict,
+    ) -> str | None:
+        """语义回答缓存：仅对无历史消息的问题生效（多轮对话的回答依赖上下文）"""
+        cache_mode = self._answer_cache_mode(use_context, use_kg_rag, use_hybrid_rag, hybrid_mode)
+        if cache_mode is None or chat_history or not self.answer_cache.enabled:
+            return None
+        return self.answer_cache.scope(
+            cache_mode,
+            system_prompt=system_prompt,
+            use_context=use_context,
+            docs_ids=context_filter.docs_ids if context_filter else None,
+            kg_kwargs=kg_kwargs,
+        )
 
-        # 分支2：使用纯KG-RAG
-        elif use_kg_rag:
-            # 执行纯KG-RAG查询
-            kg_response_text = self._query_kg_rag(last_message, **kg_kwargs)
-            # 转为流式TokenGen（兼容原有返回格式）
-            kg_token_gen = (token for token in kg_response_text)
-            return CompletionGen(response=kg_token_gen, sources=None)
+    def _generation_fingerprint(
+        self,
+        last_message: str,
+        use_context: bool,
+        use_kg_rag: bool,
+        use_hybrid_rag: bool,
+        hybrid_mode: str | None,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        context_filter: ContextFilter | None,
+        kg_kwargs: dict,
+    ) -> str | None:
+        """并发合并的请求指纹：归一化问题+分支+系统提示+历史+过滤条件+模型与生成参数；无上下文的普通聊天不合并"""
+        mode = self._answer_cache_mode(use_context, use_kg_rag, use_hybrid_rag, hybrid_mode)
+        if mode is None or not self.settings.llm.scheduler.coalesce_identical:
+            return None
+        ollama_settings = self.settings.ollama
+        payload = json.dumps(
+            {
+                "mode": mode,
+                "question": normalize_query(last_message),
+                "system_prompt": system_prompt,
+                "history": [[message.role.value, message.content] for message in chat_history],
+                "use_context": use_context,
+                "docs_ids": context_filter.docs_ids if context_filter else None,
+                "kg_kwargs": kg_kwargs,
+                "model": self.llm_component.llm.metadata.model_name,
+                "generation": ollama_settings.model_dump(
+                    include={
+                        "temperature", "top_k", "top_p", "tfs_z", "num_predict",
+                        "repeat_last_n", "repeat_penalty", "context_window",
+                    }
+                ),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-        # 分支3：原有逻辑（纯向量RAG / 无上下文聊天）
-        else:
-            streaming_response = chat_engine.stream_chat(
-                message=last_message if last_message is not None else "",
-                chat_history=chat_history,
-            )
-            sources = [Chunk.from_node(node) for node in streaming_response.source_nodes]
-            completion_gen = CompletionGen(
-                response=streaming_response.response_gen, sources=sources
-            )
-            return completion_gen
-    
-    def _query_kg_rag(self, query_text: str, **kwargs) -> str:
+    @staticmethod
+    def _cached_sources(lookup: SemanticCacheLookup) -> list[Chunk] | None:
+        assert lookup.hit is not None
+        # 纯KG-RAG回答没有向量来源
+        if lookup.scope.startswith("kg:"):
+            return None
+        return [Chunk(**source) for source in lookup.hit.sources]
+
+    def _query_kg_rag(self, query_text: str, **kwargs) -> tuple[str, bool]:
         """
         执行纯知识图谱RAG查询
         :param query_text: 用户问题
         :param kwargs: KG查询引擎配置参数（如similarity_top_k、response_mode等）
-        :return: KG-RAG回答结果
+        :return: KG-RAG回答结果，以及是否为正常回答（错误提示不进缓存）
         """
         try:
             # 复用已实现的neo4j_kg_rag_service.query_kg_rag方法
             kg_response = self.neo4j_kg_rag_service.query_kg_rag(query_text, **kwargs)
-            return kg_response
+            return kg_response, True
         except RuntimeError as e:
             # 捕获KG索引未构建的异常，返回提示信息（不中断整体流程）
             logger.warning(f"KG-RAG查询失败（索引未构建）：{str(e)}")
-            return f"知识图谱索引未构建，请先上传文档后再进行相关查询。"
+            return f"知识图谱索引未构建，请先上传文档后再进行相关查询。", False
         except Exception as e:
             logger.error(f"KG-RAG查询异常：{str(e)}", exc_info=True)
-            return f"知识图谱查询出错：{str(e)}"
+            return f"知识图谱查询出错：{str(e)}", False
+
+    @staticmethod
+    def _answer_cache_mode(
+        use_context: bool,
+        use_kg_rag: bool,
+        use_hybrid_rag: bool,
+        hybrid_mode: str | None,
+    ) -> str | None:
+        """与_astream_chat_uncached的分支一一对应；无上下文的普通聊天不缓存"""
+        if use_hybrid_rag:
+            return f"hybrid_{hybrid_mode or settings().rag.hybrid.mode}"
+        if use_kg_rag:
+            return "kg"
+        if use_context:
+            return "vector"
+        return None
+
+    def _retrieve_vector_nodes(
+        self, query_text: str, context_filter: ContextFilter | None = None
+    ) -> list[NodeWithScore]:
+        nodes = self._vector_retriever(context_filter).retrieve(query_text)
+        if self.lexical_index.enabled:
+            nodes = self._fuse_lexical_nodes(query_text, nodes, context_filter)
+        for postprocessor in self._node_postprocessors():
+            nodes = postprocessor.postprocess_nodes(nodes, query_str=query_text)
+        return nodes
+
+    def _fuse_lexical_nodes(
+        self,
+        query_text: str,
+        dense_nodes: list[NodeWithScore],
+        context_filter: ContextFilter | None = None,
+    ) -> list[NodeWithScore]:
+        """稠密结果按相似度阈值过滤后，与BM25词法结果按倒数排名融合，融合后仍取 similarity_top_k 个"""
+        similarity_cutoff = self.settings.rag.similarity_value
+        if similarity_cutoff:
+            dense_nodes = [node for node in dense_nodes if (node.score or 0.0) >= similarity_cutoff]
+        lexical_settings = self.settings.rag.lexical
+        hits = self.lexical_index.search(
+            query_text,
+            top_k=lexical_settings.similarity_top_k,
+            ref_doc_ids=context_filter.docs_ids if context_filter else None,
+        )
+        lexical_nodes: list[NodeWithScore] = []
+        if hits:
+            scores = dict(hits)
+            stored = self.storage_context.docstore.get_nodes(list(scores), raise_error=False)
+            by_id = {node.node_id: node for node in stored}
+            lexical_nodes = [
+                NodeWithScore(node=by_id[node_id], score=score)
+                for node_id, score in hits
+                if node_id in by_id
+            ]
+        return reciprocal_rank_fusion(
+            [dense_nodes, lexical_nodes],
+            k=lexical_settings.rrf_k,
+            top_k=self.settings.rag.similarity_top_k,
+        )
+
+    def _retrieve_kg_branch(self, query_text: str, **kwargs) -> KGRetrievedContext | None:
+        try:
+            return self.neo4j_kg_rag_service.retrieve_kg_context(query_text, **kwargs)
+        except Exception as e:
+            logger.warning(f"单次生成混合RAG的KG检索不可用，仅使用向量检索结果：{str(e)}")
+            return None
+
+    def _single_pass_prompt(
+        self,
+        query_text: str,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        vector_nodes: list[NodeWithScore],
+        kg_context: KGRetrievedContext | None,
+        outcome: _StreamOutcome | None = None,
+    ) -> BudgetedPrompt:
+        """KG三元组及其原文块作为KG上下文，向量检索窗口作为文档片段，统一按token预算拼成一次生成的提示词"""
+        chunk_items = [self._scored_text(node) for node in vector_nodes]
+        vector_texts = {item.text for item in chunk_items}
+        kg_items: list[ScoredText] = []
+        if kg_context is not None:
+            kg_items = [ScoredText(text) for text in dict.fromkeys(kg_context.rel_texts)]
+            # 同一块可能同时被向量检索和KG检索命中，只放一次
+            kg_items += [
+                ScoredText(text)
+                for text in dict.fromkeys(node.get_content() for node in kg_context.text_nodes)
+                if text not in vector_texts
+            ]
+        prompt = assemble_prompt(
+            single_pass_renderer(query_text),
+            system_prompt,
+            chat_history,
+            kg_items,
+            chunk_items,
+            self.context_budget,
+            self.tokenizer_component.count,
+        )
+        self._record_prompt("单次生成混合RAG", prompt.report, outcome)
+        return prompt
+
+    def _context_chat_prompt(
+        self,
+        query_text: str,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        nodes: list[NodeWithScore],
+        use_context: bool,
+        outcome: _StreamOutcome | None = None,
+    ) -> BudgetedPrompt:
+        """向量RAG（或无上下文聊天）的对话消息：检索窗口、历史消息与系统提示按token预算分配"""
+        prompt = assemble_prompt(
+            context_chat_renderer(query_text, use_context),
+            system_prompt,
+            chat_history,
+            [],
+            [self._scored_text(node) for node in nodes],
+            self.context_budget,
+            self.tokenizer_component.count,
+        )
+        self._record_prompt("向量RAG" if use_context else "对话", prompt.report, outcome)
+        return prompt
+
+    @staticmethod
+    def _scored_text(node: NodeWithScore) -> ScoredText:
+        return ScoredText(node.node.get_content(metadata_mode=MetadataMode.LLM), node.score)
+
+    @staticmethod
+    def _record_prompt(
+        name: str, report: PromptTokenReport, outcome: _StreamOutcome | None = None
+    ) -> None:
+        logger.info(f"{name}提示词：{report.summary()}")
+        if outcome is not None:
+            outcome.prompt_tokens += report.prompt_tokens
+
+    @staticmethod
+    async def _achat_deltas(chat_responses: ChatResponseAsyncGen) -> TokenAsyncGen:
+        async for chat_response in chat_responses:
+            if chat_response.delta:
+                yield chat_response.delta
+
+    def _query_kg_branch(self, query_text: str, **kwargs) -> str | None:
+        """混合RAG的KG分支：索引未构建或Neo4j不可用时返回None，由向量结果单独融合"""
+        try:
+            return self.neo4j_kg_rag_service.query_kg_rag(query_text, **kwargs)
+        except Exception as e:
+            logger.warning(f"混合RAG的KG分支不可用，仅使用向量结果融合：{str(e)}")
+            return None
 
-    # 新增：融合向量RAG与KG-RAG结果（核心优化，发挥两者优势）
-    def _query_hybrid_rag(self, query_text: str, chat_engine, chat_history: list[ChatMessage], **kwargs) -> tuple[str, list[Chunk]]:
+    def _fusion_prompt(
+        self,
+        query_text: str,
+        vector_response: str | None,
+        kg_response: str | None,
+        outcome: _StreamOutcome | None = None,
+    ) -> str:
+        prompt_text, report = build_fusion_prompt(
+            query_text,
+            vector_response,
+            kg_response,
+            self.context_budget,
+            self.tokenizer_component.count,
+        )
+        self._record_prompt("混合RAG融合", report, outcome)
+        return prompt_text
+
+    async def _astream_chat_uncached(
+        self,
+        last_message: str,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        outcome: _StreamOutcome,
+        use_context: bool,
+        context_filter: ContextFilter | None,
+        use_kg_rag: bool,
+        use_hybrid_rag: bool,
+        kg_kwargs: dict,
+        hybrid_mode: Literal["fusion", "single_pass"] | None,
+    ) -> AsyncCompletionGen:
         """
-        混合查询：向量RAG（提供上下文细节） + KG-RAG（提供关系推理）
-        :return: 融合后的回答、向量RAG来源节点
+        分支1a：单次生成的混合RAG（只检索，不构建聊天引擎）；
+        分支1：混合RAG（向量RAG + KG-RAG并行，各分支有独立超时，再流式融合）；
+        分支2：纯KG-RAG（KG查询引擎不支持流式，整段输出）；
+        分支3：纯向量RAG / 无上下文聊天（按token预算拼装检索上下文与历史消息）
         """
-        # ========== 第一步：生成唯一缓存键 ==========
-        # 缓存键包含：查询文本 + 关键kwargs参数（保证缓存唯一性）
-        cache_params = {
-            "query_text": query_text,
-            # 提取kwargs中影响查询结果的关键参数（如过滤条件、top_k等）
-            "kwargs": {k: v for k, v in kwargs.items() if k in ["top_k", "context_filter", "entity_filter"]}
-        }
-        # 将参数转为JSON字符串，再通过MD5生成唯一key（避免键过长）
-        cache_key_str = json.dumps(cache_params, ensure_ascii=False, sort_keys=True)
-        cache_key_hash = hashlib.md5(cache_key_str.encode("utf-8")).hexdigest()
-        cache_key = f"{CACHE_KEY_PREFIX}{cache_key_hash}"
-
-        # ========== 第二步：尝试从Redis读取缓存 ==========
-        cached_result = self.redis_service.get(cache_key)
-        if cached_result:
-            logger.info(f"混合RAG缓存命中，缓存键：{cache_key}，问题：{query_text}")
-            # 反序列化缓存结果
-            fusion_response = cached_result.get("fusion_response", "")
-            # 将缓存的字典列表转为Chunk对象
-            vector_sources = [
-                Chunk(**chunk_dict) for chunk_dict in cached_result.get("vector_sources", [])
-            ]
-            return fusion_response, vector_sources
-
-        # ========== 第三步：缓存未命中，执行原混合RAG逻辑 ==========
-        logger.info(f"混合RAG缓存未命中，执行实际查询，问题：{query_text}")
-        
-        # 1. 执行向量RAG查询（流式响应转为完整文本）
-        vector_stream_response = chat_engine.stream_chat(message=query_text, chat_history=chat_history)
-        vector_response = "".join([token for token in vector_stream_response.response_gen])
-        vector_sources = [Chunk.from_node(node) for node in vector_stream_response.source_nodes]
-
-        # 2. 执行KG-RAG查询
-        kg_response = self._query_kg_rag(query_text,** kwargs)
-        logger.info(f"混合RAG查询完成，向量RAG回答：{vector_response}，KG-RAG回答：{kg_response}")
-        
-        # 3. 融合两者结果（通过LLM总结融合，保证回答一致性和完整性）
-        fusion_prompt = f"""
-        请你将以下两个回答融合为一个精准、简洁的最终回答，严格遵循以下要求：
-        1.  向量检索回答（提供细节上下文）：{vector_response}
-        2.  知识图谱回答（提供实体关系推理）：{kg_response}
-
-        ########### 核心规则（必须严格遵守，缺一不可）###########
-        1.  优先提取并保留知识图谱中的明确实体关系事实（如部门与负责人的对应关系），这是最高优先级
-        2.  仅保留与用户问题直接相关的信息，完全忽略无关内容（如产品功能、发布日期、人物关系推测等非用户询问内容）
-        3.  坚决删除所有冗余表述、同义改写、无依据推测（如“他们都是管理者”“可以推测与AI有关”等）
-        4.  回答格式要求：分点列出（使用数字序号），每点仅陈述一个明确事实，不添加额外修饰词
-        5.  无需补充额外背景信息，无需总结，无需过渡句，只输出用户问题对应的核心答案
-        6.  去除重复内容，保证回答简洁明了，语言精炼，无废话
-        
-        用户当前问题是：{query_text}，请严格按上述规则生成回答。
+        if use_hybrid_rag and (hybrid_mode or self.settings.rag.hybrid.mode) == "single_pass":
+            started_at = time.monotonic()
+            kg_task = self._run_kg(self._retrieve_kg_branch, last_message, **kg_kwargs)
+            vector_nodes = (
+                await asyncio.to_thread(self._retrieve_vector_nodes, last_message, context_filter)
+                if use_context
+                else []
+            )
+            return AsyncCompletionGen(
+                response=self._astream_single_pass(
+                    last_message, system_prompt, chat_history, vector_nodes, kg_task, started_at, outcome
+                ),
+                sources=[Chunk.from_node(node) for node in vector_nodes],
+            )
+
+        if use_hybrid_rag:
+            started_at = time.monotonic()
+            kg_task = self._run_kg(self._query_kg_branch, last_message, **kg_kwargs)
+            # 向量检索完成即拿到来源，向量回答在后台任务中生成
+            vector_nodes = (
+                await asyncio.to_thread(self._retrieve_vector_nodes, last_message, context_filter)
+                if use_context
+                else []
+            )
+            vector_prompt = self._context_chat_prompt(
+                last_message, system_prompt, chat_history, vector_nodes, use_context, outcome
+            )
+            vector_task = asyncio.create_task(self._achat_text(vector_prompt.messages))
+            return AsyncCompletionGen(
+                response=self._astream_hybrid_fusion(
+                    last_message, vector_task, kg_task, started_at, outcome
+                ),
+                sources=[Chunk.from_node(node) for node in vector_nodes],
+            )
+
+        elif use_kg_rag:
+            kg_response_text, outcome.cacheable = await self._run_kg(
+                self._query_kg_rag, last_message, **kg_kwargs
+            )
+            return AsyncCompletionGen(
+                response=self._asingle_response(kg_response_text), sources=None
+            )
+
+        else:
+            nodes = (
+                await asyncio.to_thread(self._retrieve_vector_nodes, last_message, context_filter)
+                if use_context
+                else []
+            )
+            prompt = self._context_chat_prompt(
+                last_message, system_prompt, chat_history, nodes, use_context, outcome
+            )
+            chat_responses = await self.llm_component.llm.astream_chat(prompt.messages)
+            return AsyncCompletionGen(
+                response=self._achat_deltas(chat_responses),
+                sources=[Chunk.from_node(node) for node in nodes],
+            )
+
+    async def _acoalesced_chat(
+        self,
+        fingerprint: str,
+        cache_lookup: SemanticCacheLookup | None,
+        last_message: str,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        **branch_kwargs,
+    ) -> AsyncCompletionGen:
         """
+        相同指纹的并发请求共用一次检索+生成：leader启动生成任务并负责写语义缓存，
+        follower等待同一份来源后订阅leader的token流
+        """
+        flight, is_leader = self.generation_flights.join(fingerprint)
+        if is_leader:
+            try:
+                self.llm_component.provisioner.check_ready()
+                self.llm_component.scheduler.check_admission("interactive")
+            except (LLMNotReadyError, LLMOverloadedError) as e:
+                self.generation_flights.abandon(flight, e)
+                raise
+            started_at = time.monotonic()
+            outcome = flight.outcome = _StreamOutcome()
+
+            async def generate() -> tuple[TokenAsyncGen, list[Chunk] | None]:
+                completion_gen = await self._astream_chat_uncached(
+                    last_message, system_prompt, chat_history, outcome, **branch_kwargs
+                )
+                return completion_gen.response, completion_gen.sources
+
+            async def store_answer(tokens: list[str]) -> None:
+                if cache_lookup is None or not outcome.cacheable:
+                    return
+                await asyncio.to_thread(
+                    self.answer_cache.store,
+                    cache_lookup,
+                    "".join(tokens),
+                    [chunk.model_dump() for chunk in flight.sources or []],
+                    latency_seconds=time.monotonic() - started_at,
+                )
+
+            self.generation_flights.start(flight, generate, store_answer)
 
-        # 调用LLM进行结果融合
-        fusion_response = self.llm_component.llm.complete(fusion_prompt)
-        fusion_response_str = str(fusion_response)
-
-        # ========== 第四步：将结果写入Redis缓存 ==========
-        # 转换Chunk对象为字典（便于序列化存储）
-        vector_sources_dict = [chunk.model_dump() for chunk in vector_sources]
-        cache_value = {
-            "fusion_response": fusion_response_str,
-            "vector_sources": vector_sources_dict,
-            "query_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # 记录缓存写入时间（便于排查）
-            "query_text": query_text[:100]  # 存储简短查询文本（便于缓存管理）
-        }
-        
-        # 写入缓存（设置过期时间）
-        cache_set_success = self.redis_service.set(
-            key=cache_key,
-            value=cache_value,
-            ex=HYBRID_RAG_CACHE_EXPIRE_SECONDS
+        try:
+            sources = await flight.wait_sources()
+        except BaseException:
+            # 等待来源时被取消（客户端断开）或检索失败：该请求不会再订阅，及时退出以免生成空跑占用调度名额
+            flight.leave()
+            raise
+        return AsyncCompletionGen(
+            response=flight.subscribe(), sources=sources, outcome=flight.outcome
         )
-        if cache_set_success:
-            logger.info(f"混合RAG缓存写入成功，缓存键：{cache_key}，过期时间：{HYBRID_RAG_CACHE_EXPIRE_SECONDS}秒")
-        else:
-            logger.warning(f"混合RAG缓存写入失败，缓存键：{cache_key}")
 
-        return fusion_response_str, vector_sources
+    async def _acache_answer_stream(
+        self,
+        lookup: SemanticCacheLookup,
+        token_gen: TokenAsyncGen,
+        sources: list[Chunk] | None,
+        started_at: float,
+        outcome: _StreamOutcome,
+    ) -> TokenAsyncGen:
+        """
+        透传token流，完整生成后写入语义缓存；
+        降级/出错的回答（outcome.cacheable为False）不缓存，客户端断开时关闭内部生成器，停止Ollama生成
+        """
+        answer_parts: list[str] = []
+        async with aclosing(token_gen) as tokens:
+            async for token in tokens:
+                answer_parts.append(token)
+                yield token
+        if outcome.cacheable:
+            await asyncio.to_thread(
+                self.answer_cache.store,
+                lookup,
+                "".join(answer_parts),
+                [chunk.model_dump() for chunk in sources or []],
+                latency_seconds=time.monotonic() - started_at,
+            )
+
+    @staticmethod
+    async def _asingle_response(text: str) -> TokenAsyncGen:
+        yield text
+
+    async def _achat_text(self, messages: list[ChatMessage]) -> str:
+        chat_response = await self.llm_component.llm.achat(messages)
+        return chat_response.message.content or ""
 
+    async def _astream_hybrid_fusion(
+        self,
+        query_text: str,
+        vector_task: asyncio.Task[str],
+        kg_task: asyncio.Future[str | None],
+        started_at: float,
+        outcome: _StreamOutcome,
+    ) -> TokenAsyncGen:
+        hybrid_settings = self.settings.rag.hybrid
+        try:
+            vector_response = await self._abranch_result(
+                "向量RAG", vector_task, started_at + hybrid_settings.vector_timeout_seconds
+            )
+            kg_response = await self._abranch_result(
+                "KG-RAG", kg_task, started_at + hybrid_settings.kg_timeout_seconds
+            )
+        finally:
+            # 客户端提前断开时不再等待分支结果，向量回答的Ollama流随任务取消而中止
+            vector_task.cancel()
+            kg_task.cancel()
+        logger.info(
+            f"混合RAG两路查询完成，耗时 {time.monotonic() - started_at:.2f}s，"
+            f"向量RAG回答：{vector_response}，KG-RAG回答：{kg_response}"
+        )
+        if vector_response is None and kg_response is None:
+            outcome.cacheable = False
+            yield "检索超时或失败，请稍后重试。"
+            return
+
+        completions = await self.llm_component.llm.astream_complete(
+            self._fusion_prompt(query_text, vector_response, kg_response, outcome)
+        )
+        async for completion in completions:
+            if completion.delta:
+                yield completion.delta
+
+        # 降级结果（某一分支缺失）不进语义缓存
+        outcome.cacheable = vector_response is not None and kg_response is not None
+
+    async def _astream_single_pass(
+        self,
+        query_text: str,
+        system_prompt: str,
+        chat_history: list[ChatMessage],
+        vector_nodes: list[NodeWithScore],
+        kg_task: asyncio.Future[KGRetrievedContext | None],
+        started_at: float,
+        outcome: _StreamOutcome,
+    ) -> TokenAsyncGen:
+        try:
+            kg_context = await self._abranch_result(
+                "KG检索", kg_task, started_at + self.settings.rag.hybrid.kg_timeout_seconds
+            )
+        finally:
+            kg_task.cancel()
+        logger.info(f"单次生成混合RAG检索完成，耗时 {time.monotonic() - started_at:.2f}s")
+
+        prompt = self._single_pass_prompt(
+            query_text, system_prompt, chat_history, vector_nodes, kg_context, outcome
+        )
+        chat_responses = await self.llm_component.llm.astream_chat(prompt.messages)
+        async for token in self._achat_deltas(chat_responses):
+            yield token
+
+        # KG检索缺失的降级结果不进语义缓存
+        outcome.cacheable = kg_context is not None
+
+    @staticmethod
+    async def _abranch_result(name: str, task: asyncio.Future, deadline: float):
+        try:
+            return await asyncio.wait_for(task, timeout=max(0.0, deadline - time.monotonic()))
+        except TimeoutError:
+            # 超时即取消任务；线程中的同步调用无法中断，KG查询由Neo4j事务超时终止
+            logger.warning(f"混合RAG的{name}分支超时，跳过该分支")
+        except Exception as e:
+            logger.warning(f"混合RAG的{name}分支失败，跳过该分支：{str(e)}", exc_info=True)
+        return None
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import weakref
+from collections.abc import Awaitable, Callable
+from contextlib import aclosing
+from typing import Any
+
+from injector import singleton
+from llama_index.core.types import TokenAsyncGen
+from pydantic import BaseModel
+
+from backend_app.api.llm_api.chunks.chunks_service import Chunk
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationFlightStats(BaseModel):
+    inflight: int
+    leaders: int
+    followers: int
+
+
+class GenerationFlight:
+    """
+    一次正在进行的生成：驱动任务把token追加到缓冲区，
+    每个订阅者（含发起请求本身）从头回放缓冲区并跟随后续token
+    """
+
+    def __init__(self, fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        self.tokens: list[str] = []
+        self.sources: list[Chunk] | None = None
+        self.retrieved = False
+        self.done = False
+        self.error: BaseException | None = None
+        # 已加入的请求数（leader+follower），每个请求退出时减一（见leave）
+        self.subscribers = 1
+        # 所有订阅者断开、生成被取消后不再接受新的follower
+        self.abandoned = False
+        self.task: asyncio.Task[None] | None = None
+        # leader生成过程的附加结果（如提示词token统计），follower共享
+        self.outcome: Any = None
+        self._sources_ready = asyncio.Event()
+        self._changed = asyncio.Condition()
+
+    async def wait_sources(self) -> list[Chunk] | None:
+        """等待检索完成拿到来源；检索阶段出错时抛出同一异常"""
+        await self._sources_ready.wait()
+        if not self.retrieved:
+            raise self.error or RuntimeError("生成在检索完成前结束")
+        return self.sources
+
+    def set_sources(self, sources: list[Chunk] | None) -> None:
+        self.sources = sources
+        self.retrieved = True
+        self._sources_ready.set()
+
+    async def publish(self, token: str) -> None:
+        async with self._changed:
+            self.tokens.append(token)
+            self._changed.notify_all()
+
+    async def finish(self, error: BaseException | None = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+        self._sources_ready.set()
+
+    def reject(self, error: BaseException) -> None:
+        """生成开始前失败：等待来源的请求收到同一异常"""
+        self.done = True
+        self.error = error
+        self._sources_ready.set()
+
+    def leave(self) -> None:
+        """一个已加入的请求退出（token流结束/断开，或等待来源时失败/被取消）"""
+        self.subscribers -= 1
+        # 所有订阅者都已断开时停止生成，与单个请求断开即停止Ollama生成的行为一致
+        if self.subscribers == 0 and not self.done and self.task is not None:
+            self.abandoned = True
+            self.task.cancel()
+
+    def subscribe(self) -> TokenAsyncGen:
+        """
+        订阅token流，每个已加入的请求调用一次；流结束或断开时退出，
+        从未开始迭代就被丢弃（如响应未发送客户端已断开）时在回收时退出
+        """
+        left = False
+
+        def leave_once() -> None:
+            nonlocal left
+            if not left:
+                left = True
+                self.leave()
+
+        tokens = self._follow(leave_once)
+        weakref.finalize(tokens, leave_once)
+        return tokens
+
+    async def _follow(self, leave: Callable[[], None]) -> TokenAsyncGen:
+        position = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: len(self.tokens) > position or self.done)
+                    batch = self.tokens[position:]
+                    done = self.done
+                position += len(batch)
+                for token in batch:
+                    yield token
+                if done and position == len(self.tokens):
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            leave()
+
+
+@singleton
+class GenerationSingleflight:
+    """
+    相同请求指纹（归一化问题+过滤条件+模型+生成参数）的并发生成只执行一次：
+    1. 第一个请求成为leader，生成放在独立任务中执行，不受leader客户端断开影响（仍有订阅者时）
+    2. 之后到达的相同请求作为follower直接订阅leader的token流，不再发起Ollama生成
+    3. 生成及收尾（写语义缓存）完成后移除该指纹，后续请求走语义缓存
+    所有请求都在FastAPI的同一个事件循环上，flight只在该循环内使用
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, GenerationFlight] = {}
+        self._leaders = 0
+        self._followers = 0
+
+    def join(self, fingerprint: str) -> tuple[GenerationFlight, bool]:
+        """返回 (flight, 是否为leader)"""
+        flight = self._flights.get(fingerprint)
+        if flight is not None and not flight.abandoned:
+            flight.subscribers += 1
+            self._followers += 1
+            logger.info(f"相同请求正在生成，合并为follower（指纹 {fingerprint[:12]}，共 {flight.subscribers} 个请求）")
+            return flight, False
+        flight = self._flights[fingerprint] = GenerationFlight(fingerprint)
+        self._leaders += 1
+        return flight, True
+
+    def start(
+        self,
+        flight: GenerationFlight,
+        generate: Callable[[], Awaitable[tuple[TokenAsyncGen, list[Chunk] | None]]],
+        on_complete: Callable[[list[str]], Awaitable[Any]] | None = None,
+    ) -> None:
+        """leader调用：在独立任务中执行检索与生成，token逐个广播给订阅者"""
+        flight.task = asyncio.create_task(self._drive(flight, generate, on_complete))
+
+    def abandon(self, flight: GenerationFlight, error: BaseException) -> None:
+        """leader在开始生成前失败（如被调度器拒绝）：已加入的follower收到同一异常"""
+        self._forget(flight)
+        flight.reject(error)
+
+    def stats(self) -> GenerationFlightStats:
+        return GenerationFlightStats(
+            inflight=len(self._flights), leaders=self._leaders, followers=self._followers
+        )
+
+    async def _drive(
+        self,
+        flight: GenerationFlight,
+        generate: Callable[[], Awaitable[tuple[TokenAsyncGen, list[Chunk] | None]]],
+        on_complete: Callable[[list[str]], Awaitable[Any]] | None,
+    ) -> None:
+        try:
+            token_gen, sources = await generate()
+            flight.set_sources(sources)
+            async with aclosing(token_gen) as tokens:
+                async for token in tokens:
+                    await flight.publish(token)
+        except asyncio.CancelledError as e:
+            logger.info(f"合并生成的所有订阅者已断开，停止生成（指纹 {flight.fingerprint[:12]}）")
+            self._forget(flight)
+            await flight.finish(e)
+            raise
+        except Exception as e:
+            logger.error(f"❌ 合并生成失败：{str(e)}", exc_info=True)
+            self._forget(flight)
+            await flight.finish(e)
+            return
+        await flight.finish()
+        try:
+            if on_complete is not None:
+                await on_complete(flight.tokens)
+        finally:
+            self._forget(flight)
+
+    def _forget(self, flight: GenerationFlight) -> None:
+        if self._flights.get(flight.fingerprint) is flight:
+            del self._flights[flight.fingerprint]
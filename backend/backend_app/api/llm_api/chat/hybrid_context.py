@@ -0,0 +1,326 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from llama_index.core.chat_engine.context import DEFAULT_CONTEXT_TEMPLATE
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 分词器与模型实际分词存在差异，预留余量避免超出上下文窗口
+PROMPT_TOKEN_MARGIN = 64
+# Llama 3 对话模板每条消息的固定开销：<|start_header_id|>角色<|end_header_id|>\n\n……<|eot_id|>
+MESSAGE_TOKEN_OVERHEAD = 5
+# <|begin_of_text|> 与生成前追加的 assistant 消息头
+PROMPT_FRAME_TOKENS = 5
+# 相邻检索条目之间的换行分隔
+ITEM_SEPARATOR_TOKENS = 2
+# 分数最高的条目单独超出预算时截断保留；剩余预算低于该值时不再截断，直接丢弃
+MIN_TRUNCATED_ITEM_TOKENS = 32
+
+CountTokens = Callable[[str], int]
+
+SINGLE_PASS_PROMPT_TEMPLATE = """请仅根据以下检索到的资料回答用户问题。
+
+知识图谱事实（实体关系，优先采信）：
+{kg_triplets}
+
+文档片段：
+{context}
+
+########### 核心规则（必须严格遵守）###########
+1.  优先使用知识图谱中的明确实体关系事实，文档片段用于补充细节
+2.  仅保留与用户问题直接相关的信息，资料中没有的内容不要推测
+3.  分点列出（使用数字序号），每点仅陈述一个明确事实，不添加额外修饰词
+4.  无需补充额外背景信息，无需总结，无需过渡句
+
+用户当前问题是：{query}"""
+
+FUSION_PROMPT_TEMPLATE = """请你将以下两个回答融合为一个精准、简洁的最终回答，严格遵循以下要求：
+1.  向量检索回答（提供细节上下文）：{vector_response}
+2.  知识图谱回答（提供实体关系推理）：{kg_response}
+
+########### 核心规则（必须严格遵守，缺一不可）###########
+1.  优先提取并保留知识图谱中的明确实体关系事实（如部门与负责人的对应关系），这是最高优先级
+2.  仅保留与用户问题直接相关的信息，完全忽略无关内容（如产品功能、发布日期、人物关系推测等非用户询问内容）
+3.  坚决删除所有冗余表述、同义改写、无依据推测（如“他们都是管理者”“可以推测与AI有关”等）
+4.  回答格式要求：分点列出（使用数字序号），每点仅陈述一个明确事实，不添加额外修饰词
+5.  无需补充额外背景信息，无需总结，无需过渡句，只输出用户问题对应的核心答案
+6.  去除重复内容，保证回答简洁明了，语言精炼，无废话
+
+用户当前问题是：{query}，请严格按上述规则生成回答。"""
+
+
+@dataclass
+class ScoredText:
+    """参与预算分配的一条检索内容；score为None时按检索顺序取舍"""
+    text: str
+    score: float | None = None
+
+
+@dataclass
+class ContextBudget:
+    context_window: int
+    num_predict: int
+    history_ratio: float
+    kg_ratio: float
+    system_prompt_max_tokens: int
+    margin_tokens: int = PROMPT_TOKEN_MARGIN
+
+    @classmethod
+    def from_settings(cls) -> "ContextBudget":
+        ollama_settings = settings().ollama
+        budget_settings = settings().rag.context_budget
+        return cls(
+            context_window=ollama_settings.context_window,
+            num_predict=ollama_settings.num_predict,
+            history_ratio=budget_settings.history_ratio,
+            kg_ratio=budget_settings.kg_ratio,
+            system_prompt_max_tokens=budget_settings.system_prompt_max_tokens,
+        )
+
+    @property
+    def prompt_tokens(self) -> int:
+        """提示词可用token数 = 上下文窗口 - 生成长度 - 余量"""
+        return max(0, self.context_window - self.num_predict - self.margin_tokens)
+
+
+@dataclass
+class PromptTokenReport:
+    """一次生成调用的提示词token构成"""
+    prompt_tokens: int = 0
+    budget_tokens: int = 0
+    system_tokens: int = 0
+    history_tokens: int = 0
+    history_used: int = 0
+    history_dropped: int = 0
+    kg_tokens: int = 0
+    kg_used: int = 0
+    kg_dropped: int = 0
+    chunk_tokens: int = 0
+    chunks_used: int = 0
+    chunks_dropped: int = 0
+    truncated: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.prompt_tokens}/{self.budget_tokens} tokens（系统提示 {self.system_tokens}，"
+            f"历史 {self.history_used} 条 {self.history_tokens}（丢弃 {self.history_dropped}），"
+            f"KG {self.kg_used} 条 {self.kg_tokens}（丢弃 {self.kg_dropped}），"
+            f"文档片段 {self.chunks_used} 个 {self.chunk_tokens}（丢弃 {self.chunks_dropped}），"
+            f"截断 {self.truncated} 处）"
+        )
+
+
+@dataclass
+class BudgetedPrompt:
+    messages: list[ChatMessage]
+    report: PromptTokenReport
+
+
+# (系统提示, KG条目, 文档片段) -> (历史消息之前的消息, 历史消息之后的消息)
+PromptRenderer = Callable[[str, list[str], list[str]], tuple[list[ChatMessage], list[ChatMessage]]]
+
+
+def count_messages_tokens(messages: list[ChatMessage], count_tokens: CountTokens) -> int:
+    return PROMPT_FRAME_TOKENS + sum(
+        count_tokens(message.content or "") + MESSAGE_TOKEN_OVERHEAD for message in messages
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: CountTokens) -> str:
+    """保留text开头不超过max_tokens的部分（按字符二分，适用于任意分词器）"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def _select_by_score(
+    items: list[ScoredText], budget: int, count_tokens: CountTokens
+) -> tuple[list[str], int, int, int]:
+    """
+    按分数从高到低放入预算（有条目缺分数时按检索顺序），放不下的低分条目先被丢弃；
+    分数最高的条目单独超出预算时截断保留。返回值保持原始顺序
+    :return: (放入的文本, 占用token数, 丢弃条数, 截断条数)
+    """
+    if all(item.score is not None for item in items):
+        order = sorted(range(len(items)), key=lambda i: (-items[i].score, i))
+    else:
+        order = list(range(len(items)))
+    kept: dict[int, str] = {}
+    used = 0
+    truncated = 0
+    for i in order:
+        cost = count_tokens(items[i].text) + ITEM_SEPARATOR_TOKENS
+        if used + cost <= budget:
+            kept[i] = items[i].text
+            used += cost
+        elif not kept and budget - ITEM_SEPARATOR_TOKENS >= MIN_TRUNCATED_ITEM_TOKENS:
+            text = truncate_to_tokens(items[i].text, budget - ITEM_SEPARATOR_TOKENS, count_tokens)
+            kept[i] = text
+            used += count_tokens(text) + ITEM_SEPARATOR_TOKENS
+            truncated += 1
+    return [kept[i] for i in sorted(kept)], used, len(items) - len(kept), truncated
+
+
+def _trim_history(
+    chat_history: list[ChatMessage], budget: int, count_tokens: CountTokens
+) -> tuple[list[ChatMessage], int]:
+    """从最近的消息往前保留，超出预算的更早消息整条丢弃；保留部分以用户消息开头"""
+    kept: list[tuple[ChatMessage, int]] = []
+    used = 0
+    for message in reversed(chat_history):
+        cost = count_tokens(message.content or "") + MESSAGE_TOKEN_OVERHEAD
+        if used + cost > budget:
+            break
+        kept.append((message, cost))
+        used += cost
+    kept.reverse()
+    while kept and kept[0][0].role == MessageRole.ASSISTANT:
+        used -= kept.pop(0)[1]
+    return [message for message, _ in kept], used
+
+
+def assemble_prompt(
+    render: PromptRenderer,
+    system_prompt: str,
+    chat_history: list[ChatMessage],
+    kg_items: list[ScoredText],
+    chunk_items: list[ScoredText],
+    budget: ContextBudget,
+    count_tokens: CountTokens,
+) -> BudgetedPrompt:
+    """
+    在 context_window - num_predict - 余量 内分配提示词：
+    1. 模板骨架、用户问题和系统提示（超过 system_prompt_max_tokens 时截断）固定占用
+    2. 历史消息最多占剩余部分的 history_ratio，从最早的消息开始丢弃
+    3. 其余给检索内容：KG上下文最多占 kg_ratio，文档片段用剩下的；各自从分数最低的条目开始丢弃
+    4. 一方用不完的预算回补给另一方，最后回补被丢弃的历史消息
+    """
+    report = PromptTokenReport(budget_tokens=budget.prompt_tokens)
+    capped_system_prompt = truncate_to_tokens(
+        system_prompt, budget.system_prompt_max_tokens, count_tokens
+    )
+    if capped_system_prompt != system_prompt:
+        report.truncated += 1
+
+    head, tail = render(capped_system_prompt, [], [])
+    available = max(0, budget.prompt_tokens - count_messages_tokens(head + tail, count_tokens))
+    history_tokens = sum(
+        count_tokens(message.content or "") + MESSAGE_TOKEN_OVERHEAD for message in chat_history
+    )
+    history, history_used = _trim_history(
+        chat_history, min(history_tokens, int(available * budget.history_ratio)), count_tokens
+    )
+
+    retrieval = available - history_used
+    kg_budget = int(retrieval * budget.kg_ratio) if chunk_items else retrieval
+    kg_texts, kg_used, kg_dropped, kg_truncated = _select_by_score(kg_items, kg_budget, count_tokens)
+    chunk_texts, chunk_used, chunks_dropped, chunks_truncated = _select_by_score(
+        chunk_items, retrieval - kg_used, count_tokens
+    )
+    if kg_dropped and retrieval - kg_used - chunk_used > 0:
+        kg_texts, kg_used, kg_dropped, kg_truncated = _select_by_score(
+            kg_items, retrieval - chunk_used, count_tokens
+        )
+    leftover = retrieval - kg_used - chunk_used
+    if leftover > 0 and len(history) < len(chat_history):
+        history, history_used = _trim_history(chat_history, history_used + leftover, count_tokens)
+
+    head, tail = render(capped_system_prompt, kg_texts, chunk_texts)
+    messages = head + history + tail
+    report.prompt_tokens = count_messages_tokens(messages, count_tokens)
+    report.system_tokens = count_tokens(capped_system_prompt)
+    report.history_tokens = history_used
+    report.history_used = len(history)
+    report.history_dropped = len(chat_history) - len(history)
+    report.kg_tokens = kg_used
+    report.kg_used = len(kg_texts)
+    report.kg_dropped = kg_dropped
+    report.chunk_tokens = chunk_used
+    report.chunks_used = len(chunk_texts)
+    report.chunks_dropped = chunks_dropped
+    report.truncated += kg_truncated + chunks_truncated
+    return BudgetedPrompt(messages=messages, report=report)
+
+
+def single_pass_renderer(query_text: str) -> PromptRenderer:
+    """单次生成混合RAG：检索内容与问题放在同一条用户消息中"""
+
+    def render(
+        system_prompt: str, kg_texts: list[str], chunk_texts: list[str]
+    ) -> tuple[list[ChatMessage], list[ChatMessage]]:
+        head = [ChatMessage(role=MessageRole.SYSTEM, content=system_prompt)] if system_prompt else []
+        user_message = SINGLE_PASS_PROMPT_TEMPLATE.format(
+            kg_triplets="\n".join(kg_texts) or "无",
+            context="\n\n".join(chunk_texts) or "无",
+            query=query_text,
+        )
+        return head, [ChatMessage(role=MessageRole.USER, content=user_message)]
+
+    return render
+
+
+def context_chat_renderer(query_text: str, use_context: bool) -> PromptRenderer:
+    """向量RAG对话：与ContextChatEngine相同的布局（检索上下文+系统提示作为系统消息，问题作为最后一条用户消息）"""
+
+    def render(
+        system_prompt: str, kg_texts: list[str], chunk_texts: list[str]
+    ) -> tuple[list[ChatMessage], list[ChatMessage]]:
+        if use_context:
+            context_str = "\n\n".join(kg_texts + chunk_texts)
+            system_content = DEFAULT_CONTEXT_TEMPLATE.format(context_str=context_str) + system_prompt.strip()
+        else:
+            system_content = system_prompt
+        head = [ChatMessage(role=MessageRole.SYSTEM, content=system_content)] if system_content else []
+        return head, [ChatMessage(role=MessageRole.USER, content=query_text)]
+
+    return render
+
+
+def build_fusion_prompt(
+    query_text: str,
+    vector_response: str | None,
+    kg_response: str | None,
+    budget: ContextBudget,
+    count_tokens: CountTokens,
+) -> tuple[str, PromptTokenReport]:
+    """融合提示词：两段回答超出预算时先截断向量回答（优先级低于知识图谱回答），再截断知识图谱回答"""
+    vector_response = vector_response or "无（向量检索不可用）"
+    kg_response = kg_response or "无（知识图谱不可用）"
+    fixed = (
+        PROMPT_FRAME_TOKENS
+        + MESSAGE_TOKEN_OVERHEAD
+        + count_tokens(FUSION_PROMPT_TEMPLATE.format(vector_response="", kg_response="", query=query_text))
+    )
+    # 回答与模板文字相接处的分词可能合并或拆开，每段回答预留分隔开销
+    available = max(0, budget.prompt_tokens - fixed - 2 * ITEM_SEPARATOR_TOKENS)
+    vector_cap = max(available - count_tokens(kg_response), available // 2)
+    fitted_vector = truncate_to_tokens(vector_response, vector_cap, count_tokens)
+    vector_tokens = count_tokens(fitted_vector)
+    fitted_kg = truncate_to_tokens(kg_response, available - vector_tokens, count_tokens)
+
+    text = FUSION_PROMPT_TEMPLATE.format(
+        vector_response=fitted_vector, kg_response=fitted_kg, query=query_text
+    )
+    report = PromptTokenReport(
+        prompt_tokens=PROMPT_FRAME_TOKENS + MESSAGE_TOKEN_OVERHEAD + count_tokens(text),
+        budget_tokens=budget.prompt_tokens,
+        kg_tokens=count_tokens(fitted_kg),
+        kg_used=1,
+        chunk_tokens=vector_tokens,
+        chunks_used=1,
+        truncated=(fitted_vector != vector_response) + (fitted_kg != kg_response),
+    )
+    return text, report
@@ -0,0 +1,348 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Collection
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from injector import inject, singleton
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+
+from backend_app.api.Embedding.embedding_component import EmbeddingComponent
+from backend_app.api.Embedding.query_embedding_cache import normalize_query
+from backend_app.api.LLM.log_structured_kvstore import LogStructuredKVStore
+from backend_app.api.settings.settings import settings
+from backend_app.api.tools.redis_service import RedisService
+from backend_app.constants import get_local_data_path
+
+logger = logging.getLogger(__name__)
+
+REDIS_ENTRIES_KEY = "semantic_cache:entries"
+LOCAL_CACHE_FNAME = "semantic_answer_cache.json"
+LOCAL_COLLECTION = "entries"
+
+# 各类语料变更会影响的缓存模式（模式名与 ChatService._answer_cache_mode 一致）
+VECTOR_CORPUS_MODES = ("vector", "hybrid_fusion", "hybrid_single_pass")
+KG_CORPUS_MODES = ("kg", "hybrid_fusion", "hybrid_single_pass")
+
+
+@dataclass
+class CachedAnswer:
+    entry_id: str
+    scope: str
+    question: str
+    answer: str
+    sources: list[dict[str, Any]]
+    # 生成该回答的原始耗时，命中时用于统计节省的延迟
+    latency_seconds: float
+    created_at: float
+
+    def to_dict(self, embedding: np.ndarray) -> dict[str, Any]:
+        return {
+            "scope": self.scope,
+            "question": self.question,
+            "answer": self.answer,
+            "sources": self.sources,
+            "latency_seconds": self.latency_seconds,
+            "created_at": self.created_at,
+            "embedding": embedding.tolist(),
+        }
+
+
+@dataclass
+class SemanticCacheLookup:
+    """一次查找的结果；未命中时凭它写回，避免重复计算问题嵌入"""
+    scope: str
+    question: str
+    embedding: np.ndarray | None
+    hit: CachedAnswer | None = None
+    similarity: float | None = None
+    # 查找时的语料版本；生成期间发生过失效时不再写回
+    generation: int = 0
+
+
+class SemanticCacheStats(BaseModel):
+    enabled: bool
+    entries: int
+    lookups: int
+    hits: int
+    hit_rate: float
+    latency_saved_seconds: float
+    hits_by_mode: dict[str, int]
+    lookups_by_mode: dict[str, int]
+
+
+class _RedisEntryStore:
+    def __init__(self, redis_service: RedisService) -> None:
+        self._redis = redis_service
+
+    def load_all(self) -> dict[str, dict[str, Any]]:
+        return self._redis.hgetall(REDIS_ENTRIES_KEY)
+
+    def put(self, entry_id: str, value: dict[str, Any]) -> None:
+        self._redis.hset(REDIS_ENTRIES_KEY, entry_id, value)
+
+    def delete(self, entry_ids: list[str]) -> None:
+        if entry_ids:
+            self._redis.hdel(REDIS_ENTRIES_KEY, *entry_ids)
+
+
+class _LocalEntryStore:
+    def __init__(self) -> None:
+        self._persist_path = str(Path(get_local_data_path()) / LOCAL_CACHE_FNAME)
+        self._kvstore = LogStructuredKVStore.from_persist_path(self._persist_path)
+
+    def load_all(self) -> dict[str, dict[str, Any]]:
+        return self._kvstore.get_all(collection=LOCAL_COLLECTION)
+
+    def put(self, entry_id: str, value: dict[str, Any]) -> None:
+        self._kvstore.put(entry_id, value, collection=LOCAL_COLLECTION)
+        self._kvstore.persist(self._persist_path)
+
+    def delete(self, entry_ids: list[str]) -> None:
+        for entry_id in entry_ids:
+            self._kvstore.delete(entry_id, collection=LOCAL_COLLECTION)
+        if entry_ids:
+            self._kvstore.persist(self._persist_path)
+
+
+@dataclass
+class _ScopeIndex:
+    """同一作用域（模式+系统提示+过滤条件+查询参数）下的问题嵌入矩阵"""
+    entry_ids: list[str] = field(default_factory=list)
+    matrix: np.ndarray | None = None
+
+    def add(self, entry_id: str, embedding: np.ndarray) -> None:
+        self.entry_ids.append(entry_id)
+        row = embedding[np.newaxis, :]
+        self.matrix = row if self.matrix is None else np.vstack([self.matrix, row])
+
+    def remove(self, entry_ids: set[str]) -> None:
+        keep = [i for i, entry_id in enumerate(self.entry_ids) if entry_id not in entry_ids]
+        self.entry_ids = [self.entry_ids[i] for i in keep]
+        self.matrix = self.matrix[keep] if keep and self.matrix is not None else None
+
+
+@singleton
+class SemanticAnswerCache:
+    """
+    语义回答缓存：
+    1. 问题归一化后做嵌入，在同一作用域内按余弦相似度找最近的已缓存问题，不低于阈值即命中
+    2. 问题嵌入索引常驻内存，条目持久化到Redis哈希表或本地WAL文件，启动时加载
+    3. 统计命中率与节省的延迟（命中条目原始生成耗时 - 本次查找耗时）
+    4. 文档摄入/删除/清空时按受影响的模式失效，命中的回答及来源不会引用已删除的文档
+    """
+
+    @inject
+    def __init__(
+        self, embedding_component: EmbeddingComponent, redis_service: RedisService
+    ) -> None:
+        self._settings = settings().semantic_cache
+        self._embedding_model = embedding_component.embedding_model
+        self._lock = threading.Lock()
+        self._entries: dict[str, CachedAnswer] = {}
+        self._scopes: dict[str, _ScopeIndex] = {}
+        self._lookups: Counter[str] = Counter()
+        self._hits: Counter[str] = Counter()
+        self._latency_saved = 0.0
+        self._generation = 0
+
+        self._store: _RedisEntryStore | _LocalEntryStore | None = None
+        if self._settings.enabled:
+            self._store = (
+                _RedisEntryStore(redis_service)
+                if self._settings.backend == "redis"
+                else _LocalEntryStore()
+            )
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self._settings.enabled
+
+    @staticmethod
+    def scope(mode: str, **params: Any) -> str:
+        """作用域键：只有模式和影响回答的参数都相同的问题之间才做相似度匹配"""
+        payload = json.dumps({"mode": mode, **params}, ensure_ascii=False, sort_keys=True, default=str)
+        return f"{mode}:{hashlib.md5(payload.encode('utf-8')).hexdigest()}"
+
+    def lookup(self, scope: str, question: str) -> SemanticCacheLookup:
+        mode = scope.split(":", 1)[0]
+        start = time.perf_counter()
+        normalized = normalize_query(question)
+        # 嵌入原始问题：查询嵌入层以归一化文本为键，与本次请求的向量检索共用同一次嵌入
+        embedding = self._embed(question)
+        result = SemanticCacheLookup(scope=scope, question=normalized, embedding=embedding)
+        with self._lock:
+            result.generation = self._generation
+            self._lookups[mode] += 1
+            if embedding is None:
+                return result
+            self._evict_expired()
+            index = self._scopes.get(scope)
+            if index is None or index.matrix is None:
+                return result
+            similarities = index.matrix @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self._settings.similarity_threshold:
+                return result
+            result.hit = self._entries[index.entry_ids[best]]
+            result.similarity = float(similarities[best])
+            self._hits[mode] += 1
+            saved = max(0.0, result.hit.latency_seconds - (time.perf_counter() - start))
+            self._latency_saved += saved
+        logger.info(
+            f"语义缓存命中（{mode}）：问题「{question}」≈「{result.hit.question}」，"
+            f"相似度 {result.similarity:.3f}，节省 {saved:.2f}s"
+        )
+        return result
+
+    def store(
+        self,
+        lookup: SemanticCacheLookup,
+        answer: str,
+        sources: list[dict[str, Any]],
+        latency_seconds: float,
+    ) -> None:
+        if lookup.embedding is None or not answer:
+            return
+        entry = CachedAnswer(
+            entry_id=uuid.uuid4().hex,
+            scope=lookup.scope,
+            question=lookup.question,
+            answer=answer,
+            sources=sources,
+            latency_seconds=latency_seconds,
+            created_at=time.time(),
+        )
+        with self._lock:
+            if lookup.generation != self._generation:
+                # 生成期间语料已变更，回答可能引用了已删除的文档
+                return
+            self._add(entry, lookup.embedding)
+            evicted = self._evict_overflow()
+        self._persist(entry, lookup.embedding, evicted)
+
+    def invalidate(self, modes: Collection[str], reason: str) -> None:
+        """语料变更后删除受影响模式的全部条目；进行中的生成完成后也不再写回"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._generation += 1
+            stale = [
+                entry_id
+                for entry_id, entry in self._entries.items()
+                if entry.scope.split(":", 1)[0] in modes
+            ]
+            self._remove(stale)
+        self._delete_persisted(stale)
+        if stale:
+            logger.info(f"{reason}，语义缓存失效 {len(stale)} 条（模式 {', '.join(modes)}）")
+
+    def stats(self) -> SemanticCacheStats:
+        with self._lock:
+            lookups = sum(self._lookups.values())
+            hits = sum(self._hits.values())
+            return SemanticCacheStats(
+                enabled=self.enabled,
+                entries=len(self._entries),
+                lookups=lookups,
+                hits=hits,
+                hit_rate=hits / lookups if lookups else 0.0,
+                latency_saved_seconds=round(self._latency_saved, 3),
+                hits_by_mode=dict(self._hits),
+                lookups_by_mode=dict(self._lookups),
+            )
+
+    # ====================== 内部方法 ======================
+    def _embed(self, text: str) -> np.ndarray | None:
+        try:
+            vector = np.asarray(self._embedding_model.get_query_embedding(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"语义缓存计算问题嵌入失败，跳过缓存：{str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _add(self, entry: CachedAnswer, embedding: np.ndarray) -> None:
+        self._entries[entry.entry_id] = entry
+        self._scopes.setdefault(entry.scope, _ScopeIndex()).add(entry.entry_id, embedding)
+
+    def _remove(self, entry_ids: list[str]) -> None:
+        removed_by_scope: dict[str, set[str]] = {}
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                removed_by_scope.setdefault(entry.scope, set()).add(entry_id)
+        for scope, removed in removed_by_scope.items():
+            index = self._scopes[scope]
+            index.remove(removed)
+            if not index.entry_ids:
+                del self._scopes[scope]
+
+    def _evict_expired(self) -> None:
+        deadline = time.time() - self._settings.ttl_seconds
+        # 条目按写入顺序保存，遇到第一个未过期的即可停止
+        expired: list[str] = []
+        for entry_id, entry in self._entries.items():
+            if entry.created_at >= deadline:
+                break
+            expired.append(entry_id)
+        if expired:
+            self._remove(expired)
+            self._delete_persisted(expired)
+
+    def _evict_overflow(self) -> list[str]:
+        overflow = len(self._entries) - self._settings.max_entries
+        if overflow <= 0:
+            return []
+        evicted = list(self._entries)[:overflow]
+        self._remove(evicted)
+        return evicted
+
+    def _persist(self, entry: CachedAnswer, embedding: np.ndarray, evicted: list[str]) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.put(entry.entry_id, entry.to_dict(embedding))
+            self._store.delete(evicted)
+        except (RedisError, OSError) as e:
+            logger.warning(f"语义缓存条目持久化失败，仅保留在内存中：{str(e)}")
+
+    def _delete_persisted(self, entry_ids: list[str]) -> None:
+        if self._store is None:
+            return
+        try:
+            self._store.delete(entry_ids)
+        except (RedisError, OSError) as e:
+            logger.warning(f"语义缓存删除条目失败：{str(e)}")
+
+    def _load(self) -> None:
+        assert self._store is not None
+        try:
+            stored = self._store.load_all()
+        except (RedisError, OSError) as e:
+            logger.warning(f"语义缓存加载失败，从空缓存开始：{str(e)}")
+            return
+        for entry_id, value in sorted(stored.items(), key=lambda item: item[1]["created_at"]):
+            entry = CachedAnswer(
+                entry_id=entry_id,
+                scope=value["scope"],
+                question=value["question"],
+                answer=value["answer"],
+                sources=value["sources"],
+                latency_seconds=value["latency_seconds"],
+                created_at=value["created_at"],
+            )
+            self._add(entry, np.asarray(value["embedding"], dtype=np.float32))
+        with self._lock:
+            self._evict_expired()
+            self._delete_persisted(self._evict_overflow())
+        logger.info(f"语义缓存加载完成：{len(self._entries)} 条（后端 {self._settings.backend}）")
@@ -1,3 +1,5 @@
+import logging
+import time
 from typing import Literal
 
 from fastapi import APIRouter, Request
@@ -7,7 +9,9 @@ from backend_app.api.LLM.context_filter import ContextFilter
 from backend_app.api.llm_api.chunks.chunks_service import Chunk, ChunksService
 
 
-chunks_router = APIRouter(prefix="/v1")
+logger = logging.getLogger(__name__)
+
+chunks_router = APIRouter()
 
 
 class ChunksBody(BaseModel):
@@ -23,9 +27,28 @@ class ChunksResponse(BaseModel):
     data: list[Chunk]
 
 
-@chunks_router.post("/chunks", tags=["Context Chunks"])
+class ChunksBatchBody(BaseModel):
+    texts: list[str] = Field(min_length=1, max_length=256, examples=[["Q3 2023 sales", "Q4 2023 sales"]])
+    context_filter: ContextFilter | None = None
+    limit: int = 10
+    prev_next_chunks: int = Field(default=0, examples=[2])
+
+
+class ChunksQueryResult(BaseModel):
+    text: str
+    data: list[Chunk]
+
+
+class ChunksBatchResponse(BaseModel):
+    object: Literal["list"]
+    model: Literal["private-gpt"]
+    data: list[ChunksQueryResult]
+    elapsed_seconds: float
+    queries_per_second: float
+
+
+@chunks_router.post("", tags=["Context Chunks"])
 def chunks_retrieval(request: Request, body: ChunksBody) -> ChunksResponse:
-  
     service = request.state.injector.get(ChunksService)
     results = service.retrieve_relevant(
         body.text, body.context_filter, body.limit, body.prev_next_chunks
@@ -35,3 +58,23 @@ def chunks_retrieval(request: Request, body: ChunksBody) -> ChunksResponse:
         model="private-gpt",
         data=results,
     )
+
+
+@chunks_router.post("/batch", tags=["Context Chunks"])
+def chunks_batch_retrieval(request: Request, body: ChunksBatchBody) -> ChunksBatchResponse:
+    """多条查询一次请求：批量嵌入 + Qdrant批量检索，结果按查询顺序返回"""
+    service = request.state.injector.get(ChunksService)
+    started_at = time.perf_counter()
+    results = service.retrieve_relevant_batch(
+        body.texts, body.context_filter, body.limit, body.prev_next_chunks
+    )
+    elapsed = time.perf_counter() - started_at
+    queries_per_second = len(body.texts) / elapsed if elapsed > 0 else 0.0
+    logger.info(f"批量检索 {len(body.texts)} 条查询，耗时 {elapsed:.3f}s，{queries_per_second:.1f} queries/s")
+    return ChunksBatchResponse(
+        object="list",
+        model="private-gpt",
+        data=[ChunksQueryResult(text=text, data=chunks) for text, chunks in zip(body.texts, results)],
+        elapsed_seconds=round(elapsed, 4),
+        queries_per_second=round(queries_per_second, 2),
+    )
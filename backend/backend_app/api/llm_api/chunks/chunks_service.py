@@ -2,11 +2,13 @@ from typing import TYPE_CHECKING, Literal
 
 from injector import inject, singleton
 from llama_index.core.indices import VectorStoreIndex
-from llama_index.core.schema import NodeWithScore
+from llama_index.core.schema import BaseNode, NodeWithScore
 from llama_index.core.storage import StorageContext
+from llama_index.core.storage.docstore.types import RefDocInfo
 from pydantic import BaseModel, Field
 
 from backend_app.api.Embedding.embedding_component import EmbeddingComponent
+from backend_app.api.Embedding.query_embedding_cache import batch_query_embeddings
 from backend_app.api.LLM.llm_component import LLMComponent
 from backend_app.api.LLM.node_store_component import NodeStoreComponent
 from backend_app.api.LLM.vector_store_component import (
@@ -72,9 +74,65 @@ class ChunksService:
             index_store=node_store_component.index_store,
         )
 
+        # 索引只是向量库的包装，构建一次后所有请求共用
+        self.index = VectorStoreIndex.from_vector_store(
+            vector_store_component.vector_store,
+            storage_context=self.storage_context,
+            llm=llm_component.llm,
+            embed_model=embedding_component.embedding_model,
+            show_progress=True,
+        )
+
+    def _prefetch_siblings(
+        self, nodes: list[NodeWithScore], related_number: int
+    ) -> dict[str, BaseNode]:
+        """
+        按文档的节点顺序（ref_doc_info.node_ids）算出所有命中节点前后related_number个兄弟节点的id，
+        去重后一次 get_nodes 批量取回；命中节点本身直接放入结果，不再重复读取
+        """
+        known: dict[str, BaseNode] = {node.node.node_id: node.node for node in nodes}
+        if related_number <= 0:
+            return known
+
+        docstore = self.storage_context.docstore
+        doc_positions: dict[str, tuple[RefDocInfo, dict[str, int]] | None] = {}
+        wanted: set[str] = set()
+        for node_with_score in nodes:
+            ref_doc_id = node_with_score.node.ref_doc_id
+            if ref_doc_id is None:
+                continue
+            if ref_doc_id not in doc_positions:
+                ref_doc_info = docstore.get_ref_doc_info(ref_doc_id)
+                doc_positions[ref_doc_id] = (
+                    (ref_doc_info, {node_id: i for i, node_id in enumerate(ref_doc_info.node_ids)})
+                    if ref_doc_info is not None
+                    else None
+                )
+            entry = doc_positions[ref_doc_id]
+            if entry is None:
+                continue
+            ref_doc_info, positions = entry
+            position = positions.get(node_with_score.node.node_id)
+            if position is None:
+                continue
+            wanted.update(ref_doc_info.node_ids[max(0, position - related_number):position])
+            wanted.update(ref_doc_info.node_ids[position + 1:position + 1 + related_number])
+
+        missing = [node_id for node_id in wanted if node_id not in known]
+        if missing:
+            for node in docstore.get_nodes(missing, raise_error=False):
+                known[node.node_id] = node
+        return known
+
     def _get_sibling_nodes_text(
-        self, node_with_score: NodeWithScore, related_number: int, forward: bool = True
+        self,
+        node_with_score: NodeWithScore,
+        related_number: int,
+        forward: bool = True,
+        prefetched: dict[str, BaseNode] | None = None,
     ) -> list[str]:
+        """沿prev/next关系逐跳走，优先使用预取结果；预取未覆盖的节点（顺序不一致时）再单独读取"""
+        prefetched = prefetched if prefetched is not None else {}
         explored_nodes_texts = []
         current_node = node_with_score.node
         for _ in range(related_number):
@@ -84,9 +142,12 @@ class ChunksService:
             if explored_node_info is None:
                 break
 
-            explored_node = self.storage_context.docstore.get_node(
-                explored_node_info.node_id
-            )
+            explored_node = prefetched.get(explored_node_info.node_id)
+            if explored_node is None:
+                explored_node = self.storage_context.docstore.get_node(
+                    explored_node_info.node_id
+                )
+                prefetched[explored_node.node_id] = explored_node
 
             explored_nodes_texts.append(explored_node.get_content())
             current_node = explored_node
@@ -100,26 +161,51 @@ class ChunksService:
         limit: int = 10,
         prev_next_chunks: int = 0,
     ) -> list[Chunk]:
-        index = VectorStoreIndex.from_vector_store(
-            self.vector_store_component.vector_store,
-            storage_context=self.storage_context,
-            llm=self.llm_component.llm,
-            embed_model=self.embedding_component.embedding_model,
-            show_progress=True,
-        )
         vector_index_retriever = self.vector_store_component.get_retriever(
-            index=index, context_filter=context_filter, similarity_top_k=limit
+            index=self.index, context_filter=context_filter, similarity_top_k=limit
         )
         nodes = vector_index_retriever.retrieve(text)
         nodes.sort(key=lambda n: n.score or 0.0, reverse=True)
 
-        retrieved_nodes = []
-        for node in nodes:
-            chunk = Chunk.from_node(node)
-            chunk.previous_texts = self._get_sibling_nodes_text(
-                node, prev_next_chunks, False
-            )
-            chunk.next_texts = self._get_sibling_nodes_text(node, prev_next_chunks)
-            retrieved_nodes.append(chunk)
+        prefetched = self._prefetch_siblings(nodes, prev_next_chunks)
+        return [self._to_chunk(node, prev_next_chunks, prefetched) for node in nodes]
 
-        return retrieved_nodes
+    def retrieve_relevant_batch(
+        self,
+        texts: list[str],
+        context_filter: ContextFilter | None = None,
+        limit: int = 10,
+        prev_next_chunks: int = 0,
+    ) -> list[list[Chunk]]:
+        """
+        批量检索：所有查询一次嵌入、一次Qdrant批量检索，
+        兄弟节点对全部命中统一预取，结果按查询顺序返回
+        """
+        if not texts:
+            return []
+        embeddings = batch_query_embeddings(self.embedding_component.embedding_model, texts)
+        results = self.vector_store_component.batch_search(
+            embeddings, context_filter=context_filter, similarity_top_k=limit
+        )
+        prefetched = self._prefetch_siblings(
+            [node for nodes in results for node in nodes], prev_next_chunks
+        )
+        return [
+            [self._to_chunk(node, prev_next_chunks, prefetched) for node in nodes]
+            for nodes in results
+        ]
+
+    def _to_chunk(
+        self,
+        node: NodeWithScore,
+        prev_next_chunks: int,
+        prefetched: dict[str, BaseNode],
+    ) -> Chunk:
+        chunk = Chunk.from_node(node)
+        chunk.previous_texts = self._get_sibling_nodes_text(
+            node, prev_next_chunks, False, prefetched
+        )
+        chunk.next_texts = self._get_sibling_nodes_text(
+            node, prev_next_chunks, True, prefetched
+        )
+        return chunk
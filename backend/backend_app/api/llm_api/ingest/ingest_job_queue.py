@@ -0,0 +1,274 @@
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Literal
+
+from injector import inject, singleton
+from llama_index.core.schema import Document
+
+from backend_app.api.ingest.ingest_hash_index import IngestDedupStats
+from backend_app.api.ingest.ingest_helper import IngestionHelper
+from backend_app.api.ingest.kg_triplet_extractor import TripletExtractionStats
+from backend_app.api.ingest.upload_spool import SpooledUpload, spool_upload
+from backend_app.api.llm_api.ingest.ingest_service import IngestService
+from backend_app.api.llm_api.ingest.ingest_service_kg_rag import Neo4jKGRAGService
+from backend_app.api.llm_api.ingest.model import IngestedDoc, IngestJob, IngestJobStage
+from backend_app.api.settings.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFullError(RuntimeError):
+    """排队任务已达上限"""
+
+
+@singleton
+class IngestJobQueue:
+    """
+    后台摄入任务队列：
+    1. 请求线程只负责把上传内容落盘并登记任务，立即返回job_id
+    2. 固定大小的线程池按提交顺序执行：文件只解析一次，解析结果同时交给向量索引和知识图谱
+    3. 向量索引嵌入完成即可检索（ready_indexes），知识图谱在后台线程继续构建
+    4. 任务状态保存在内存中，结束后保留 job_ttl_seconds 供查询
+    """
+
+    @inject
+    def __init__(
+        self,
+        ingest_service: IngestService,
+        kg_service: Neo4jKGRAGService,
+    ) -> None:
+        self.ingest_service = ingest_service
+        self.kg_service = kg_service
+        self._settings = settings().ingest
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, self._settings.max_concurrent_jobs),
+            thread_name_prefix="ingest-job",
+        )
+        # 知识图谱构建（LLM三元组提取）远慢于嵌入，单独排队且串行写入同一个KG索引
+        self._kg_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-kg")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, IngestJob] = {}
+        self._queued_ids: list[str] = []
+        self._pipelines_left: dict[str, int] = {}
+
+    # ====================== 提交与查询 ======================
+    def submit(self, file_name: str, raw_file_data: BinaryIO) -> IngestJob:
+        self._evict_expired_jobs()
+        with self._lock:
+            if len(self._queued_ids) >= self._settings.max_queued_jobs:
+                raise IngestQueueFullError(
+                    f"摄入队列已满（{self._settings.max_queued_jobs} 个任务排队中），请稍后重试"
+                )
+
+        job = IngestJob(
+            job_id=uuid.uuid4().hex,
+            file_name=file_name,
+            created_at=time.time(),
+            stages=[
+                IngestJobStage(name=name) for name in ("upload", "parse", "vector", "kg")
+            ],
+        )
+        upload_stage = job.stage("upload")
+        upload_stage.status = "running"
+        upload_stage.started_at = time.time()
+
+        # 请求结束后UploadFile会被关闭：分块落盘并顺带计算哈希，两条管线共用这一份文件
+        upload = spool_upload(file_name, raw_file_data)
+        job.file_size = upload.size
+        self._finish_stage(upload_stage)
+
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._queued_ids.append(job.job_id)
+        self._executor.submit(self._run_job, job.job_id, upload)
+        logger.info(f"摄入任务已排队：{job.job_id}（文件 {file_name}，{job.file_size} 字节）")
+        return self.get(job.job_id)
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = job.model_copy(deep=True)
+            if job_id in self._queued_ids:
+                snapshot.queue_position = self._queued_ids.index(job_id) + 1
+        return snapshot
+
+    def _evict_expired_jobs(self) -> None:
+        deadline = time.time() - self._settings.job_ttl_seconds
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < deadline
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    # ====================== 执行 ======================
+    def _run_job(self, job_id: str, upload: SpooledUpload) -> None:
+        """解析一次，随后向量索引在本线程构建，知识图谱交给后台线程并行构建"""
+        with self._lock:
+            self._queued_ids.remove(job_id)
+            job = self._jobs[job_id]
+            job.status = "running"
+            job.started_at = time.time()
+            self._pipelines_left[job_id] = 2
+
+        vector_stats = IngestDedupStats(file_hash=upload.file_hash)
+        kg_stats = IngestDedupStats(file_hash=upload.file_hash)
+        try:
+            existing_docs = self.ingest_service.get_existing_docs(vector_stats)
+            existing_docs_kg = self.kg_service.get_existing_docs(kg_stats)
+            documents: list[Document] = []
+            if existing_docs is None or existing_docs_kg is None:
+                documents = self._run_stage(
+                    job,
+                    "parse",
+                    lambda: IngestionHelper.transform_file_into_documents(
+                        job.file_name, upload.path
+                    ),
+                    count_chunks=len,
+                )
+            else:
+                with self._lock:
+                    job.stage("parse").status = "skipped"
+        except Exception as e:
+            self._fail_job(job, e, skip_pending=True)
+            self._pipeline_done(job, count=2)
+            return
+        finally:
+            # 解析结果已在内存中共享，临时文件不再需要
+            upload.cleanup()
+
+        if existing_docs_kg is None:
+            extraction_stats = TripletExtractionStats()
+            self._kg_executor.submit(
+                self._run_pipeline,
+                job,
+                "kg",
+                lambda: self.kg_service.ingest_documents(
+                    job.file_name, documents, kg_stats, extraction_stats
+                ),
+                kg_stats,
+                extraction_stats,
+            )
+        else:
+            self._mark_index_ready(job, "kg", existing_docs_kg, kg_stats)
+            self._pipeline_done(job)
+
+        if existing_docs is None:
+            self._run_pipeline(
+                job,
+                "vector",
+                lambda: self.ingest_service.ingest_documents(job.file_name, documents, vector_stats),
+                vector_stats,
+            )
+        else:
+            self._mark_index_ready(job, "vector", existing_docs, vector_stats)
+            self._pipeline_done(job)
+
+    def _run_pipeline(
+        self,
+        job: IngestJob,
+        index: Literal["vector", "kg"],
+        fn: Callable[[], list[IngestedDoc]],
+        dedup_stats: IngestDedupStats,
+        extraction_stats: TripletExtractionStats | None = None,
+    ) -> None:
+        try:
+            ingested_docs = self._run_stage(
+                job, index, fn, count_chunks=lambda _: dedup_stats.chunks_total
+            )
+            if extraction_stats is not None:
+                with self._lock:
+                    stage = job.stage(index)
+                    stage.triplets = extraction_stats.triplets
+                    stage.triplets_per_sec = extraction_stats.triplets_per_sec
+            self._mark_index_ready(job, index, ingested_docs, dedup_stats)
+        except Exception as e:
+            self._fail_job(job, e)
+        self._pipeline_done(job)
+
+    def _mark_index_ready(
+        self,
+        job: IngestJob,
+        index: Literal["vector", "kg"],
+        ingested_docs: list[IngestedDoc],
+        dedup_stats: IngestDedupStats,
+    ) -> None:
+        with self._lock:
+            stage = job.stage(index)
+            if stage.status == "pending":
+                stage.chunks = dedup_stats.chunks_total
+                stage.started_at = time.time()
+                self._finish_stage(stage)
+            if index == "vector":
+                job.data = ingested_docs
+            else:
+                job.data_kg = ingested_docs
+            job.dedup[index] = dedup_stats
+            job.ready_indexes.append(index)
+        logger.info(f"摄入任务 {job.job_id}：{index} 索引已就绪")
+
+    def _fail_job(
+        self, job: IngestJob, error: Exception, skip_pending: bool = False
+    ) -> None:
+        logger.error(f"摄入任务 {job.job_id} 失败：{error!s}", exc_info=error)
+        with self._lock:
+            job.error = job.error or str(error)
+            if skip_pending:
+                for stage in job.stages:
+                    if stage.status == "pending":
+                        stage.status = "skipped"
+
+    def _pipeline_done(self, job: IngestJob, count: int = 1) -> None:
+        """向量与知识图谱两条管线都结束后，才结束整个任务"""
+        with self._lock:
+            self._pipelines_left[job.job_id] -= count
+            if self._pipelines_left[job.job_id] > 0:
+                return
+            del self._pipelines_left[job.job_id]
+            job.status = "failed" if job.error else "completed"
+            job.finished_at = time.time()
+            elapsed = job.finished_at - (job.started_at or job.finished_at)
+            if elapsed > 0:
+                job.bytes_per_sec = job.file_size / elapsed
+        logger.info(f"摄入任务结束：{job.job_id}，状态 {job.status}")
+
+    def _run_stage(
+        self,
+        job: IngestJob,
+        name: str,
+        fn: Callable[[], Any],
+        count_chunks: Callable[[Any], int],
+    ) -> Any:
+        stage = job.stage(name)
+        with self._lock:
+            stage.status = "running"
+            stage.started_at = time.time()
+        try:
+            result = fn()
+        except Exception as e:
+            with self._lock:
+                stage.status = "failed"
+                stage.error = str(e)
+                stage.finished_at = time.time()
+                stage.elapsed_seconds = stage.finished_at - stage.started_at
+            raise
+        with self._lock:
+            stage.chunks = count_chunks(result)
+            self._finish_stage(stage)
+        return result
+
+    @staticmethod
+    def _finish_stage(stage: IngestJobStage) -> None:
+        stage.status = "completed"
+        stage.finished_at = time.time()
+        stage.elapsed_seconds = stage.finished_at - (stage.started_at or stage.finished_at)
+        if stage.chunks and stage.elapsed_seconds > 0:
+            stage.chunks_per_sec = stage.chunks / stage.elapsed_seconds
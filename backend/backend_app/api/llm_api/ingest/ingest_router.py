@@ -2,11 +2,15 @@
 
 from typing import Literal
 
-from fastapi import APIRouter, HTTPException, Request, UploadFile
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile
 from pydantic import BaseModel
 
+from backend_app.api.llm_api.ingest.ingest_job_queue import (
+    IngestJobQueue,
+    IngestQueueFullError,
+)
 from backend_app.api.llm_api.ingest.ingest_service import IngestService
-from backend_app.api.llm_api.ingest.model import IngestedDoc
+from backend_app.api.llm_api.ingest.model import IngestedDoc, IngestJob
 from backend_app.api.llm_api.ingest.ingest_service_kg_rag import Neo4jKGRAGService
 
 
@@ -21,34 +25,58 @@ class IngestResponse(BaseModel):
     model: Literal["private-gpt"]
     data: list[IngestedDoc]
     data_kg: list[IngestedDoc]
+    total: int = 0
+    total_kg: int = 0
+    offset: int = 0
+    limit: int | None = None
 
 @ingest_router.post("/file")
-def ingest_file(request: Request, file: UploadFile) -> IngestResponse:
-
-    service = request.state.injector.get(IngestService)
+def ingest_file(request: Request, file: UploadFile) -> IngestJob:
+    """提交后台摄入任务（rag + kg_rag），立即返回job_id，进度通过 /jobs/{job_id} 查询"""
     if file.filename is None:
         raise HTTPException(400, "No file name provided")
-    #rag
-    ingested_documents = service.ingest_bin_data(file.filename, file.file)
-    #kg_rag
-    kg_service = request.state.injector.get(Neo4jKGRAGService)
-    ingested_documents_kg_rag = kg_service.ingest_bin_data(file.filename, file.file)
-    #logger.info(f"Ingested: {ingested_documents} --------------ingested_documents_kg_rag: {ingested_documents_kg_rag} ")
-    return IngestResponse(object="list", model="private-gpt", data=ingested_documents, data_kg=
-                          ingested_documents_kg_rag)
+    job_queue = request.state.injector.get(IngestJobQueue)
+    try:
+        return job_queue.submit(file.filename, file.file)
+    except IngestQueueFullError as e:
+        raise HTTPException(429, str(e)) from e
 
 
-@ingest_router.get("/list")
-def list_ingested(request: Request) -> IngestResponse:
+@ingest_router.get("/jobs/{job_id}")
+def get_ingest_job(request: Request, job_id: str) -> IngestJob:
+    job_queue = request.state.injector.get(IngestJobQueue)
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Ingest job {job_id} not found")
+    return job
 
+
+@ingest_router.get("/list")
+def list_ingested(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, description="每页数量，不传则返回全部"),
+    file_name: str | None = Query(None, description="按文件名过滤（不区分大小写的子串匹配）"),
+    file_type: str | None = Query(None, description="按文件类型（扩展名）过滤，如 pdf"),
+) -> IngestResponse:
+    """分页列出已摄入文档；数据来自内存文档目录，total/total_kg 为过滤后的总数"""
     service = request.state.injector.get(IngestService)
     #rag
-    ingested_documents = service.list_ingested()
+    page = service.catalog.page(offset, limit, file_name, file_type)
     #kg_rag
     kg_service = request.state.injector.get(Neo4jKGRAGService)
-    ingested_documents_kg_rag = kg_service.list_ingested_kg_docs()
-    logger.info(f"向量数据库: {ingested_documents} --------------知识图谱: {ingested_documents_kg_rag} ")
-    return IngestResponse(object="list", model="private-gpt", data=ingested_documents, data_kg=ingested_documents_kg_rag)
+    kg_page = kg_service.catalog.page(offset, limit, file_name, file_type)
+    logger.debug(f"文档列表：向量数据库 {len(page.docs)}/{page.total}，知识图谱 {len(kg_page.docs)}/{kg_page.total}")
+    return IngestResponse(
+        object="list",
+        model="private-gpt",
+        data=page.docs,
+        data_kg=kg_page.docs,
+        total=page.total,
+        total_kg=kg_page.total,
+        offset=offset,
+        limit=limit,
+    )
 
 
 @ingest_router.delete("/{doc_id}/{kg_docId}")
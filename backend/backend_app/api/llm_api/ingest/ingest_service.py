@@ -1,18 +1,31 @@
-import tempfile
 from pathlib import Path
-from typing import TYPE_CHECKING, AnyStr, BinaryIO
+from typing import TYPE_CHECKING, BinaryIO
 
 from injector import inject, singleton
 from llama_index.core.node_parser import SentenceWindowNodeParser
+from llama_index.core.schema import Document
 from llama_index.core.storage import StorageContext
 
 from backend_app.api.Embedding.embedding_component import EmbeddingComponent
+from backend_app.api.ingest.document_catalog import DocumentCatalog
 from backend_app.api.ingest.ingest_component import get_ingestion_component
+from backend_app.api.ingest.ingest_helper import IngestionHelper
+from backend_app.api.ingest.ingest_hash_index import (
+    VECTOR_NAMESPACE,
+    IngestDedupStats,
+    IngestHashIndexComponent,
+)
+from backend_app.api.ingest.upload_spool import SpooledUpload, spool_upload
+from backend_app.api.LLM.bm25_index_component import BM25IndexComponent
 from backend_app.api.LLM.llm_component import LLMComponent
 from backend_app.api.LLM.node_store_component import NodeStoreComponent
 from backend_app.api.LLM.vector_store_component import (
     VectorStoreComponent,
 )
+from backend_app.api.llm_api.chat.semantic_answer_cache import (
+    VECTOR_CORPUS_MODES,
+    SemanticAnswerCache,
+)
 from backend_app.api.llm_api.ingest.model import IngestedDoc
 from backend_app.api.settings.settings import settings
 
@@ -32,8 +45,14 @@ class IngestService:
         vector_store_component: VectorStoreComponent,
         embedding_component: EmbeddingComponent,
         node_store_component: NodeStoreComponent,
+        hash_index: IngestHashIndexComponent,
+        lexical_index: BM25IndexComponent,
+        answer_cache: SemanticAnswerCache,
     ) -> None:
         self.llm_service = llm_component
+        self.answer_cache = answer_cache
+        self.hash_index = hash_index
+        self.lexical_index = lexical_index
         self.storage_context = StorageContext.from_defaults(
             vector_store=vector_store_component.vector_store,
             docstore=node_store_component.doc_store,
@@ -46,41 +65,118 @@ class IngestService:
             embed_model=embedding_component.embedding_model,
             transformations=[node_parser, embedding_component.embedding_model],
             settings=settings(),
+            hash_index=hash_index,
+            lexical_index=lexical_index,
         )
+        # 文档列表由内存目录提供，随摄入/删除增量维护
+        self.catalog = DocumentCatalog("向量RAG", self._load_ingested)
         #logger.info(f"~~~~~~~~~~~~:{node_store_component.index_store}------{node_store_component.doc_store}------{vector_store_component.vector_store}")
         #self.delete_all_ingested_data()
 
-    def _ingest_data(self, file_name: str, file_data: AnyStr) -> list[IngestedDoc]:
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            try:
-                path_to_tmp = Path(tmp.name)
-                if isinstance(file_data, bytes):
-                    path_to_tmp.write_bytes(file_data)
-                else:
-                    path_to_tmp.write_text(str(file_data))
-                return self.ingest_file(file_name, path_to_tmp)
-            finally:
-                tmp.close()
-                path_to_tmp.unlink()
-
-    def ingest_file(self, file_name: str, file_data: Path) -> list[IngestedDoc]:
-        documents = self.ingest_component.ingest(file_name, file_data)
-        logger.info(f"生成文档：{documents}")
-        return [IngestedDoc.from_document(document) for document in documents]
+    def ingest_file(
+        self,
+        file_name: str,
+        file_data: Path,
+        dedup_stats: IngestDedupStats | None = None,
+    ) -> list[IngestedDoc]:
+        documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
+        return self.ingest_documents(file_name, documents, dedup_stats)
+
+    def ingest_documents(
+        self,
+        file_name: str,
+        documents: list[Document],
+        dedup_stats: IngestDedupStats | None = None,
+    ) -> list[IngestedDoc]:
+        """摄入已解析的文档（与KG-RAG共用同一次解析结果）"""
+        documents = self.ingest_component.ingest_documents(documents, dedup_stats)
+        logger.info(f"生成文档：{len(documents)} 个（文件 {file_name}）")
+        if dedup_stats is not None:
+            self.hash_index.add_file(
+                VECTOR_NAMESPACE,
+                dedup_stats.file_hash,
+                file_name,
+                [document.doc_id for document in documents],
+            )
+            self.hash_index.persist()
+        ingested_docs = [IngestedDoc.from_document(document) for document in documents]
+        self.catalog.add(ingested_docs)
+        self.answer_cache.invalidate(VECTOR_CORPUS_MODES, f"摄入文件 {file_name}")
+        return ingested_docs
 
     def ingest_bin_data(
         self, file_name: str, raw_file_data: BinaryIO
     ) -> list[IngestedDoc]:
-        file_data = raw_file_data.read()
-        return self._ingest_data(file_name, file_data)
+        ingested_docs, _ = self.ingest_bin_data_with_stats(file_name, raw_file_data)
+        return ingested_docs
+
+    def ingest_bin_data_with_stats(
+        self, file_name: str, raw_file_data: BinaryIO
+    ) -> tuple[list[IngestedDoc], IngestDedupStats]:
+        """摄入上传文件，并返回去重节省的工作量；内容已摄入过的文件直接返回已有doc_id"""
+        with spool_upload(file_name, raw_file_data) as upload:
+            return self.ingest_spooled(file_name, upload)
+
+    def ingest_spooled(
+        self, file_name: str, upload: SpooledUpload
+    ) -> tuple[list[IngestedDoc], IngestDedupStats]:
+        """摄入已落盘的上传文件（调用方负责清理），哈希在落盘时已算好"""
+        dedup_stats = IngestDedupStats(file_hash=upload.file_hash)
+
+        existing_docs = self.get_existing_docs(dedup_stats)
+        if existing_docs is not None:
+            logger.info(f"文件 {file_name} 内容已摄入过（hash={dedup_stats.file_hash}），跳过解析与嵌入")
+            return existing_docs, dedup_stats
+
+        return self.ingest_file(file_name, upload.path, dedup_stats), dedup_stats
+
+    def get_existing_docs(
+        self, dedup_stats: IngestDedupStats
+    ) -> list[IngestedDoc] | None:
+        doc_ids = self.hash_index.get_file_doc_ids(VECTOR_NAMESPACE, dedup_stats.file_hash)
+        if not doc_ids:
+            return None
+
+        docstore = self.storage_context.docstore
+        ingested_docs: list[IngestedDoc] = []
+        node_count = 0
+        for doc_id in doc_ids:
+            ref_doc_info = docstore.get_ref_doc_info(doc_id)
+            if ref_doc_info is None:
+                # 文档已被删除，哈希记录失效
+                return None
+            node_count += len(ref_doc_info.node_ids)
+            ingested_docs.append(
+                IngestedDoc(
+                    object="ingest.document",
+                    doc_id=doc_id,
+                    doc_metadata=IngestedDoc.curate_metadata(dict(ref_doc_info.metadata)),
+                )
+            )
+
+        dedup_stats.duplicate_file = True
+        dedup_stats.chunks_total = node_count
+        dedup_stats.chunks_reused = node_count
+        dedup_stats.embeddings_saved = node_count
+        return ingested_docs
+
+    def bulk_ingest(self, files: list[tuple[str, Path]]) -> list[IngestedDoc]:
+        documents = self.ingest_component.bulk_ingest(files)
+        ingested_docs = [IngestedDoc.from_document(document) for document in documents]
+        self.catalog.add(ingested_docs)
+        self.answer_cache.invalidate(VECTOR_CORPUS_MODES, f"批量摄入 {len(files)} 个文件")
+        return ingested_docs
     
 
     def list_ingested(self) -> list[IngestedDoc]:
+        return self.catalog.all()
+
+    def _load_ingested(self) -> list[IngestedDoc]:
+        """从docstore全量读取文档列表，仅在目录首次加载时调用"""
         ingested_docs: list[IngestedDoc] = []
         try:
             docstore = self.storage_context.docstore
             ref_docs: dict[str, RefDocInfo] | None = docstore.get_all_ref_doc_info()
-            logger.info(f"ref_docs:::: {ref_docs}")
             if not ref_docs:
                 return ingested_docs
 
@@ -150,6 +246,9 @@ class IngestService:
                 # 若 doc_store 支持刷新，强制刷新缓存
                 doc_store.refresh()
             logger.info("✅ DocStore 清理结果已强制持久化/刷新")
+            self.catalog.clear()
+            self.lexical_index.clear()
+            self.answer_cache.invalidate(VECTOR_CORPUS_MODES, "清空向量RAG数据")
 
         except Exception as e:
             logger.error("❌ 删除全量摄入数据失败", exc_info=True)
@@ -159,4 +258,9 @@ class IngestService:
         logger.info(
             "Deleting the ingested document=%s in the doc and index store", doc_id
         )
-        self.ingest_component.delete(doc_id)
\ No newline at end of file
+        self.ingest_component.delete(doc_id)
+        self.catalog.remove(doc_id)
+        self.lexical_index.remove_ref_doc(doc_id)
+        self.hash_index.remove_doc(VECTOR_NAMESPACE, doc_id)
+        self.hash_index.persist()
+        self.answer_cache.invalidate(VECTOR_CORPUS_MODES, f"删除文档 {doc_id}")
\ No newline at end of file
@@ -1,10 +1,9 @@
 import os
 import re
-import tempfile
 import logging
-import time
+import threading
 from pathlib import Path
-from typing import TYPE_CHECKING, AnyStr, BinaryIO, List, Optional, Tuple
+from typing import TYPE_CHECKING, BinaryIO, List, Optional, Tuple
 from dataclasses import dataclass
 from backend_app.constants import get_local_kg_data_path 
 
@@ -13,16 +12,43 @@ from injector import inject, singleton
 from backend_app.api.LLM.llm_component import LLMComponent
 from backend_app.api.Embedding.embedding_component import EmbeddingComponent
 from backend_app.api.LLM.node_store_component import NodeKgStoreComponent
+from backend_app.api.LLM.provenance_graph_store import (
+    ProvenanceNeo4jGraphStore,
+    TripletSource,
+)
+from backend_app.api.ingest.document_catalog import DocumentCatalog
+from backend_app.api.ingest.ingest_hash_index import (
+    KG_NAMESPACE,
+    IngestDedupStats,
+    IngestHashIndexComponent,
+)
+from backend_app.api.ingest.ingest_helper import IngestionHelper
+from backend_app.api.ingest.kg_provenance_index import KGProvenanceIndexComponent
+from backend_app.api.llm_api.chat.semantic_answer_cache import (
+    KG_CORPUS_MODES,
+    SemanticAnswerCache,
+)
+from backend_app.api.ingest.kg_triplet_extractor import (
+    KGTripletExtractorComponent,
+    TripletExtractionStats,
+)
+from backend_app.api.ingest.upload_spool import SpooledUpload, spool_upload
 from backend_app.api.llm_api.ingest.model import IngestedDoc
 from backend_app.api.settings.settings import settings
 
 # LlamaIndex 核心依赖
 from llama_index.core import load_index_from_storage, StorageContext
 from llama_index.core.indices.knowledge_graph import KnowledgeGraphIndex
+from llama_index.core.indices.knowledge_graph.retrievers import (
+    KGRetrieverMode,
+    KGTableRetriever,
+)
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.prompts.default_prompts import DEFAULT_KG_TRIPLET_EXTRACT_PROMPT
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore
 from llama_index.core.schema import Document as LlamaDoc
 from llama_index.core.storage.docstore.types import RefDocInfo
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
+from llama_index.core.data_structs.struct_type import IndexStructType
 
 from backend_app.api.LLM.vector_store_component import (
     VectorStoreComponent,
@@ -49,6 +75,20 @@ class Neo4jConfig:
 # ====================== 固定索引常量 ======================
 KG_RAG_INDEX_ID = "kg_rag_index"  # 定义固定索引ID
 
+
+class _EmbeddingOnlyKGRetriever(KGTableRetriever):
+    """纯嵌入检索三元组：跳过基类无条件执行的LLM关键词提取（嵌入模式下其结果不会被使用）"""
+
+    def _get_keywords(self, query_str: str) -> list[str]:
+        return []
+
+
+@dataclass
+class KGRetrievedContext:
+    """只检索不生成的KG上下文：相关三元组文本 + 三元组所在的原文块"""
+    rel_texts: list[str]
+    text_nodes: list[NodeWithScore]
+
 # ====================== 知识图谱RAG服务（单例+依赖注入） ======================
 @singleton
 class Neo4jKGRAGService:
@@ -66,10 +106,16 @@ class Neo4jKGRAGService:
         vector_store_component: VectorStoreComponent,
         # 保留node_store_component，但仅作为参考，不复用其存储
         node_kg_store_component: NodeKgStoreComponent,
+        hash_index: IngestHashIndexComponent,
+        triplet_extractor: KGTripletExtractorComponent,
+        provenance_index: KGProvenanceIndexComponent,
+        answer_cache: SemanticAnswerCache,
         neo4j_config: Neo4jConfig = Neo4jConfig()
     ):
         # 复用项目现有组件
         self.llm_component = llm_component
+        self.hash_index = hash_index
+        self.answer_cache = answer_cache
         self.embedding_component = embedding_component
         self.node_kg_store_component = node_kg_store_component
         self.vector_store_component = vector_store_component
@@ -80,24 +126,18 @@ class Neo4jKGRAGService:
         logger.info(f"✅ Neo4j图谱存储初始化完成：{self.neo4j_config}")
         
         # ========== 关键修复：确保StorageContext始终包含默认vector_store ==========
+        # docstore/index_store 统一由 NodeKgStoreComponent 加载（兼容快照与WAL两种持久化模式），
+        # 不再直接从持久化目录读取json，否则WAL中尚未压缩的变更会丢失
         if get_local_kg_data_path().exists():
-            # 目录存在且有文件：从本地加载StorageContext，并强制绑定vector_store
-            logger.info(f"✅ 检测到KG本地存储目录存在: {get_local_kg_data_path()}，开始加载本地索引")
-            self.storage_context = StorageContext.from_defaults(
-                persist_dir=get_local_kg_data_path(),  # 仅指定持久化目录
-                graph_store=self.graph_store,
-                # 关键修复：显式指定默认vector_store
-                vector_store=self.vector_store_component.vector_store
-            )
+            logger.info(f"✅ 检测到KG本地存储目录存在: {get_local_kg_data_path()}，使用已加载的本地索引")
         else:
-            # 目录不存在/为空：重新初始化StorageContext（兼容旧逻辑）
             logger.warning(f"⚠️ KG本地存储目录不存在或为空: {get_local_kg_data_path()}，重新初始化存储上下文")
-            self.storage_context = StorageContext.from_defaults(
-                vector_store=self.vector_store_component.vector_store,
-                docstore=self.node_kg_store_component.doc_store,
-                index_store=self.node_kg_store_component.index_store,
-                graph_store=self.graph_store
-            )
+        self.storage_context = StorageContext.from_defaults(
+            vector_store=self.vector_store_component.vector_store,
+            docstore=self.node_kg_store_component.doc_store,
+            index_store=self.node_kg_store_component.index_store,
+            graph_store=self.graph_store
+        )
         
         # 额外防护：确保vector_stores字典中有default键
         if not hasattr(self.storage_context, 'vector_stores') or 'default' not in self.storage_context.vector_stores:
@@ -107,6 +147,17 @@ class Neo4jKGRAGService:
         logger.info(f"✅ KG存储上下文初始化完成-------------{self.storage_context}")
         # 节点分割器（与原有RAG使用相同的分割策略，保持一致）
         self.node_parser = SentenceSplitter.from_defaults()
+
+        # 三元组提取：构建索引前并发预取，索引构建时按块文本取用
+        self.triplet_extractor = triplet_extractor
+        self.provenance_index = provenance_index
+        self.kg_triplet_template = DEFAULT_KG_TRIPLET_EXTRACT_PROMPT.partial_format(
+            max_knowledge_triplets=self.neo4j_config.max_triplets_per_chunk
+        )
+        self._prefetched_triplets: dict[str, list[tuple[str, str, str]]] = {}
+        self._ingest_lock = threading.Lock()
+        # KG文档列表由内存目录提供，随摄入/删除增量维护
+        self.catalog = DocumentCatalog("KG-RAG", self._load_kg_docs)
         
         # KG索引延迟初始化
         self.kg_index: Optional[KnowledgeGraphIndex] = None
@@ -119,10 +170,10 @@ class Neo4jKGRAGService:
         if self.kg_index_exists:
             self._load_kg_index_on_startup()
 
-    def _init_graph_store(self) -> Neo4jGraphStore:
+    def _init_graph_store(self) -> ProvenanceNeo4jGraphStore:
         """初始化Neo4j图谱存储（异常捕获+日志，原有逻辑不变）"""
         try:
-            graph_store = Neo4jGraphStore(
+            graph_store = ProvenanceNeo4jGraphStore(
                 username=self.neo4j_config.username,
                 password=self.neo4j_config.password,
                 url=self.neo4j_config.url,
@@ -274,22 +325,14 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
         try:
             logger.info("🔄 启动时主动加载KG索引（自动识别UUID索引ID）...")
             
-            # ========== 核心修复1：先读取index_store.json，找到KG类型的索引UUID ==========
-            kg_path = get_local_kg_data_path()
-            index_store_file = kg_path / "index_store.json"
-            
+            # ========== 核心修复1：从index_store中找到KG类型的索引UUID ==========
+            # 直接读取内存中的index_store（快照+WAL重放后的最新状态），而不是index_store.json
             target_index_id = None
-            if index_store_file.exists():
-                import json
-                with open(index_store_file, 'r', encoding='utf-8') as f:
-                    index_store_data = json.load(f)
-                
-                # 遍历所有索引，找到KG类型的索引（__type__ == "kg"）
-                for idx_id, idx_data in index_store_data.get("index_store/data", {}).items():
-                    if idx_data.get("__type__") == "kg":
-                        target_index_id = idx_id
-                        logger.info(f"✅ 找到KG类型的索引UUID: {target_index_id}")
-                        break
+            for index_struct in self.storage_context.index_store.index_structs():
+                if index_struct.get_type() == IndexStructType.KG:
+                    target_index_id = index_struct.index_id
+                    logger.info(f"✅ 找到KG类型的索引UUID: {target_index_id}")
+                    break
             
             # ========== 核心修复2：根据找到的UUID加载索引 ==========
             if target_index_id:
@@ -303,6 +346,7 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
                 self.kg_index._embed_model = self.embedding_component.embedding_model
                 self.kg_index._graph_store = self.graph_store
                 self.kg_index._node_parser = self.node_parser
+                self.kg_index._kg_triplet_extract_fn = self._extract_triplets
                 logger.info(f"✅ 启动时成功加载KG索引（UUID: {target_index_id}）")
             else:
                 logger.warning("⚠️ 未找到KG类型的索引，索引可能尚未构建")
@@ -378,34 +422,33 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
             logger.error(f"❌ 清理Neo4j无效三元组失败: {str(e)}", exc_info=True)
 
     # ====================== 文档处理（核心修改：绑定固定索引ID） ======================
-    def _ingest_data(self, file_name: str, file_data: AnyStr) -> list[IngestedDoc]:
-        PROJECT_TMP_DIR = Path(__file__).parent.parent.parent.parent / "tmp"
-        PROJECT_TMP_DIR.mkdir(exist_ok=True, mode=0o777)
-        path_to_tmp = None
-
-        try:
-            with tempfile.NamedTemporaryFile(
-                dir=str(PROJECT_TMP_DIR),
-                suffix=Path(file_name).suffix,
-                delete=False
-            ) as tmp:
-                path_to_tmp = Path(tmp.name)
-                if isinstance(file_data, bytes):
-                    tmp.write(file_data)
-                else:
-                    tmp.write(str(file_data).encode("utf-8"))
-                tmp.flush()
-                os.fsync(tmp.fileno())
+    def _prefetch_triplets(
+        self, nodes: list[BaseNode], stats: TripletExtractionStats | None = None
+    ) -> list[TripletSource]:
+        texts = [node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes]
+        triplets = self.triplet_extractor.extract(
+            texts,
+            self.kg_triplet_template,
+            self.neo4j_config.max_triplets_per_chunk,
+            stats=stats,
+        )
+        self._prefetched_triplets = dict(zip(texts, triplets))
+        return [
+            TripletSource(
+                subj=subj, rel=rel, obj=obj, doc_id=node.ref_doc_id, chunk_id=node.node_id
+            )
+            for node, node_triplets in zip(nodes, triplets)
+            for subj, rel, obj in node_triplets
+        ]
 
-            return self.ingest_file(file_name, path_to_tmp)
-        finally:
-            if path_to_tmp and path_to_tmp.exists():
-                try:
-                    time.sleep(0.5)
-                    path_to_tmp.unlink()
-                    logger.debug(f"✅ 临时文件 {path_to_tmp} 已成功清理")
-                except Exception as e:
-                    logger.warning(f"⚠️ 清理临时文件失败：{str(e)}，文件将残留，建议后续定时清理")
+    def _extract_triplets(self, text: str) -> list[tuple[str, str, str]]:
+        """供KnowledgeGraphIndex调用：优先取预取结果，未命中时单独提取"""
+        triplets = self._prefetched_triplets.pop(text, None)
+        if triplets is None:
+            triplets = self.triplet_extractor.extract(
+                [text], self.kg_triplet_template, self.neo4j_config.max_triplets_per_chunk
+            )[0]
+        return triplets
 
     def _clean_document_text(self, text: str) -> str:
         if not text:
@@ -427,24 +470,54 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
         
         return text
 
-    def ingest_file(self, file_name: str, file_data: Path) -> list[IngestedDoc]:
-        # 1. 加载文档
-        from llama_index.core import SimpleDirectoryReader
-        documents = SimpleDirectoryReader(input_files=[file_data]).load_data()
+    def ingest_file(
+        self,
+        file_name: str,
+        file_data: Path,
+        dedup_stats: IngestDedupStats | None = None,
+    ) -> list[IngestedDoc]:
+        # 1. 加载文档（与向量RAG使用同一套读取器）
+        documents = IngestionHelper.transform_file_into_documents(file_name, file_data)
         logger.info(f"加载文件 {file_name} 完成，原始文档块数量：{len(documents)}")
+        return self.ingest_documents(file_name, documents, dedup_stats)
 
+    def ingest_documents(
+        self,
+        file_name: str,
+        documents: list[LlamaDoc],
+        dedup_stats: IngestDedupStats | None = None,
+        extraction_stats: TripletExtractionStats | None = None,
+    ) -> list[IngestedDoc]:
+        """基于已解析的文档构建图谱；documents 可能同时被向量RAG使用，只读不改"""
+        # 同一个KG索引的写入串行执行
+        with self._ingest_lock:
+            return self._build_kg_from_documents(
+                file_name, documents, dedup_stats, extraction_stats
+            )
+
+    def _build_kg_from_documents(
+        self,
+        file_name: str,
+        documents: list[LlamaDoc],
+        dedup_stats: IngestDedupStats | None,
+        extraction_stats: TripletExtractionStats | None,
+    ) -> list[IngestedDoc]:
         # 2. 文档内容预处理
         processed_docs = []
         for doc in documents:
             clean_text = self._clean_document_text(doc.text)
             if clean_text:
+                metadata = {k: v for k, v in doc.metadata.items() if k != "doc_id"}
+                metadata["original_file_name"] = file_name
+                metadata["index_id"] = KG_RAG_INDEX_ID  # 标记文档所属索引
                 processed_doc = LlamaDoc(
                     text=clean_text,
-                    metadata=doc.metadata,
-                    id_=doc.id_
+                    metadata=metadata,
+                    id_=doc.id_,
+                    # 元数据（文件名等）不参与三元组提取，避免抽出与业务无关的三元组
+                    excluded_llm_metadata_keys=list(metadata),
+                    excluded_embed_metadata_keys=list(metadata),
                 )
-                processed_doc.metadata["original_file_name"] = file_name
-                processed_doc.metadata["index_id"] = KG_RAG_INDEX_ID  # 标记文档所属索引
                 processed_docs.append(processed_doc)
         logger.info(f"文档预处理完成，有效文档块数量：{len(processed_docs)}")
 
@@ -457,71 +530,83 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
         if not hasattr(self.storage_context, 'vector_stores') or 'default' not in self.storage_context.vector_stores:
             self.storage_context.vector_stores['default'] = self.vector_store_component.vector_store
         
-        # 4. 构建知识图谱索引（复用向量库，存储到KG专属存储，指定固定索引ID）
-        if self.kg_index is None:
-            # 首次构建：创建新索引并指定固定ID
-            self.kg_index = KnowledgeGraphIndex.from_documents(
-                documents=processed_docs,
-                storage_context=self.storage_context,
-                max_triplets_per_chunk=self.neo4j_config.max_triplets_per_chunk,
-                include_embeddings=self.neo4j_config.include_embeddings,
-                embed_model=self.embedding_component.embedding_model,
-                llm=self.llm_component.llm,
-                node_parser=self.node_parser,
-                index_id=KG_RAG_INDEX_ID,  # 关键：指定固定索引ID
-                # 三元组提取提示（原有逻辑不变）
-                kg_triple_extract_template="""
-                # 任务要求
-                从以下文本中仅提取**业务内容相关**的三元组（主体，关系，客体），严格遵守以下规则：
-
-                # 过滤规则（必须遵守）
-                1. 完全忽略任何与文件系统相关的内容，包括但不限于：
-                - 文件路径（如：E:\、/home/user、C:/）
-                - 文件名（如：document.txt、image.png）
-                - 目录名（如：tmp、Backend_app、Ai）
-                - 盘符（如：C:、D:）
-                2. 只提取文本中描述实体、属性、关系的有效信息。
-                3. 主体和客体必须是有实际业务含义的名词/短语，关系必须是能体现两者关联的动词/介词短语。
-
-                # 好的示例
-                - ("Python", "是一种", "编程语言")
-                - ("牛顿", "提出了", "万有引力定律")
-                - ("《三体》", "的作者是", "刘慈欣")
-
-                # 坏的示例（请不要输出这样的内容）
-                - ("E:", "IS_LOCATED_IN", "Ai")
-                - ("Tmpfile.txt", "HAS_CONTENT", "data")
-
-                # 输出格式（仅返回列表，无其他文字）
-                [("主体1", "关系1", "客体1"), ("主体2", "关系2", "客体2")]
-
-                # 需要提取的文本
-                {text}
-                """ 
-            )
-
-            try:
-                # 方案1：直接调用index_store的set_index_metadata（无需导入类）
-                # 不管底层实现是什么，直接调用方法即可
-                self.storage_context.index_store.set_index_metadata(
-                    KG_RAG_INDEX_ID,
-                    {
-                        "type": "knowledge_graph", 
-                        "version": "1.0",
-                        "created_at": datetime.datetime.now().isoformat()
-                    }
+        # 4. 并发提取全部块的三元组，连同来源（doc_id/chunk_id）批量写入Neo4j
+        nodes = self.node_parser.get_nodes_from_documents(processed_docs)
+        extraction_stats = extraction_stats or TripletExtractionStats()
+        sources = self._prefetch_triplets(nodes, extraction_stats)
+        self.graph_store.upsert_triplets_with_sources(sources)
+        self.provenance_index.add_sources(sources)
+        self.provenance_index.persist()
+        if dedup_stats is not None:
+            dedup_stats.chunks_total = len(nodes)
+            # 命中三元组缓存的块不再调用LLM
+            dedup_stats.chunks_reused = extraction_stats.cache_hits
+            dedup_stats.llm_calls_saved = extraction_stats.cache_hits
+
+        # 5. 构建知识图谱索引（复用向量库，存储到KG专属存储，指定固定索引ID）
+        # 三元组已带来源批量写入Neo4j，索引构建只负责关键词表和三元组嵌入
+        with self.graph_store.suppress_triplet_upserts():
+            if self.kg_index is None:
+                # 首次构建：创建新索引并指定固定ID
+                self.kg_index = KnowledgeGraphIndex(
+                    nodes=nodes,
+                    storage_context=self.storage_context,
+                    max_triplets_per_chunk=self.neo4j_config.max_triplets_per_chunk,
+                    include_embeddings=self.neo4j_config.include_embeddings,
+                    embed_model=self.embedding_component.embedding_model,
+                    llm=self.llm_component.llm,
+                    kg_triplet_extract_template=self.kg_triplet_template,
+                    kg_triplet_extract_fn=self._extract_triplets,
+                    index_id=KG_RAG_INDEX_ID,  # 关键：指定固定索引ID
+                    # 三元组提取提示（原有逻辑不变）
+                    kg_triple_extract_template="""
+                    # 任务要求
+                    从以下文本中仅提取**业务内容相关**的三元组（主体，关系，客体），严格遵守以下规则：
+
+                    # 过滤规则（必须遵守）
+                    1. 完全忽略任何与文件系统相关的内容，包括但不限于：
+                    - 文件路径（如：E:\、/home/user、C:/）
+                    - 文件名（如：document.txt、image.png）
+                    - 目录名（如：tmp、Backend_app、Ai）
+                    - 盘符（如：C:、D:）
+                    2. 只提取文本中描述实体、属性、关系的有效信息。
+                    3. 主体和客体必须是有实际业务含义的名词/短语，关系必须是能体现两者关联的动词/介词短语。
+
+                    # 好的示例
+                    - ("Python", "是一种", "编程语言")
+                    - ("牛顿", "提出了", "万有引力定律")
+                    - ("《三体》", "的作者是", "刘慈欣")
+
+                    # 坏的示例（请不要输出这样的内容）
+                    - ("E:", "IS_LOCATED_IN", "Ai")
+                    - ("Tmpfile.txt", "HAS_CONTENT", "data")
+
+                    # 输出格式（仅返回列表，无其他文字）
+                    [("主体1", "关系1", "客体1"), ("主体2", "关系2", "客体2")]
+
+                    # 需要提取的文本
+                    {text}
+                    """ 
                 )
-                logger.info(f"已将索引ID {KG_RAG_INDEX_ID} 写入index_store")
-            except Exception as e:
-                logger.warning(f"写入索引元数据失败（不影响核心功能）: {str(e)}") 
-        else:
-            # 增量添加：向已有索引中添加文档
-            logger.info(f"📄 向已有KG索引（{KG_RAG_INDEX_ID}）增量添加文档")
-            self.kg_index.insert_nodes(
-                nodes=self.node_parser.get_nodes_from_documents(processed_docs),
-                max_triplets_per_chunk=self.neo4j_config.max_triplets_per_chunk,
-                include_embeddings=self.neo4j_config.include_embeddings
-            )
+
+                try:
+                    # 方案1：直接调用index_store的set_index_metadata（无需导入类）
+                    # 不管底层实现是什么，直接调用方法即可
+                    self.storage_context.index_store.set_index_metadata(
+                        KG_RAG_INDEX_ID,
+                        {
+                            "type": "knowledge_graph", 
+                            "version": "1.0",
+                            "created_at": datetime.datetime.now().isoformat()
+                        }
+                    )
+                    logger.info(f"已将索引ID {KG_RAG_INDEX_ID} 写入index_store")
+                except Exception as e:
+                    logger.warning(f"写入索引元数据失败（不影响核心功能）: {str(e)}") 
+            else:
+                # 增量添加：向已有索引中添加文档
+                logger.info(f"📄 向已有KG索引（{KG_RAG_INDEX_ID}）增量添加文档")
+                self.kg_index.insert_nodes(nodes)
         
         self.storage_context.persist(persist_dir=get_local_kg_data_path())
         # 启用无效三元组清理（原有注释取消）
@@ -531,35 +616,35 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
         self.kg_index_exists = True
         self._save_kg_index_status_to_neo4j(True, KG_RAG_INDEX_ID)
         
-        # 5. 从Neo4j中获取三元组并过滤无效数据
-        try:
-            cypher_query = """MATCH (s)-[r]->(o) RETURN s.id AS subject, type(r) AS relation, o.id AS object"""
-            query_results = self.graph_store.query(cypher_query)
-            all_triples = [
-                (result["subject"], result["relation"], result["object"]) 
-                for result in query_results
-            ]
-            
-            # 后过滤无效三元组
-            valid_triples = []
-            invalid_keywords = ['E:', 'Tmp', 'tmp', '.txt', 'backend_app', 'llama3.2-projec', 'Backend_app', 'Ai']
-            for triple in all_triples:
-                if not any(keyword in str(triple) for keyword in invalid_keywords):
-                    valid_triples.append(triple)
-            
-            logger.info(f"✅ 知识图谱索引构建完成（索引ID: {KG_RAG_INDEX_ID}）：")
-            logger.info(f"   - 原始三元组数量：{len(all_triples)}")
-            logger.info(f"   - 有效三元组数量：{len(valid_triples)}")
-            logger.info(f"   - 有效三元组内容：{valid_triples if valid_triples else '无有效三元组'}")
-            
-        except Exception as e:
-            logger.error(f"获取Neo4j三元组数量失败: {str(e)}", exc_info=True)
-            logger.warning(f"⚠️ 无法获取三元组数量，已降级为0（文件：{file_name}）")
-
-        # 6. 映射为项目统一的IngestedDoc模型
-        current_ingested_docs = [IngestedDoc.from_document(doc) for doc in processed_docs]
+        # 6. 统计本次写入的三元组（不再全图查询并逐条打印）
+        entities = {source.subj for source in sources} | {source.obj for source in sources}
+        logger.info(
+            f"✅ 知识图谱索引构建完成（索引ID: {KG_RAG_INDEX_ID}）：文件 {file_name} "
+            f"写入 {len(sources)} 条三元组，涉及 {len(entities)} 个实体"
+        )
+        logger.debug(f"本次写入的三元组：{[(source.subj, source.rel, source.obj) for source in sources]}")
+
+        # 7. 映射为项目统一的IngestedDoc模型
+        current_ingested_docs = [
+            IngestedDoc(
+                object="ingest.kg_document",
+                doc_id=doc.doc_id,
+                doc_metadata=dict(doc.metadata),
+            )
+            for doc in processed_docs
+        ]
+        self.catalog.add(current_ingested_docs)
+        self.answer_cache.invalidate(KG_CORPUS_MODES, f"摄入KG文件 {file_name}")
+        if dedup_stats is not None:
+            self.hash_index.add_file(
+                KG_NAMESPACE,
+                dedup_stats.file_hash,
+                file_name,
+                [doc.doc_id for doc in processed_docs],
+            )
+            self.hash_index.persist()
         
-        # 7. 查询KG专属存储中所有已入库的全量文档
+        # 8. KG专属存储中所有已入库的全量文档（内存目录，无需遍历docstore）
         all_ingested_docs = self.list_ingested_kg_docs()
         
         logger.info(f"✅ 当前上传文档数：{len(current_ingested_docs)}，KG专属存储全量文档数：{len(all_ingested_docs)}")
@@ -567,16 +652,58 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
 
     def ingest_bin_data(self, file_name: str, raw_file_data: BinaryIO) -> list[IngestedDoc]:
         """处理二进制文件流（原有逻辑不变）"""
+        ingested_docs, _ = self.ingest_bin_data_with_stats(file_name, raw_file_data)
+        return ingested_docs
+
+    def ingest_bin_data_with_stats(
+        self, file_name: str, raw_file_data: BinaryIO
+    ) -> tuple[list[IngestedDoc], IngestDedupStats]:
+        """处理二进制文件流；内容已构建过图谱的文件跳过解析和三元组提取"""
+        with spool_upload(file_name, raw_file_data) as upload:
+            return self.ingest_spooled(file_name, upload)
+
+    def ingest_spooled(
+        self, file_name: str, upload: SpooledUpload
+    ) -> tuple[list[IngestedDoc], IngestDedupStats]:
+        """直接读取已落盘的上传文件（与向量RAG共用同一份），不再复制临时文件"""
         try:
-            raw_file_data.seek(0)
-            file_data = raw_file_data.read()
-            return self._ingest_data(file_name, file_data)
+            dedup_stats = IngestDedupStats(file_hash=upload.file_hash)
+            existing_docs = self.get_existing_docs(dedup_stats)
+            if existing_docs is not None:
+                logger.info(f"文件 {file_name} 内容已构建过知识图谱（hash={dedup_stats.file_hash}），跳过三元组提取")
+                return existing_docs, dedup_stats
+            return self.ingest_file(file_name, upload.path, dedup_stats), dedup_stats
         except Exception as e:
-            logger.error(f"处理二进制文件 {file_name} 失败: {str(e)}", exc_info=True)
+            logger.error(f"处理上传文件 {file_name} 失败: {str(e)}", exc_info=True)
             raise
 
+    def get_existing_docs(
+        self, dedup_stats: IngestDedupStats
+    ) -> list[IngestedDoc] | None:
+        """内容已构建过图谱时返回KG文档列表，否则返回None"""
+        if not self._is_known_file(dedup_stats):
+            return None
+        return self.list_ingested_kg_docs()
+
+    def _is_known_file(self, dedup_stats: IngestDedupStats) -> bool:
+        doc_ids = self.hash_index.get_file_doc_ids(KG_NAMESPACE, dedup_stats.file_hash)
+        if not doc_ids or self.kg_index is None:
+            return False
+        node_count = 0
+        for doc_id in doc_ids:
+            ref_doc_info = self.storage_context.docstore.get_ref_doc_info(doc_id)
+            if ref_doc_info is None:
+                return False
+            node_count += len(ref_doc_info.node_ids)
+        # 每个块对应一次三元组提取的LLM调用
+        dedup_stats.duplicate_file = True
+        dedup_stats.chunks_total = node_count
+        dedup_stats.chunks_reused = node_count
+        dedup_stats.llm_calls_saved = node_count
+        return True
+
     # ====================== 知识图谱RAG查询（优化加载逻辑） ======================
-    def get_kg_query_engine(self,** kwargs) -> "QueryEngine":
+    def _require_kg_index(self) -> KnowledgeGraphIndex:
         # 再次校验本地文件
         if not self.kg_index_exists:
             # 重新检查本地文件
@@ -591,6 +718,10 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
             self._load_kg_index_on_startup()  # 复用启动加载逻辑
             if not self.kg_index:
                 raise RuntimeError(f"知识图谱索引加载失败，请重新上传文档")
+        return self.kg_index
+
+    def get_kg_query_engine(self,** kwargs) -> "QueryEngine":
+        self._require_kg_index()
  
         # 默认配置（可通过kwargs覆盖）
         query_config = {
@@ -604,11 +735,60 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
 
         return self.kg_index.as_query_engine(** query_config)
 
+    def retrieve_kg_context(
+        self, query_text: str, similarity_top_k: int = 5, include_text: bool = True, **kwargs
+    ) -> KGRetrievedContext:
+        """
+        只检索不生成：按查询嵌入取最相似的三元组，并取回三元组所在的原文块，
+        供单次生成的混合RAG直接拼入提示词
+        """
+        kg_index = self._require_kg_index()
+        retriever_kwargs = {
+            "similarity_top_k": similarity_top_k,
+            "include_text": include_text,
+            "graph_store_query_depth": kwargs.get("graph_store_query_depth", 2),
+        }
+        if kg_index.index_struct.embedding_dict:
+            retriever: KGTableRetriever = _EmbeddingOnlyKGRetriever(
+                kg_index,
+                object_map=kg_index._object_map,
+                llm=self.llm_component.llm,
+                embed_model=self.embedding_component.embedding_model,
+                retriever_mode=KGRetrieverMode.EMBEDDING,
+                **retriever_kwargs,
+            )
+        else:
+            # 未构建三元组嵌入时只能按关键词检索（需一次简短的LLM关键词提取）
+            retriever = kg_index.as_retriever(
+                retriever_mode=KGRetrieverMode.KEYWORD,
+                embed_model=self.embedding_component.embedding_model,
+                **retriever_kwargs,
+            )
+
+        rel_texts: list[str] = []
+        text_nodes: list[NodeWithScore] = []
+        with self._chat_query_timeout():
+            retrieved = retriever.retrieve(query_text)
+        for node_with_score in retrieved:
+            metadata = node_with_score.node.metadata
+            if "kg_rel_texts" in metadata:
+                rel_texts.extend(str(rel_text) for rel_text in metadata["kg_rel_texts"])
+            elif node_with_score.node.ref_doc_id is not None:
+                # 无来源文档的是检索器的占位节点（No relationships found.）
+                text_nodes.append(node_with_score)
+        return KGRetrievedContext(rel_texts=rel_texts, text_nodes=text_nodes)
+
+    def _chat_query_timeout(self):
+        """对话路径的KG检索使用Neo4j事务超时：上层等待超时后，仍在执行的查询由服务端终止并释放线程"""
+        timeout = settings().neo4j.query_timeout_seconds
+        return self.graph_store.query_timeout(timeout if timeout > 0 else None)
+
     def query_kg_rag(self, query_text: str, **kwargs) -> str:
         """执行知识图谱RAG查询"""
         try:
             query_engine = self.get_kg_query_engine(** kwargs)
-            response = query_engine.query(query_text)
+            with self._chat_query_timeout():
+                response = query_engine.query(query_text)
             return str(response)
         except Exception as e:
             logger.error(f"KG RAG查询失败(索引ID: {KG_RAG_INDEX_ID}): {str(e)}", exc_info=True)
@@ -621,37 +801,39 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
             raise RuntimeError("Neo4j图谱存储未初始化")
         # 清空Neo4j图数据
         self.graph_store.query("MATCH (n) DETACH DELETE n")
-        # 清空KG专属文档存储和索引存储
-        self.node_kg_store_component.doc_store.clear()
-        self.node_kg_store_component.index_store.clear()
+        self.provenance_index.clear()
+        self.provenance_index.persist()
+        # 清空KG专属文档存储和索引存储（三元组缓存保留，重建时直接重放）
+        doc_store = self.storage_context.docstore
+        for ref_doc_id in list((doc_store.get_all_ref_doc_info() or {}).keys()):
+            doc_store.delete_ref_doc(ref_doc_id)
+        index_store = self.storage_context.index_store
+        for index_struct in index_store.index_structs():
+            index_store.delete_index_struct(index_struct.index_id)
+        self.storage_context.persist(persist_dir=get_local_kg_data_path())
         # 重置KG索引
         self.kg_index = None
         # 同步状态到Neo4j
         self.kg_index_exists = False
         self._save_kg_index_status_to_neo4j(False, KG_RAG_INDEX_ID)
+        self.answer_cache.invalidate(KG_CORPUS_MODES, "清空知识图谱数据")
+        self.catalog.clear()
         logger.warning(f"⚠️ Neo4j所有数据及KG专属存储数据已清空（索引ID: {KG_RAG_INDEX_ID}）")
 
     def list_ingested_kg_docs(self) -> list[IngestedDoc]:
+        return self.catalog.all()
+
+    def _load_kg_docs(self) -> list[IngestedDoc]:
         """
-        优化版：直接读取docstore.json获取文档列表（不依赖kg_index）
+        读取docstore中的ref_doc_info获取文档列表（不依赖kg_index），仅在目录首次加载时调用
         """
         try:
-            kg_path = get_local_kg_data_path()
-            docstore_file = kg_path / "docstore.json"
-            
-            if not docstore_file.exists():
-                logger.info("docstore.json不存在，返回空文档列表")
-                return []
-            
-            import json
-            with open(docstore_file, 'r', encoding='utf-8') as f:
-                docstore_data = json.load(f)
-            
+            ref_docs = self.storage_context.docstore.get_all_ref_doc_info() or {}
             ingested_docs = []
             
             # 遍历ref_doc_info，筛选index_id=kg_rag_index的文档
-            for doc_id, doc_info in docstore_data.get('docstore/ref_doc_info', {}).items():
-                metadata = doc_info.get('metadata', {})
+            for doc_id, doc_info in ref_docs.items():
+                metadata = doc_info.metadata or {}
                 # 只返回归属kg_rag_index的文档
                 if metadata.get('index_id') == KG_RAG_INDEX_ID:
                     ingested_docs.append(
@@ -662,7 +844,7 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
                         )
                     )
             
-            logger.info(f"✅ 从docstore.json读取到KG文档列表: {len(ingested_docs)} 个")
+            logger.info(f"✅ 从docstore读取到KG文档列表: {len(ingested_docs)} 个")
             return ingested_docs
             
         except Exception as e:
@@ -672,92 +854,71 @@ CREATE (n:KGIndexStatus {exists: $exists, update_time: $update_time, node_desc:
     def delete_kg_doc(self, doc_id: str) -> None:
         """
         真正删除指定ID的KG文档（修改持久化文件+清理关联数据）
+        与摄入共用同一把锁：摄入在后台任务线程中写关键词表和来源索引，删除必须与之串行
         """
         try:
-            logger.info(f"开始删除KG文档(索引ID: {KG_RAG_INDEX_ID}): {doc_id}")
-            
-            # 安全检查：确保kg_index已初始化
-            if self.kg_index is None:
-                logger.warning(f"KG索引未初始化，尝试加载固定索引 {KG_RAG_INDEX_ID} 后再删除")
-                self._load_kg_index_on_startup()
-                if not self.kg_index:
-                    raise RuntimeError("KG索引加载失败，无法删除文档")
-            
-            # ========== 关键修复1：先找到原始文档关联的所有节点ID ==========
-            node_ids_to_delete = []
-            # 1. 从 ref_doc_info 中获取该文档关联的节点ID
-            if doc_id in self.kg_index.ref_doc_info:
-                node_ids_to_delete = self.kg_index.ref_doc_info[doc_id].node_ids
-                # 删除 ref_doc_info 中的记录
-                del self.kg_index.ref_doc_info[doc_id]
-                logger.info(f"已删除 ref_doc_info 中文档 {doc_id} 的记录")
-            
-            # ========== 关键修复2：删除 docstore 中的节点数据（内存中） ==========
-            for node_id in node_ids_to_delete:
-                if node_id in self.kg_index.docstore.docs:
-                    del self.kg_index.docstore.docs[node_id]
-                    logger.info(f"已删除 docstore 中节点 {node_id} 的记录")
-            
-            # ========== 关键修复3：删除 metadata 中的关联记录 ==========
-            # 遍历并删除该文档/节点的 metadata 记录
-            metadata_keys_to_delete = []
-            if hasattr(self.kg_index.docstore, '_metadata'):
-                for key in self.kg_index.docstore._metadata.keys():
-                    # 删除原始文档的 metadata
-                    if key == doc_id:
-                        metadata_keys_to_delete.append(key)
-                    # 删除节点的 metadata
-                    elif key in node_ids_to_delete:
-                        metadata_keys_to_delete.append(key)
-                
-                for key in metadata_keys_to_delete:
-                    del self.kg_index.docstore._metadata[key]
-                    logger.info(f"已删除 metadata 中 {key} 的记录")
-            
-            # ========== 关键修复4：强制重新持久化 storage_context ==========
-            # 清空原有持久化文件（关键！否则旧数据会残留）
-            kg_path = get_local_kg_data_path()
-            docstore_file = kg_path / "docstore.json"
-            if docstore_file.exists():
-                docstore_file.unlink()  # 删除原有文件
-                logger.info(f"已删除原有 docstore.json 文件")
-            
-            # 重新持久化（生成新的 docstore.json）
-            self.storage_context.persist(persist_dir=kg_path)
-            logger.info(f"已重新持久化 storage_context，docstore.json 已更新")
-            
-            # ========== 补充：尝试删除 Neo4j 中关联的三元组（基于文本内容匹配） ==========
-            # 注意：这是近似删除，因为三元组和文档没有强绑定
-            try:
-                # 从 docstore 中获取原始文档文本（如果还能拿到）
-                if hasattr(self.kg_index.docstore, 'get_document'):
-                    try:
-                        doc = self.kg_index.docstore.get_document(doc_id)
-                        if doc and doc.text:
-                            # 简单匹配：删除包含文档特征文本的节点
-                            # 注意：这是近似匹配，可能误删，生产环境需更精准的策略
-                            clean_text = self._clean_document_text(doc.text)
-                            # 提取文档中的核心实体
-                            entities = re.findall(r'[\u4e00-\u9fa5]{2,}|[A-Za-z0-9_]{3,}', clean_text)[:5]  # 取前5个核心实体
-                            if entities:
-                                entities_str = ", ".join([f"'{e}'" for e in entities])
-                                delete_cypher = f"""
-                                MATCH (n) 
-                                WHERE ANY(prop IN keys(n) WHERE 
-                                    toString(n[prop]) IN [{entities_str}]
-                                )
-                                DETACH DELETE n
-                                """
-                                self.graph_store.query(delete_cypher)
-                                logger.info(f"已删除 Neo4j 中与文档 {doc_id} 关联的三元组（基于实体匹配）")
-                    except:
-                        logger.warning(f"无法获取文档 {doc_id} 的文本，跳过 Neo4j 三元组删除")
-            except Exception as e:
-                logger.warning(f"删除 Neo4j 三元组失败: {str(e)}")
-            
-            logger.info(f"文档 {doc_id} 删除完成！")
-            logger.warning(f"注意：KG索引删除为近似删除，如需完全清理，建议调用 clear_neo4j_data() 后重新导入")
-                
+            with self._ingest_lock:
+                self._delete_kg_doc(doc_id)
         except Exception as e:
             logger.error(f"删除KG文档 {doc_id} 失败(索引ID: {KG_RAG_INDEX_ID}): {str(e)}", exc_info=True)
-            raise RuntimeError(f"删除KG文档失败: {str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"删除KG文档失败: {str(e)}")
+
+    def _delete_kg_doc(self, doc_id: str) -> None:
+        logger.info(f"开始删除KG文档(索引ID: {KG_RAG_INDEX_ID}): {doc_id}")
+
+        # 安全检查：确保kg_index已初始化
+        if self.kg_index is None:
+            logger.warning(f"KG索引未初始化，尝试加载固定索引 {KG_RAG_INDEX_ID} 后再删除")
+            self._load_kg_index_on_startup()
+            if not self.kg_index:
+                raise RuntimeError("KG索引加载失败，无法删除文档")
+
+        # ========== 关键修复1：先找到原始文档关联的所有节点ID ==========
+        docstore = self.storage_context.docstore
+        ref_doc_info = docstore.get_ref_doc_info(doc_id)
+        node_ids_to_delete = set(ref_doc_info.node_ids) if ref_doc_info else set()
+        # 在锁内读取来源：之后不会再有本文档的三元组写入
+        sources = self.provenance_index.get_sources(doc_id)
+
+        # ========== 关键修复2：从KG索引结构中移除这些节点的关键词映射 ==========
+        if node_ids_to_delete:
+            index_struct = self.kg_index.index_struct
+            if sources:
+                # 关键词即三元组的主体/客体，只需处理本文档涉及的关键词
+                keywords = {keyword for s in sources for keyword in (s.subj, s.obj)}
+            else:
+                # 没有来源记录（来源索引引入前摄入的文档）时只能扫描整张关键词表
+                keywords = set(index_struct.table)
+            for keyword in keywords:
+                keyword_node_ids = index_struct.table.get(keyword)
+                if keyword_node_ids is None:
+                    continue
+                remaining_node_ids = set(keyword_node_ids) - node_ids_to_delete
+                if remaining_node_ids:
+                    index_struct.table[keyword] = remaining_node_ids
+                else:
+                    del index_struct.table[keyword]
+            self.storage_context.index_store.add_index_struct(index_struct)
+
+        # ========== 关键修复3：删除 docstore 中的文档、节点及 metadata ==========
+        docstore.delete_ref_doc(doc_id, raise_error=False)
+        self.catalog.remove(doc_id)
+        logger.info(f"已从 docstore 删除文档 {doc_id} 及其 {len(node_ids_to_delete)} 个节点")
+
+        # ========== 关键修复4：持久化（WAL模式下只追加本次删除的日志） ==========
+        self.storage_context.persist(persist_dir=get_local_kg_data_path())
+        logger.info(f"已持久化 storage_context")
+
+        # ========== 按来源索引精确删除 Neo4j 中该文档的三元组 ==========
+        # 只移除本文档的引用；关系/实体仍被其他文档引用时保留
+        if sources:
+            self.graph_store.delete_doc_triplets(doc_id, sources)
+        else:
+            logger.info(f"文档 {doc_id} 没有记录三元组来源，Neo4j无需清理")
+        self.provenance_index.remove_doc(doc_id)
+        self.provenance_index.persist()
+
+        self.hash_index.remove_doc(KG_NAMESPACE, doc_id)
+        self.hash_index.persist()
+        self.answer_cache.invalidate(KG_CORPUS_MODES, f"删除KG文档 {doc_id}")
+        logger.info(f"文档 {doc_id} 删除完成！")
\ No newline at end of file
@@ -3,6 +3,8 @@ from typing import Any, Literal
 from llama_index.core.schema import Document
 from pydantic import BaseModel, Field
 
+from backend_app.api.ingest.ingest_hash_index import IngestDedupStats
+
 
 class IngestedDoc(BaseModel):
     object: Literal["ingest.document","ingest.kg_document"]
@@ -30,3 +32,41 @@ class IngestedDoc(BaseModel):
             doc_id=document.doc_id,
             doc_metadata=IngestedDoc.curate_metadata(document.metadata),
         )
+
+
+class IngestJobStage(BaseModel):
+    """后台摄入任务中单个阶段的进度与吞吐"""
+    name: Literal["upload", "parse", "vector", "kg"]
+    status: Literal["pending", "running", "completed", "failed", "skipped"] = "pending"
+    started_at: float | None = None
+    finished_at: float | None = None
+    elapsed_seconds: float | None = None
+    chunks: int = Field(default=0, description="本阶段处理的块数量")
+    chunks_per_sec: float | None = None
+    triplets: int = Field(default=0, description="kg阶段提取的三元组数量")
+    triplets_per_sec: float | None = None
+    error: str | None = None
+
+
+class IngestJob(BaseModel):
+    object: Literal["ingest.job"] = "ingest.job"
+    job_id: str = Field(examples=["5b2f1c3e9a7d4e0f8c6b1a2d3e4f5a6b"])
+    file_name: str
+    file_size: int = 0
+    status: Literal["queued", "running", "completed", "failed"] = "queued"
+    queue_position: int | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    bytes_per_sec: float | None = None
+    stages: list[IngestJobStage]
+    # 已可检索的索引：向量索引嵌入完成即就绪，知识图谱在后台继续构建
+    ready_indexes: list[Literal["vector", "kg"]] = Field(default_factory=list)
+    data: list[IngestedDoc] = Field(default_factory=list)
+    data_kg: list[IngestedDoc] = Field(default_factory=list)
+    # 去重节省的工作量，按管线区分：vector / kg
+    dedup: dict[str, IngestDedupStats] = Field(default_factory=dict)
+    error: str | None = None
+
+    def stage(self, name: str) -> IngestJobStage:
+        return next(stage for stage in self.stages if stage.name == name)
@@ -3,7 +3,7 @@ from backend_app.api.LLM.context_filter import ContextFilter
 from typing import Literal
 from llama_index.core.llms import ChatResponse, CompletionResponse
 from backend_app.api.llm_api.chunks.chunks_service import Chunk
-from collections.abc import Iterator
+from collections.abc import AsyncIterator, Callable, Iterator
 import time
 import uuid
 
@@ -16,6 +16,11 @@ class OpenAIMessage(BaseModel):
     role: Literal["assistant", "system", "user"] = Field(default="user")
     content: str | None
 
+class OpenAIUsage(BaseModel):
+    """本次请求各次生成调用累计的提示词token数（按模型分词器计数）"""
+
+    prompt_tokens: int
+
 class OpenAIChoice(BaseModel):
 
     finish_reason: str | None = Field(examples=["stop"])
@@ -31,6 +36,8 @@ class ChatBody(BaseModel):
     context_filter: ContextFilter | None = None
     include_sources: bool = True
     stream: bool = False
+    # 混合RAG模式，不传则使用配置 rag.hybrid.mode
+    hybrid_mode: Literal["fusion", "single_pass"] | None = None
 
     model_config = {
         "json_schema_extra": {
@@ -68,6 +75,7 @@ class OpenAICompletion(BaseModel):
     created: int = Field(..., examples=[1623340000])
     model: Literal["private-gpt"]
     choices: list[OpenAIChoice]
+    usage: OpenAIUsage | None = None
 
     @classmethod
     def from_text(
@@ -97,6 +105,7 @@ class OpenAICompletion(BaseModel):
         text: str | None,
         finish_reason: str | None = None,
         sources: list[Chunk] | None = None,
+        usage: OpenAIUsage | None = None,
     ) -> str:
         chunk = OpenAICompletion(
             id=str(uuid.uuid4()),
@@ -110,6 +119,7 @@ class OpenAICompletion(BaseModel):
                     sources=sources,
                 )
             ],
+            usage=usage,
         )
 
         return chunk.model_dump_json()
@@ -124,4 +134,20 @@ def to_openai_sse_stream(
         else:
             yield f"data: {OpenAICompletion.json_from_delta(text=response, sources=sources)}\n\n"
     yield f"data: {OpenAICompletion.json_from_delta(text='', finish_reason='stop')}\n\n"
-    yield "data: [DONE]\n\n"
\ No newline at end of file
+    yield "data: [DONE]\n\n"
+
+
+async def ato_openai_sse_stream(
+    response_generator: AsyncIterator[str],
+    sources: list[Chunk] | None = None,
+    prompt_tokens: Callable[[], int] | None = None,
+) -> AsyncIterator[str]:
+    """
+    to_openai_sse_stream的异步版本，供异步聊天接口直接交给StreamingResponse；
+    提示词token数在生成结束后才完整，随最后一个（finish_reason=stop）分块返回
+    """
+    async for response in response_generator:
+        yield f"data: {OpenAICompletion.json_from_delta(text=response, sources=sources)}\n\n"
+    usage = OpenAIUsage(prompt_tokens=prompt_tokens()) if prompt_tokens is not None else None
+    yield f"data: {OpenAICompletion.json_from_delta(text='', finish_reason='stop', usage=usage)}\n\n"
+    yield "data: [DONE]\n\n"
@@ -12,6 +12,9 @@ class Neo4jSettings(BaseModel):
     clear_existing_data: bool = Field(default=True, description="是否清空Neo4j历史数据",env="NEO4J_CLEAR_EXISTING_DATA")
     max_triplets_per_chunk: int = Field(default=3, description="每个文档块提取的最大三元组数量",env="NEO4J_MAX_TRIPLETS")
     include_embeddings: bool = Field(default=True, description="是否启用嵌入混合检索",env="NEO4J_INCLUDE_EMBEDDINGS")
+    triplet_extract_max_inflight: int = Field(default=4, description="三元组提取时同时发往Ollama的最大请求数",env="NEO4J_TRIPLET_MAX_INFLIGHT")
+    triplet_cache: bool = Field(default=True, description="是否持久化缓存三元组提取结果，重建图谱时直接重放",env="NEO4J_TRIPLET_CACHE")
+    query_timeout_seconds: float = Field(default=30.0, description="对话路径KG检索的Neo4j事务超时（秒），超时由服务端终止查询，0表示不限制",env="NEO4J_QUERY_TIMEOUT")
 
 class EmbeddingSettings(BaseModel): 
     mode:  Literal[
@@ -24,6 +27,17 @@ class EmbeddingSettings(BaseModel):
         "simple",
     ]
     embed_dim: int
+    count_workers: int = Field(default=2, description="批量摄入时解析文件/切分节点的进程数")
+    bulk_embed_batch_size: int = Field(default=256, description="批量摄入时跨文件合并嵌入与写入Qdrant的节点批大小")
+    query_cache_size: int = Field(default=1024, description="查询嵌入LRU缓存条目数，0表示关闭")
+
+class LlmSchedulerSettings(BaseModel):
+    enabled: bool = Field(default=True, description="是否在Ollama前启用请求调度（优先级+并发上限+过载拒绝）")
+    max_inflight: int = Field(default=4, description="同时发往Ollama的生成请求上限（建议与OLLAMA_NUM_PARALLEL一致）")
+    interactive_max_inflight: int = Field(default=4, description="对话类请求（对话、混合融合、KG查询合成）的在途上限")
+    background_max_inflight: int = Field(default=2, description="后台请求（摄入时三元组提取）的在途上限")
+    interactive_latency_budget_seconds: float = Field(default=15.0, description="对话请求预计排队时间超过该值（秒）时返回429")
+    coalesce_identical: bool = Field(default=True, description="相同问题/过滤条件/模型参数的并发RAG请求合并为一次生成，其余请求订阅同一token流")
 
 class LlmSettings(BaseModel):
     mode: Literal[
@@ -35,6 +49,27 @@ class LlmSettings(BaseModel):
         "llama3.2:13b",
         "llama3.2:70b",
     ]
+    scheduler: LlmSchedulerSettings = LlmSchedulerSettings()
+
+class OllamaResidencySettings(BaseModel):
+    warmup_on_startup: bool = Field(default=True, description="启动时在后台预加载模型到Ollama内存，首个请求不再承担加载耗时")
+    resident_hours: str | None = Field(default=None, description="模型常驻时段（本地时间，如 08:00-20:00），时段内定期续期keep_alive；为空时不续期")
+    resident_weekdays: list[int] = Field(default=[0, 1, 2, 3, 4], description="常驻时段生效的星期（0为周一）")
+    renew_interval_seconds: int = Field(default=120, description="常驻时段内续期间隔（秒），应小于keep_alive时长")
+    provision_retry_seconds: int = Field(default=30, description="连接或拉取模型失败后再次尝试的间隔（秒）")
+
+class OllamaEndpointSettings(BaseModel):
+    url: str = Field(description="Ollama服务地址，如 http://10.0.0.2:11434")
+    weight: float = Field(default=1.0, description="容量权重，一般与该实例的OLLAMA_NUM_PARALLEL或GPU算力成比例")
+
+class OllamaPoolSettings(BaseModel):
+    health_check_interval_seconds: float = Field(default=10.0, description="主动健康检查间隔（秒）")
+    health_check_timeout_seconds: float = Field(default=2.0, description="单次健康检查超时（秒）")
+    eject_after_failures: int = Field(default=3, description="请求连续失败该次数后摘除该实例")
+    eject_seconds: float = Field(default=30.0, description="首次摘除时长（秒），再次摘除时翻倍")
+    max_eject_seconds: float = Field(default=300.0, description="摘除时长上限（秒）")
+    sticky: bool = Field(default=True, description="同一会话优先路由到同一实例，复用其服务端提示词缓存")
+    sticky_max_imbalance: float = Field(default=2.0, description="粘性实例每单位权重的在途请求数比最空闲实例多出该值时改走最空闲实例")
 
 class OllamaSettings(BaseModel):
     llm_model: Literal[
@@ -67,6 +102,10 @@ class OllamaSettings(BaseModel):
     temperature: float
     context_window: int
     keep_alive: Literal["0s", "5m", "30m", "1h", "none", "load"] = "5m"   
+    tokenizer: str | None = Field(default=None, description="与llm_model一致的HF分词器名称或本地目录，用于提示词token预算；为空时用tiktoken近似计数")
+    residency: OllamaResidencySettings = OllamaResidencySettings()
+    endpoints: list[OllamaEndpointSettings] = Field(default=[], description="多实例Ollama地址及容量权重；为空时只使用api_base")
+    pool: OllamaPoolSettings = OllamaPoolSettings()
 
 class VectorStoreSettings(BaseModel):
     database: Literal[
@@ -80,6 +119,11 @@ class NodeStoreSettings(BaseModel):
     database: Literal[
         "simple",
     ]
+    persist_mode: Literal["snapshot", "wal"] = Field(
+        default="wal",
+        description="snapshot: 每次persist全量重写json；wal: 追加写日志+组提交+后台压缩",
+    )
+    wal_compaction_mb: int = Field(default=64, description="WAL日志超过该大小(MB)后触发后台压缩")
 
 class DataSettings(BaseModel):
     local_data_folder: str
@@ -89,11 +133,52 @@ class rerankSettings(BaseModel):
     enabled:  bool
     model: str
     top_n: int
+    max_batch_size: int = Field(default=32, description="一次交叉编码器打分合并的(问题, 段落)对上限")
+    max_batch_wait_ms: int = Field(default=5, description="收集并发请求凑批的最长等待时间（毫秒）")
+    score_cache_size: int = Field(default=10000, description="按(问题, 段落哈希)缓存的重排序分数条数，0表示不缓存")
+
+class LexicalSearchSettings(BaseModel):
+    enabled: bool = Field(default=True, description="是否启用本地BM25词法索引，与向量检索结果按倒数排名融合")
+    similarity_top_k: int = Field(default=5, description="词法检索参与融合的候选数")
+    rrf_k: int = Field(default=60, description="倒数排名融合常数k：score = Σ 1/(k + rank)")
+    k1: float = Field(default=1.2, description="BM25词频饱和参数")
+    b: float = Field(default=0.75, description="BM25文档长度归一化参数")
+    max_candidate_postings: int = Field(default=20000, description="查询时按文档频率从低到高展开倒排表生成候选的记录上限，其余高频词只给候选加分")
+    max_segments: int = Field(default=8, description="倒排段数量上限，超出后合并")
+
+class IngestSettings(BaseModel):
+    max_concurrent_jobs: int = Field(default=1, description="同时执行的后台摄入任务数")
+    max_queued_jobs: int = Field(default=100, description="排队中的摄入任务上限，超出后拒绝新任务")
+    job_ttl_seconds: int = Field(default=3600, description="已结束任务的状态保留时间（秒）")
+
+class HybridRAGSettings(BaseModel):
+    mode: Literal["fusion", "single_pass"] = Field(
+        default="fusion",
+        description="默认混合RAG模式：fusion（向量回答+KG回答+融合，三次生成）/ single_pass（只检索，一次生成），可按请求覆盖",
+    )
+    kg_max_workers: int = Field(default=4, description="KG分支专用线程池大小；超时的KG查询仍会占用线程直到结束，与语义缓存/向量检索所用的默认线程池隔离")
+    vector_timeout_seconds: float = Field(default=120.0, description="向量RAG分支超时（秒），超时后仅用KG结果融合")
+    kg_timeout_seconds: float = Field(default=30.0, description="KG-RAG分支超时（秒），超时或Neo4j不可用时仅用向量结果融合")
+
+class ContextBudgetSettings(BaseModel):
+    history_ratio: float = Field(default=0.3, description="历史消息最多占用的提示词预算比例（扣除系统提示和问题后），超出时从最早的消息丢弃")
+    kg_ratio: float = Field(default=0.35, description="检索内容预算中KG上下文最多占用的比例，用不完的留给文档片段")
+    system_prompt_max_tokens: int = Field(default=256, description="系统提示的token上限，超出部分截断")
 
 class RAGSettings(BaseModel):
     similarity_top_k: int
     similarity_value: float | None = None
     rerank: rerankSettings
+    hybrid: HybridRAGSettings = HybridRAGSettings()
+    lexical: LexicalSearchSettings = LexicalSearchSettings()
+    context_budget: ContextBudgetSettings = ContextBudgetSettings()
+
+class SemanticCacheSettings(BaseModel):
+    enabled: bool = Field(default=True, description="是否启用语义回答缓存（向量/KG/混合RAG回答）")
+    backend: Literal["redis", "local"] = Field(default="redis", description="缓存条目的持久化后端：redis / local（本地WAL文件）")
+    similarity_threshold: float = Field(default=0.92, description="问题嵌入的余弦相似度不低于该值即视为命中")
+    ttl_seconds: int = Field(default=3600, description="缓存条目有效期（秒）")
+    max_entries: int = Field(default=10000, description="缓存条目上限，超出后淘汰最早的条目")
 
 class Settings(BaseModel):
     embedding: EmbeddingSettings
@@ -104,7 +189,9 @@ class Settings(BaseModel):
     qdrant: QdrantSettings | None = None
     nodestore: NodeStoreSettings
     data: DataSettings
+    ingest: IngestSettings = IngestSettings()
     rag: RAGSettings
+    semantic_cache: SemanticCacheSettings = SemanticCacheSettings()
 
 
 unsafe_settings = load_active_settings()
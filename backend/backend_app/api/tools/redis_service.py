@@ -187,6 +187,46 @@ class RedisService:
         except RedisError as e:
             raise RedisError(f"检查键存在性失败 (key={key}): {str(e)}") from e
 
+    def hset(self, name: str, key: str, value: Any) -> bool:
+        """
+        设置哈希表中的字段
+        :param name: 哈希表键
+        :param key: 字段名
+        :param value: 字段值（自动序列化）
+        :return: 成功返回 True
+        """
+        try:
+            client = self._get_client()
+            client.hset(name, key, self._serialize_value(value))
+            return True
+        except RedisError as e:
+            raise RedisError(f"设置哈希字段失败 (name={name}, key={key}): {str(e)}") from e
+
+    def hgetall(self, name: str) -> Dict[str, Any]:
+        """
+        获取哈希表的全部字段
+        :param name: 哈希表键
+        :return: 字段名 -> 反序列化后的值
+        """
+        try:
+            client = self._get_client()
+            return {k: self._deserialize_value(v) for k, v in client.hgetall(name).items()}
+        except RedisError as e:
+            raise RedisError(f"获取哈希表失败 (name={name}): {str(e)}") from e
+
+    def hdel(self, name: str, *keys: str) -> int:
+        """
+        删除哈希表中的字段
+        :param name: 哈希表键
+        :param keys: 字段名列表
+        :return: 成功删除的字段数量
+        """
+        try:
+            client = self._get_client()
+            return client.hdel(name, *keys)
+        except RedisError as e:
+            raise RedisError(f"删除哈希字段失败 (name={name}, keys={keys}): {str(e)}") from e
+
     def _serialize_value(self, value: Any) -> str | int | float | bool:
         """
         序列化值为 Redis 可存储的类型
@@ -8,6 +8,8 @@ from llama_index.llms.ollama import Ollama
 # from llama_index.llms.openai import OpenAI
 from backend_app.api.api_router import api_router
 from backend_app.di import global_injector
+from backend_app.api.LLM.llm_component import LLMComponent
+from backend_app.api.LLM.model_provisioner import resolve_keep_alive
 from backend_app.api.tools.common import get_local_embedding_model_path, is_model_dir_valid
 import os
 import sys
@@ -50,14 +52,20 @@ async def lifespan(app: FastAPI):
         Settings.llm = Ollama(
             base_url=settings.OLLAMA_API_HOST,
             model=settings_yaml().ollama.llm_model,
-            request_timeout=settings_yaml().ollama.request_timeout
+            request_timeout=settings_yaml().ollama.request_timeout,
+            keep_alive=resolve_keep_alive(settings_yaml().ollama.keep_alive),
         )
         
     # elif settings.OPENAI_API_KEY:
     #     Settings.llm = OpenAI(model="gpt-4o")
 
+    # 启动时即构造LLM组件：后台开始连接检查、拉取与预热模型，不阻塞启动
+    llm_component = global_injector.get(LLMComponent)
+
     yield
     # 在这里添加关闭代码
+    llm_component.provisioner.stop()
+    llm_component.pool.stop()
     print("应用关闭中...")
 
 app = FastAPI(
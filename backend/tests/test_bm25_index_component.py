@@ -0,0 +1,148 @@
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from backend_app.api.LLM import bm25_index_component
+from backend_app.api.LLM.bm25_index_component import DOCS_LOG_FNAME, BM25IndexComponent
+
+
+def _node(node_id: str, text: str, ref_doc_id: str = "doc") -> TextNode:
+    node = TextNode(id_=node_id, text=text)
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=ref_doc_id)
+    return node
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25_index_component, "get_local_data_path", lambda: tmp_path)
+    return tmp_path
+
+
+def _crash_after(monkeypatch, logged_records: int) -> None:
+    """模拟写段后、文档表只追加了前 logged_records 条记录时进程退出"""
+    original = BM25IndexComponent._append_log
+
+    def append_then_crash(self, records):
+        original(self, records[:logged_records])
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(BM25IndexComponent, "_append_log", append_then_crash)
+
+
+def _ids(index: BM25IndexComponent, query: str) -> list[str]:
+    return [node_id for node_id, _ in index.search(query, top_k=10)]
+
+
+def test_orphan_segment_is_dropped_and_doc_numbers_are_not_reused(data_dir, monkeypatch):
+    index = BM25IndexComponent()
+    index.add_nodes([_node("a", "苹果手机")])
+
+    with monkeypatch.context() as m:
+        _crash_after(m, logged_records=0)
+        with pytest.raises(KeyboardInterrupt):
+            index.add_nodes([_node("orphan", "香蕉牛奶")])
+
+    reloaded = BM25IndexComponent()
+    assert len(reloaded._segments) == 1
+    reloaded.add_nodes([_node("b", "西瓜汁")])
+
+    assert _ids(reloaded, "香蕉牛奶") == []
+    assert _ids(reloaded, "西瓜汁") == ["b"]
+    assert _ids(reloaded, "苹果手机") == ["a"]
+
+
+def test_partially_logged_segment_is_clipped(data_dir, monkeypatch):
+    index = BM25IndexComponent()
+    with monkeypatch.context() as m:
+        _crash_after(m, logged_records=1)
+        with pytest.raises(KeyboardInterrupt):
+            index.add_nodes([_node("kept", "红茶拿铁"), _node("lost", "抹茶蛋糕")])
+
+    reloaded = BM25IndexComponent()
+    assert [(s.doc_start, s.doc_end) for s in reloaded._segments] == [(0, 1)]
+    reloaded.add_nodes([_node("next", "乌龙奶盖")])
+
+    assert _ids(reloaded, "红茶拿铁") == ["kept"]
+    assert _ids(reloaded, "抹茶蛋糕") == []
+    assert _ids(reloaded, "乌龙奶盖") == ["next"]
+    # 截断后的段替换原段，再次加载结果不变
+    assert _ids(BM25IndexComponent(), "乌龙奶盖") == ["next"]
+
+
+def test_truncated_log_tail_is_discarded(data_dir):
+    index = BM25IndexComponent()
+    index.add_nodes([_node("a", "苹果手机")])
+    with open(data_dir / "bm25" / DOCS_LOG_FNAME, "a", encoding="utf-8") as f:
+        f.write('{"add": ["half", "do')
+
+    reloaded = BM25IndexComponent()
+    reloaded.add_nodes([_node("b", "西瓜汁")])
+
+    again = BM25IndexComponent()
+    assert _ids(again, "苹果手机") == ["a"]
+    assert _ids(again, "西瓜汁") == ["b"]
+
+
+def _compacting_index(monkeypatch) -> BM25IndexComponent:
+    """两批各一个段并删除 old；之后超过一个段即合并，再追加一批时小段总量追上最大段，全量合并"""
+    index = BM25IndexComponent()
+    index.add_nodes([_node("old", "过期公告", "old-doc")])
+    index.add_nodes([_node("a", "苹果手机", "doc-a")])
+    index.remove_ref_doc("old-doc")
+    monkeypatch.setattr(index._settings, "max_segments", 1)
+    return index
+
+
+def _log_records(data_dir) -> list[str]:
+    return (data_dir / "bm25" / DOCS_LOG_FNAME).read_text(encoding="utf-8").splitlines()
+
+
+def test_full_merge_drops_deleted_docs_from_the_doc_table(data_dir, monkeypatch):
+    index = _compacting_index(monkeypatch)
+    index.add_nodes([_node("b", "西瓜汁", "doc-b")])
+
+    assert index._node_ids == ["a", "b"]
+    assert len(index._segments) == 1
+    assert len(_log_records(data_dir)) == 2
+    assert _ids(index, "苹果手机") == ["a"] and _ids(index, "过期公告") == []
+
+    reloaded = BM25IndexComponent()
+    reloaded.add_nodes([_node("c", "乌龙奶盖", "doc-c")])
+    reloaded.remove_ref_doc("doc-a")
+    assert reloaded._node_ids == ["a", "b", "c"]
+    assert _ids(reloaded, "西瓜汁") == ["b"]
+    assert _ids(reloaded, "乌龙奶盖") == ["c"]
+    assert _ids(reloaded, "苹果手机") == []
+
+
+def _interrupt_compaction(monkeypatch, segment_written: bool) -> None:
+    """模拟全量合并中途退出：新文档表已写、合并段未写 / 合并段已写、文档表未改名"""
+    if not segment_written:
+        def interrupt(fd):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(bm25_index_component.os, "fsync", interrupt)
+        return
+    original = bm25_index_component.os.replace
+
+    def replace_segment_only(src, dst):
+        if str(src).startswith(str(dst)) and str(dst).endswith(DOCS_LOG_FNAME):
+            raise KeyboardInterrupt
+        original(src, dst)
+
+    monkeypatch.setattr(bm25_index_component.os, "replace", replace_segment_only)
+
+
+@pytest.mark.parametrize(("segment_written", "doc_table"), [(False, ["old", "a", "b"]), (True, ["a", "b"])])
+def test_interrupted_full_merge_is_recovered(data_dir, monkeypatch, segment_written, doc_table):
+    index = _compacting_index(monkeypatch)
+    with monkeypatch.context() as m:
+        _interrupt_compaction(m, segment_written)
+        with pytest.raises(KeyboardInterrupt):
+            index.add_nodes([_node("b", "西瓜汁", "doc-b")])
+
+    reloaded = BM25IndexComponent()
+    assert reloaded._node_ids == doc_table
+    assert not list((data_dir / "bm25").glob(f"{DOCS_LOG_FNAME}.*"))
+    assert _ids(reloaded, "苹果手机") == ["a"]
+    assert _ids(reloaded, "西瓜汁") == ["b"]
+    assert _ids(reloaded, "过期公告") == []
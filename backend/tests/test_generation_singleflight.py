@@ -0,0 +1,100 @@
+import asyncio
+import gc
+
+from backend_app.api.llm_api.chat.generation_singleflight import GenerationSingleflight
+
+
+def _start(flights: GenerationSingleflight, fingerprint: str, retrieved: asyncio.Event):
+    """leader加入并启动生成：检索阶段等待 retrieved，之后逐个输出token直到被取消"""
+    flight, is_leader = flights.join(fingerprint)
+    assert is_leader
+
+    async def tokens():
+        while True:
+            yield "token"
+            await asyncio.sleep(0.01)
+
+    async def generate():
+        await retrieved.wait()
+        return tokens(), []
+
+    flights.start(flight, generate)
+    return flight
+
+
+async def _settled(task: asyncio.Task) -> None:
+    # 回归时生成不会被取消，限时等待以免测试挂起
+    await asyncio.wait([task], timeout=5)
+
+
+async def _request(flight):
+    """与 ChatService._acoalesced_chat 相同：等待来源失败或被取消时退出"""
+    try:
+        sources = await flight.wait_sources()
+    except BaseException:
+        flight.leave()
+        raise
+    return sources, flight.subscribe()
+
+
+def test_cancelled_while_waiting_for_sources_stops_generation():
+    async def scenario():
+        flights = GenerationSingleflight()
+        flight = _start(flights, "fp", asyncio.Event())
+        follower, is_leader = flights.join("fp")
+        assert follower is flight and not is_leader
+
+        waiting = [asyncio.create_task(_request(flight)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        await _settled(flight.task)
+
+        assert flight.subscribers == 0
+        assert flight.abandoned and flight.task.cancelled()
+        assert flights.stats().inflight == 0
+
+    asyncio.run(scenario())
+
+
+def test_one_request_leaving_keeps_generation_for_the_others():
+    async def scenario():
+        flights = GenerationSingleflight()
+        retrieved = asyncio.Event()
+        flight = _start(flights, "fp", retrieved)
+        flights.join("fp")
+
+        leaving = asyncio.create_task(_request(flight))
+        staying = asyncio.create_task(_request(flight))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        retrieved.set()
+        _, tokens = await staying
+
+        assert await anext(tokens) == "token"
+        assert flight.subscribers == 1 and not flight.task.done()
+        await tokens.aclose()
+        await _settled(flight.task)
+        assert flight.task.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_subscription_dropped_before_iteration_stops_generation():
+    async def scenario():
+        flights = GenerationSingleflight()
+        retrieved = asyncio.Event()
+        retrieved.set()
+        flight = _start(flights, "fp", retrieved)
+
+        _, tokens = await _request(flight)
+        # 响应从未开始迭代就被丢弃（如发送响应前客户端已断开）
+        del tokens
+        gc.collect()
+        await _settled(flight.task)
+
+        assert flight.subscribers == 0
+        assert flight.task.cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from backend_app.api.LLM.model_provisioner import ModelProvisioner, _HostProvision, keep_alive_seconds
+
+
+class _LoadOnlyClient:
+    def generate(self, **kwargs) -> None:
+        pass
+
+
+@pytest.mark.parametrize(
+    ("keep_alive", "seconds"),
+    [(None, 300.0), (-1, None), ("-1m", None), ("0s", 0.0), ("5m", 300.0), ("1h30m", 5400.0), ("90", 90.0)],
+)
+def test_keep_alive_seconds(keep_alive, seconds):
+    assert keep_alive_seconds(keep_alive) == seconds
+
+
+def _loaded_host(keep_alive: str | int | None) -> tuple[ModelProvisioner, _HostProvision]:
+    provisioner = ModelProvisioner(pool=None)
+    provisioner._model = "llama3.2:3b"
+    provisioner._keep_alive = keep_alive
+    provisioner._keep_alive_seconds = keep_alive_seconds(keep_alive)
+    host = _HostProvision("http://ollama:11434", _LoadOnlyClient())
+    provisioner._hosts = [host]
+    provisioner._load(host, "预热")
+    return provisioner, host
+
+
+def test_warm_expires_after_keep_alive():
+    provisioner, host = _loaded_host("5m")
+    assert provisioner.status().warm and provisioner.status().hosts[0].warm
+
+    # 超过keep_alive后Ollama已卸载模型，不再报告为已预热
+    host.last_loaded_at = time.time() - 301
+    status = provisioner.status()
+    assert not status.warm and not status.hosts[0].warm
+
+    provisioner._load(host, "续期")
+    assert provisioner.status().warm
+
+
+def test_load_keep_alive_stays_warm():
+    provisioner, host = _loaded_host(-1)
+    host.last_loaded_at = time.time() - 86400
+
+    assert provisioner.status().warm
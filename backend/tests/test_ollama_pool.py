@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.ollama import Ollama
+
+from backend_app.api.LLM.ollama_pool import (
+    OllamaPool,
+    PooledOllama,
+    conversation_route_key,
+    ollama_route_key,
+)
+from backend_app.api.settings.settings import OllamaEndpointSettings, settings
+
+MODEL = "llama3.2:3b"
+MESSAGES = [ChatMessage(role="user", content="q")]
+
+
+class _OllamaStubHandler(BaseHTTPRequestHandler):
+    """最小的Ollama API：/api/chat 的回答内容是该实例的标签，便于断言请求落在哪个实例"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/api/version":
+            return self._json({"version": "stub"})
+        self._json({}, 404)
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        if self.path == "/api/show":
+            return self._json({"model_info": {"general.architecture": "llama", "llama.context_length": 2048}})
+        if self.path != "/api/chat":
+            return self._json({}, 404)
+        if server.fail:
+            return self._json({"error": "stub failure"}, 500)
+        time.sleep(server.delay)
+        if not body.get("stream"):
+            return self._json({
+                "model": MODEL,
+                "message": {"role": "assistant", "content": server.tag},
+                "done": True,
+            })
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for content, done in (("hi ", False), (server.tag, False), ("", True)):
+            line = {"model": MODEL, "message": {"role": "assistant", "content": content}, "done": done}
+            self.wfile.write((json.dumps(line) + "\n").encode())
+            self.wfile.flush()
+
+
+def _serve(tag: str, port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), _OllamaStubHandler)
+    server.tag = tag
+    server.delay = 0.0
+    server.fail = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _stop(server: ThreadingHTTPServer) -> None:
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+@pytest.fixture
+def servers():
+    started: dict[str, ThreadingHTTPServer] = {}
+
+    def start(tag: str, port: int = 0) -> ThreadingHTTPServer:
+        started[tag] = _serve(tag, port)
+        return started[tag]
+
+    yield start
+    for server in started.values():
+        _stop(server)
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    """按 [(地址, 权重)] 构造实例池（模型视为已就绪，不启动后台线程）与包装后的LLM"""
+    ollama_settings = settings().ollama
+    monkeypatch.setattr(ollama_settings.pool, "eject_after_failures", 2)
+    monkeypatch.setattr(ollama_settings.pool, "eject_seconds", 0.5)
+    monkeypatch.setattr(ollama_settings.pool, "sticky_max_imbalance", 1.0)
+
+    def make(endpoints: list[tuple[str, float]]) -> tuple[OllamaPool, PooledOllama]:
+        monkeypatch.setattr(
+            ollama_settings,
+            "endpoints",
+            [OllamaEndpointSettings(url=url, weight=weight) for url, weight in endpoints],
+        )
+        pool = OllamaPool()
+        for host in pool.hosts:
+            pool.mark_provisioned(host.name)
+        llms = {host.name: Ollama(model=MODEL, base_url=host.url, request_timeout=5) for host in pool.hosts}
+        return pool, PooledOllama(pool, llms)
+
+    return make
+
+
+@pytest.fixture(autouse=True)
+def _no_route_key():
+    token = ollama_route_key.set(None)
+    yield
+    ollama_route_key.reset(token)
+
+
+def _answers(llm: PooledOllama, count: int) -> list[str]:
+    return [llm.chat(MESSAGES).message.content for _ in range(count)]
+
+
+def test_requests_are_split_by_weight(servers, make_pool):
+    a, b = servers("A"), servers("B")
+    pool, llm = make_pool([(_url(a), 2), (_url(b), 1)])
+
+    answers = _answers(llm, 30)
+
+    assert answers.count("A") == 20
+    assert answers.count("B") == 10
+
+
+def test_conversation_sticks_to_one_host_until_it_is_overloaded(servers, make_pool):
+    a, b = servers("A"), servers("B")
+    pool, llm = make_pool([(_url(a), 1), (_url(b), 1)])
+    ollama_route_key.set(conversation_route_key("", "conversation"))
+
+    assert len(set(_answers(llm, 10))) == 1
+    assert pool.stats().sticky_routes == 10
+
+    # 同一会话的并发请求压在一个实例上时溢出到最空闲实例
+    a.delay = b.delay = 0.3
+    answers: list[str] = []
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(lambda: answers.append(llm.chat(MESSAGES).message.content),),
+        )
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.stats().sticky_overflows > 0
+    assert set(answers) == {"A", "B"}
+
+
+def test_connect_failure_retries_on_another_host_before_the_first_chunk(servers, make_pool):
+    a, down = servers("A"), servers("down")
+    # 权重更大的实例先被选中，但它已停止监听
+    pool, llm = make_pool([(_url(down), 10), (_url(a), 1)])
+    _stop(down)
+
+    streamed = "".join(response.delta for response in llm.stream_chat(MESSAGES))
+
+    async def astreamed() -> str:
+        return "".join([response.delta async for response in await llm.astream_chat(MESSAGES)])
+
+    assert streamed == "hi A"
+    assert asyncio.run(astreamed()) == "hi A"
+    assert llm.chat(MESSAGES).message.content == "A"
+    down_host = pool.host(_url(down))
+    assert down_host.failures >= 2 and down_host.outstanding == 0
+    assert pool.host(_url(a)).outstanding == 0
+
+
+def test_failing_host_is_ejected_and_recovers(servers, make_pool):
+    a, b = servers("A"), servers("B")
+    pool, llm = make_pool([(_url(a), 1), (_url(b), 1)])
+    host_a = pool.host(_url(a))
+
+    # 5xx不重试，但计入失败；连续失败达到阈值后摘除
+    a.fail = True
+    for _ in range(10):
+        if not host_a.available(time.monotonic()):
+            break
+        try:
+            llm.chat(MESSAGES)
+        except Exception:
+            pass
+    assert not host_a.available(time.monotonic())
+    assert _answers(llm, 4) == ["B"] * 4
+
+    a.fail = False
+    time.sleep(0.6)
+    assert "A" in _answers(llm, 4)
+
+    # 主动健康检查：实例停止后暂停路由，重新启动后恢复
+    port = b.server_port
+    _stop(b)
+    host_b = pool.host(_url(b))
+    assert not pool.check_health(host_b)
+    assert _answers(llm, 4) == ["A"] * 4
+    servers("B", port)
+    assert pool.check_health(host_b)
+    assert "B" in _answers(llm, 4)
+
+
+def test_copies_create_their_own_clients(servers, make_pool):
+    a = servers("A")
+    pool, llm = make_pool([(_url(a), 1)])
+    original = llm.llms[_url(a)]
+    # 原实例的客户端已创建（如对话请求已在服务的事件循环上使用过）
+    assert asyncio.run(llm.achat(MESSAGES)).message.content == "A"
+    assert original.client is not None and original.async_client is not None
+
+    copied = llm.model_copy().llms[_url(a)]
+
+    assert copied is not original
+    assert copied.async_client is not original.async_client
+    assert copied.client is not original.client
+    assert asyncio.run(llm.model_copy().achat(MESSAGES)).message.content == "A"